@@ -1,7 +1,8 @@
 from fastapi import APIRouter
-from app.api.endpoints import documents, chat
+from app.api.endpoints import documents, chat, notebooks
 
 api_router = APIRouter()
 api_router.include_router(documents.router, prefix="/documents", tags=["documents"])
 api_router.include_router(chat.router, prefix="/chat", tags=["chat"])
+api_router.include_router(notebooks.router, prefix="/notebooks", tags=["notebooks"])
 
@@ -0,0 +1,23 @@
+from typing import TYPE_CHECKING, Iterator
+from fastapi import Request
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.notebook_service import NotebookManager, DEFAULT_NOTEBOOK_ID
+
+if TYPE_CHECKING:
+    from app.services.chat_service import ChatService
+
+
+def get_notebook_manager(request: Request) -> NotebookManager:
+    """获取进程级共享的 NotebookManager (在 main.py 的 lifespan 中创建)"""
+    return request.app.state.notebooks
+
+
+def get_chat_service(request: Request, notebook_id: str = DEFAULT_NOTEBOOK_ID) -> Iterator["ChatService"]:
+    """按查询参数 notebook_id 获取对应笔记本的 ChatService，请求处理期间保持固定"""
+    with request.app.state.notebooks.use(notebook_id) as chat_service:
+        yield chat_service
+
+
+def get_job_manager(request: Request) -> IngestionJobManager:
+    """获取后台入库任务管理器"""
+    return request.app.state.job_manager
@@ -1,52 +1,172 @@
-from fastapi import APIRouter, HTTPException
+from typing import TYPE_CHECKING, AsyncIterator
+import anyio
+from fastapi import APIRouter, Depends, HTTPException, Response
 from fastapi.responses import StreamingResponse
+from starlette.concurrency import run_in_threadpool
+from starlette.types import Receive, Scope, Send
 import json
-from app.services.chat_service import ChatService
-from app.api.schemas import ChatRequest, ChatResponse, SourceDocument
+from app.services.session_store import SessionNotFoundError
+from app.services.errors import LLMQueueTimeoutError
+from app.services.notebook_service import NotebookManager
+from app.services.metrics import start_trace, format_server_timing
+from app.core.config import settings
+from app.api.deps import get_chat_service, get_notebook_manager
+from app.api.schemas import ChatRequest, BatchChatRequest, ChatResponse, SourceDocument, SessionResponse
+
+if TYPE_CHECKING:
+    from app.services.chat_service import ChatService
 
 router = APIRouter()
-chat_service = ChatService()
+
+
+class _PinnedStreamingResponse(StreamingResponse):
+    """NDJSON 流式响应，发送结束后释放固定的笔记本
+
+    在 __call__ 中释放而不是在生成器的 finally 中：客户端在开始迭代前断开、
+    或发送失败时生成器不会运行，笔记本也要释放。
+    """
+
+    def __init__(self, content: AsyncIterator[str], notebooks: NotebookManager, notebook_id: str):
+        super().__init__(content, media_type="application/x-ndjson")
+        self.notebooks = notebooks
+        self.notebook_id = notebook_id
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            # 请求被取消时也要等释放完成
+            with anyio.CancelScope(shield=True):
+                await run_in_threadpool(self.notebooks.release, self.notebook_id)
 
 @router.post("/query", response_model=ChatResponse)
-async def chat(request: ChatRequest):
+async def chat(request: ChatRequest, response: Response,
+               notebooks: NotebookManager = Depends(get_notebook_manager)):
+    # 加载笔记本或关闭被淘汰的笔记本可能较慢，在线程池中进行，不阻塞事件循环
+    chat_service = await run_in_threadpool(notebooks.acquire, request.notebook_id)
+    trace = start_trace()
     try:
-        response = chat_service.chat(request.question, chat_history=request.history)
+        result = await chat_service.achat(
+            request.question, chat_history=request.history, session_id=request.session_id
+        )
         
         sources = []
-        for doc in response["source_documents"]:
-            sources.append(SourceDocument(
-                source=doc.metadata.get("source", "unknown"),
-                page=doc.metadata.get("page", None),
-                content=doc.page_content
-            ))
+        for doc in result["source_documents"]:
+            sources.append(SourceDocument(**_serialize_source(doc)))
             
+        if settings.METRICS_STAGE_HEADER and trace:
+            response.headers["Server-Timing"] = format_server_timing(trace)
         return ChatResponse(
-            answer=response["answer"],
-            sources=sources
+            answer=result["answer"],
+            sources=sources,
+            timings=_timings_ms(trace) if request.include_timings else None
         )
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    except LLMQueueTimeoutError as e:
+        # LLM 并发已满且排队超时，客户端可稍后重试
+        raise HTTPException(status_code=503, detail=str(e))
     except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        await run_in_threadpool(notebooks.release, request.notebook_id)
 
 @router.post("/stream")
-async def chat_stream(request: ChatRequest):
-    def generate():
+async def chat_stream(request: ChatRequest, notebooks: NotebookManager = Depends(get_notebook_manager)):
+    # 笔记本在整个流式响应期间保持固定，响应发送结束后释放
+    chat_service = await run_in_threadpool(notebooks.acquire, request.notebook_id)
+    
+    # 流开始后无法再返回 404，先校验会话
+    if request.session_id is not None:
+        try:
+            chat_service.sessions.get(request.session_id)
+        except SessionNotFoundError:
+            await run_in_threadpool(notebooks.release, request.notebook_id)
+            raise HTTPException(status_code=404, detail="Session not found")
+
+    async def generate():
+        trace = start_trace()
         try:
-            for chunk in chat_service.chat_stream(request.question, chat_history=request.history):
+            async for chunk in chat_service.achat_stream(
+                request.question, chat_history=request.history, session_id=request.session_id
+            ):
                 if chunk["type"] == "source":
-                    # Serialize source documents
-                    sources_data = []
-                    for doc in chunk["content"]:
-                        sources_data.append({
-                            "source": doc.metadata.get("source", "unknown"),
-                            "page": doc.metadata.get("page", None),
-                            "content": doc.page_content
-                        })
-                    yield json.dumps({"type": "source", "content": sources_data}, ensure_ascii=False) + "\n"
+                    yield json.dumps({"type": "source", "content": _serialize_sources(chunk["content"])}, ensure_ascii=False) + "\n"
                 else:
                     # Yield answer chunk
                     yield json.dumps(chunk, ensure_ascii=False) + "\n"
         except Exception as e:
             yield json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False) + "\n"
+        
+        # 流式响应无法在开始后设置响应头，阶段耗时作为最后一行输出
+        if request.include_timings:
+            yield json.dumps({"type": "timings", "content": _timings_ms(trace)}) + "\n"
+
+    return _PinnedStreamingResponse(generate(), notebooks, request.notebook_id)
+
+
+@router.post("/batch")
+async def chat_batch(request: BatchChatRequest, notebooks: NotebookManager = Depends(get_notebook_manager)):
+    """批量问答：每个问题完成后输出一行 NDJSON，按完成顺序，index 为问题在请求中的下标"""
+    if len(request.questions) > settings.BATCH_MAX_QUESTIONS:
+        raise HTTPException(
+            status_code=400,
+            detail=f"Too many questions: {len(request.questions)} > {settings.BATCH_MAX_QUESTIONS}"
+        )
+    chat_service = await run_in_threadpool(notebooks.acquire, request.notebook_id)
+    max_concurrency = request.max_concurrency or settings.BATCH_MAX_CONCURRENCY
+
+    async def generate():
+        try:
+            async for item in chat_service.achat_batch(request.questions, max_concurrency=max_concurrency):
+                if item["type"] == "result":
+                    item = {**item, "sources": _serialize_sources(item["sources"])}
+                yield json.dumps(item, ensure_ascii=False) + "\n"
+        except Exception as e:
+            yield json.dumps({"type": "error", "content": str(e)}, ensure_ascii=False) + "\n"
+
+    return _PinnedStreamingResponse(generate(), notebooks, request.notebook_id)
+
 
-    return StreamingResponse(generate(), media_type="application/x-ndjson")
+def _serialize_source(doc) -> dict:
+    return {
+        "source": doc.metadata.get("source", "unknown"),
+        "page": doc.metadata.get("page", None),
+        "content": doc.page_content,
+        "section": doc.metadata.get("section"),
+        "start_index": doc.metadata.get("start_index"),
+        "end_index": doc.metadata.get("end_index")
+    }
 
+def _serialize_sources(docs) -> list:
+    return [_serialize_source(doc) for doc in docs]
+
+def _timings_ms(trace: dict) -> dict:
+    return {stage: round(seconds * 1000, 1) for stage, seconds in trace.items()}
+
+@router.get("/cache/stats")
+async def answer_cache_stats(chat_service: "ChatService" = Depends(get_chat_service)):
+    if chat_service.answer_cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **chat_service.answer_cache.stats()}
+
+@router.post("/sessions", response_model=SessionResponse)
+async def create_session(chat_service: "ChatService" = Depends(get_chat_service)):
+    session = chat_service.sessions.create()
+    return SessionResponse(session_id=session["id"])
+
+@router.get("/sessions/{session_id}", response_model=SessionResponse)
+async def get_session(session_id: str, chat_service: "ChatService" = Depends(get_chat_service)):
+    try:
+        session = chat_service.sessions.get(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return SessionResponse(session_id=session["id"], turns=session["turns"], summary=session["summary"])
+
+@router.delete("/sessions/{session_id}")
+async def delete_session(session_id: str, chat_service: "ChatService" = Depends(get_chat_service)):
+    try:
+        chat_service.sessions.delete(session_id)
+    except SessionNotFoundError:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"status": "deleted"}
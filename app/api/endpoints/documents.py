@@ -1,40 +1,126 @@
 import os
 import shutil
-from fastapi import APIRouter, UploadFile, File, HTTPException
-from typing import List
-from app.core.config import settings
-from app.services.chat_service import ChatService
-from app.api.schemas import DocumentResponse
+import tempfile
+from fastapi import APIRouter, Depends, UploadFile, File, HTTPException
+from fastapi.responses import FileResponse
+from starlette.background import BackgroundTask
+from starlette.concurrency import run_in_threadpool
+from typing import List, TYPE_CHECKING
+from app.services.ingestion_jobs import IngestionJobManager, JobQueueFullError
+from app.services.notebook_service import NotebookManager, DEFAULT_NOTEBOOK_ID
+from app.api.deps import get_chat_service, get_job_manager, get_notebook_manager
+from app.api.schemas import IngestionJobResponse
+
+if TYPE_CHECKING:
+    from app.services.chat_service import ChatService
 
 router = APIRouter()
-chat_service = ChatService() # 注意：这里每次请求可能会重新实例化，生产环境应该用 Depends 注入单例
 
-@router.post("/upload", response_model=List[DocumentResponse])
-async def upload_documents(files: List[UploadFile] = File(...)):
-    results = []
+def _save_uploads(files: List[UploadFile], names: List[str], upload_dir: str) -> List[str]:
+    """先全部写入临时文件，成功后再替换到目标路径；失败时不留下写了一半的文件"""
     temp_paths = []
-    
     try:
-        # 1. 保存文件
         for file in files:
-            file_path = os.path.join(settings.UPLOAD_DIR, file.filename)
-            with open(file_path, "wb") as buffer:
+            fd, temp_path = tempfile.mkstemp(dir=upload_dir, prefix=".upload-")
+            temp_paths.append(temp_path)
+            with os.fdopen(fd, "wb") as buffer:
                 shutil.copyfileobj(file.file, buffer)
-            temp_paths.append(file_path)
-            
-        # 2. 处理文件
-        # 注意：这里简化处理，直接调用 service。如果是大文件，应该用 BackgroundTasks
-        chat_service.process_and_index_files(temp_paths)
-        
-        for path in temp_paths:
-            results.append(DocumentResponse(
-                filename=os.path.basename(path),
-                status="processed",
-                chunks=0 # service 没返回单个文件的 chunk 数，这里简化
-            ))
-            
-        return results
-        
+    except BaseException:
+        for temp_path in temp_paths:
+            os.remove(temp_path)
+        raise
+    paths = [os.path.join(upload_dir, name) for name in names]
+    for temp_path, path in zip(temp_paths, paths):
+        os.replace(temp_path, path)
+    return paths
+
+@router.post("/upload", response_model=IngestionJobResponse, status_code=202)
+async def upload_documents(
+    files: List[UploadFile] = File(...),
+    notebook_id: str = DEFAULT_NOTEBOOK_ID,
+    job_manager: IngestionJobManager = Depends(get_job_manager),
+    notebooks: NotebookManager = Depends(get_notebook_manager)
+):
+    # 只取文件名部分，同一请求中的同名文件会互相覆盖，直接拒绝
+    names = [os.path.basename(file.filename or "") for file in files]
+    if not all(names):
+        raise HTTPException(status_code=400, detail="Every uploaded file needs a filename")
+    duplicates = sorted({name for name in names if names.count(name) > 1})
+    if duplicates:
+        raise HTTPException(status_code=400, detail=f"Duplicate filenames in one upload: {', '.join(duplicates)}")
+    upload_dir = notebooks.upload_directory(notebook_id)
+    
+    # 1. 先预留排队名额，队列已满时不保存任何文件
+    try:
+        job_manager.reserve()
+    except JobQueueFullError as e:
+        raise HTTPException(status_code=503, detail=str(e))
+    
+    # 2. 在线程池中保存文件，不阻塞事件循环
+    try:
+        file_paths = await run_in_threadpool(_save_uploads, files, names, upload_dir)
     except Exception as e:
+        job_manager.release()
         raise HTTPException(status_code=500, detail=str(e))
+    
+    # 3. 提交后台任务，解析与索引由任务队列异步完成，通过 /jobs/{job_id} 查询进度
+    job = job_manager.submit(file_paths, notebook_id, reserved=True)
+    return IngestionJobResponse(**job.to_dict())
+
+@router.get("/jobs/{job_id}", response_model=IngestionJobResponse)
+async def get_job(job_id: str, job_manager: IngestionJobManager = Depends(get_job_manager)):
+    job = job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return IngestionJobResponse(**job.to_dict())
+
+@router.delete("")
+async def clear_documents(
+    notebook_id: str = DEFAULT_NOTEBOOK_ID,
+    notebooks: NotebookManager = Depends(get_notebook_manager)
+):
+    """清空指定笔记本的知识库，不影响其他笔记本"""
+    await run_in_threadpool(notebooks.clear, notebook_id)
+    return {"status": "cleared", "notebook_id": notebook_id}
+
+@router.get("/snapshot")
+def export_snapshot(chat_service: "ChatService" = Depends(get_chat_service)):
+    """下载笔记本的索引快照 (tar.gz)，新副本导入后即可检索，不需要重新向量化"""
+    fd, path = tempfile.mkstemp(suffix=".tar.gz")
+    os.close(fd)
+    try:
+        chat_service.vector_store.export_snapshot(path)
+    except Exception:
+        os.remove(path)
+        raise
+    return FileResponse(
+        path, media_type="application/gzip", filename="index_snapshot.tar.gz",
+        background=BackgroundTask(os.remove, path)
+    )
+
+@router.post("/snapshot")
+def import_snapshot(
+    file: UploadFile = File(...),
+    chat_service: "ChatService" = Depends(get_chat_service)
+):
+    """用上传的快照替换笔记本的索引"""
+    # 快照模块依赖 numpy，只在导入/导出时加载，不拖慢服务启动
+    from app.services.index_snapshot import SnapshotError
+    
+    fd, path = tempfile.mkstemp(suffix=".tar.gz")
+    try:
+        with os.fdopen(fd, "wb") as buffer:
+            shutil.copyfileobj(file.file, buffer)
+        header = chat_service.vector_store.import_snapshot(path)
+    except SnapshotError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    finally:
+        os.remove(path)
+    return {"status": "imported", "chunks": header["count"], "index_version": header.get("index_version")}
 
+@router.get("/embedding-cache/stats")
+async def embedding_cache_stats(chat_service: "ChatService" = Depends(get_chat_service)):
+    cache = chat_service.vector_store.embedding_cache
+    if cache is None:
+        return {"enabled": False}
+    return {"enabled": True, **cache.stats()}
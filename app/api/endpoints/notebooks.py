@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException
+from starlette.concurrency import run_in_threadpool
+from typing import List
+from app.services.notebook_service import NotebookManager, NotebookBusyError
+from app.api.deps import get_notebook_manager
+from app.api.schemas import NotebookCreateRequest, NotebookResponse
+
+router = APIRouter()
+
+@router.post("", response_model=NotebookResponse)
+async def create_notebook(
+    request: NotebookCreateRequest,
+    notebooks: NotebookManager = Depends(get_notebook_manager)
+):
+    return NotebookResponse(**notebooks.create(request.name))
+
+@router.get("", response_model=List[NotebookResponse])
+async def list_notebooks(notebooks: NotebookManager = Depends(get_notebook_manager)):
+    return [NotebookResponse(**notebook) for notebook in notebooks.list()]
+
+@router.delete("/{notebook_id}")
+async def delete_notebook(notebook_id: str, notebooks: NotebookManager = Depends(get_notebook_manager)):
+    try:
+        await run_in_threadpool(notebooks.delete, notebook_id)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except NotebookBusyError as e:
+        raise HTTPException(status_code=409, detail=str(e))
+    return {"status": "deleted"}
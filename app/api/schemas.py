@@ -1,21 +1,62 @@
-from pydantic import BaseModel
-from typing import List, Optional
+from pydantic import BaseModel, Field
+from typing import List, Dict, Optional
+from app.core.config import settings
 
 class ChatRequest(BaseModel):
     question: str
     history: Optional[List[dict]] = None
+    # 使用服务端会话时传入，history 将被忽略
+    session_id: Optional[str] = None
+    notebook_id: str = "default"
+    # 为 true 时在响应中附带各阶段耗时 (毫秒)
+    include_timings: bool = False
+
+class BatchChatRequest(BaseModel):
+    questions: List[str]
+    notebook_id: str = "default"
+    # 同时进行的生成数，1 到配置的 batch.max_concurrency 之间，超出范围返回 422
+    max_concurrency: Optional[int] = Field(None, ge=1, le=settings.BATCH_MAX_CONCURRENCY)
+
+class SessionResponse(BaseModel):
+    session_id: str
+    turns: List[dict] = []
+    summary: str = ""
 
 class SourceDocument(BaseModel):
     source: str
     page: Optional[int] = None
     content: str
+    # splitter 为 token 时可用：章节标题路径与在所属页面/文档中的字符偏移
+    section: Optional[str] = None
+    start_index: Optional[int] = None
+    end_index: Optional[int] = None
 
 class ChatResponse(BaseModel):
     answer: str
     sources: List[SourceDocument]
+    timings: Optional[Dict[str, float]] = None
     
 class DocumentResponse(BaseModel):
     filename: str
     status: str
     chunks: int
+    error: Optional[str] = None
+
+class IngestionJobResponse(BaseModel):
+    job_id: str
+    notebook_id: str
+    status: str
+    files: List[DocumentResponse]
+    total_chunks: int = 0
+    elapsed_seconds: float = 0.0
+    chunks_per_second: float = 0.0
+    error: Optional[str] = None
+
+
+class NotebookCreateRequest(BaseModel):
+    name: str
 
+class NotebookResponse(BaseModel):
+    id: str
+    name: str
+    created_at: float
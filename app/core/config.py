@@ -16,22 +16,115 @@ class Config:
         self.GEMINI_MODEL = self.config.get("gemini", {}).get("model", "gemini-2.5-flash")
         self.GEMINI_TEMPERATURE = self.config.get("gemini", {}).get("temperature", 0.3)
         self.GEMINI_MAX_TOKENS = self.config.get("gemini", {}).get("max_tokens", 2000)
+        self.EMBEDDING_MODEL = self.config.get("gemini", {}).get("embedding_model", "models/embedding-001")
+        
+        # LLM 网关配置
+        self.LLM_MAX_CONCURRENCY = self.config.get("llm_gateway", {}).get("max_concurrency", 32)
+        self.LLM_QUEUE_TIMEOUT = self.config.get("llm_gateway", {}).get("queue_timeout_seconds", 30.0)
+        self.LLM_COALESCE = self.config.get("llm_gateway", {}).get("coalesce", True)
+        self.LLM_MAX_RETRIES = self.config.get("llm_gateway", {}).get("max_retries", 3)
+        self.LLM_BACKOFF_BASE = self.config.get("llm_gateway", {}).get("backoff_base", 0.5)
+        self.LLM_BACKOFF_MAX = self.config.get("llm_gateway", {}).get("backoff_max", 8.0)
+        self.LLM_HEDGE_DELAY = self.config.get("llm_gateway", {}).get("hedge_delay_seconds", 0.0)
+        
+        # Embedding 批处理配置
+        self.EMBEDDING_BATCH_SIZE = self.config.get("embedding", {}).get("batch_size", 64)
+        self.EMBEDDING_MAX_IN_FLIGHT = self.config.get("embedding", {}).get("max_in_flight", 4)
+        self.EMBEDDING_REQUESTS_PER_SECOND = self.config.get("embedding", {}).get("requests_per_second", 0)
+        self.EMBEDDING_MAX_RETRIES = self.config.get("embedding", {}).get("max_retries", 5)
+        self.EMBEDDING_BACKOFF_BASE = self.config.get("embedding", {}).get("backoff_base", 1.0)
+        
+        # Embedding 缓存配置
+        self.EMBEDDING_CACHE_ENABLED = self.config.get("embedding_cache", {}).get("enabled", True)
+        self.EMBEDDING_CACHE_PATH = self.config.get("embedding_cache", {}).get("path", "./data/embedding_cache.sqlite")
+        self.EMBEDDING_CACHE_MAX_ENTRIES = self.config.get("embedding_cache", {}).get("max_entries", 200000)
         
         # 向量存储配置
         self.VECTOR_STORE_TYPE = self.config.get("vector_store", {}).get("type", "chroma")
         self.VECTOR_DB_DIR = self.config.get("vector_store", {}).get("persist_directory", "./data/vector_db")
         self.COLLECTION_NAME = self.config.get("vector_store", {}).get("collection_name", "gemini_doc_agent")
+        self.MAX_LOADED_NOTEBOOKS = self.config.get("vector_store", {}).get("max_loaded_notebooks", 8)
         self.SEARCH_TOP_K = self.config.get("vector_store", {}).get("search_top_k", 10)
+        self.NUMPY_QUANTIZATION = self.config.get("vector_store", {}).get("numpy", {}).get("quantization", "float32")
+        self.NUMPY_IVF_LISTS = self.config.get("vector_store", {}).get("numpy", {}).get("ivf_lists", 0)
+        self.NUMPY_IVF_NPROBE = self.config.get("vector_store", {}).get("numpy", {}).get("ivf_nprobe", 8)
+        self.RETRIEVAL_MODE = self.config.get("vector_store", {}).get("retrieval_mode", "hybrid")
+        self.HYBRID_FETCH_K = self.config.get("vector_store", {}).get("hybrid_fetch_k", 30)
+        self.PERSIST_INTERVAL_SECONDS = self.config.get("vector_store", {}).get("persist_interval_seconds", 5)
+        self.BOOTSTRAP_SNAPSHOT = self.config.get("vector_store", {}).get("bootstrap_snapshot", "")
+        
+        # 问题改写配置
+        self.REWRITE_SKIP_SELF_CONTAINED = self.config.get("rewrite", {}).get("skip_self_contained", True)
+        self.REWRITE_CACHE_SIZE = self.config.get("rewrite", {}).get("cache_size", 512)
+        self.REWRITE_PARALLEL_RETRIEVAL = self.config.get("rewrite", {}).get("parallel_retrieval", True)
+        
+        # 语义答案缓存配置
+        self.ANSWER_CACHE_ENABLED = self.config.get("answer_cache", {}).get("enabled", True)
+        self.ANSWER_CACHE_THRESHOLD = self.config.get("answer_cache", {}).get("similarity_threshold", 0.95)
+        self.ANSWER_CACHE_MAX_ENTRIES = self.config.get("answer_cache", {}).get("max_entries", 1000)
+        
+        # 会话配置
+        self.SESSION_BACKEND = self.config.get("sessions", {}).get("backend", "memory")
+        self.SESSION_SQLITE_PATH = self.config.get("sessions", {}).get("sqlite_path", "./data/sessions.sqlite")
+        self.SESSION_TTL_SECONDS = self.config.get("sessions", {}).get("ttl_seconds", 86400)
+        self.SESSION_MAX_SESSIONS = self.config.get("sessions", {}).get("max_sessions", 10000)
+        self.SESSION_HISTORY_TOKENS = self.config.get("sessions", {}).get("history_tokens", 2000)
+        
+        # 上下文装配配置
+        self.CONTEXT_PACKING_ENABLED = self.config.get("context", {}).get("enabled", True)
+        self.CONTEXT_MAX_TOKENS = self.config.get("context", {}).get("max_tokens", 6000)
+        self.CONTEXT_RERANK = self.config.get("context", {}).get("rerank", False)
         
         # 文档处理配置
         self.CHUNK_SIZE = self.config.get("document", {}).get("chunk_size", 1000)
         self.CHUNK_OVERLAP = self.config.get("document", {}).get("chunk_overlap", 200)
+        self.SPLITTER = self.config.get("document", {}).get("splitter", "recursive")
+        self.TOKEN_CHUNK_SIZE = self.config.get("document", {}).get("token_sizes", {}).get("chunk_size", 250)
+        self.TOKEN_CHUNK_OVERLAP = self.config.get("document", {}).get("token_sizes", {}).get("chunk_overlap", 50)
+        self.TOKEN_PARENT_CHUNK_SIZE = self.config.get("document", {}).get("token_sizes", {}).get("parent_chunk_size", 500)
+        self.TOKEN_CHILD_CHUNK_SIZE = self.config.get("document", {}).get("token_sizes", {}).get("child_chunk_size", 100)
+        self.TOKEN_CHILD_CHUNK_OVERLAP = self.config.get("document", {}).get("token_sizes", {}).get("child_chunk_overlap", 20)
+        self.PARSE_WORKERS = self.config.get("document", {}).get("parse_workers") or os.cpu_count() or 1
+        self.PARALLEL_PARSE_MIN_MB = self.config.get("document", {}).get("parallel_parse_min_mb", 2)
+        self.STREAM_THRESHOLD_MB = self.config.get("document", {}).get("stream_threshold_mb", 5)
+        self.STREAM_BATCH_SIZE = self.config.get("document", {}).get("stream_batch_size", 256)
+        self.PARENT_RETRIEVAL_ENABLED = self.config.get("document", {}).get("parent_retrieval", {}).get("enabled", False)
+        self.PARENT_CHUNK_SIZE = self.config.get("document", {}).get("parent_retrieval", {}).get("parent_chunk_size", 2000)
+        self.CHILD_CHUNK_SIZE = self.config.get("document", {}).get("parent_retrieval", {}).get("child_chunk_size", 400)
+        self.CHILD_CHUNK_OVERLAP = self.config.get("document", {}).get("parent_retrieval", {}).get("child_chunk_overlap", 80)
         self.SUPPORTED_FORMATS = self.config.get("document", {}).get("supported_formats", [".pdf", ".txt", ".docx", ".md"])
         
+        # 并发配置
+        self.INGEST_WORKERS = self.config.get("concurrency", {}).get("ingest_workers", 4)
+        self.JOB_WORKERS = self.config.get("concurrency", {}).get("job_workers", 2)
+        self.MAX_PENDING_JOBS = self.config.get("concurrency", {}).get("max_pending_jobs", 16)
+        self.MAX_FINISHED_JOBS = self.config.get("concurrency", {}).get("max_finished_jobs", 100)
+        
+        # 批量问答配置
+        self.BATCH_MAX_CONCURRENCY = self.config.get("batch", {}).get("max_concurrency", 16)
+        self.BATCH_RETRIEVAL_SIZE = self.config.get("batch", {}).get("retrieval_batch_size", 64)
+        self.BATCH_MAX_QUESTIONS = self.config.get("batch", {}).get("max_questions", 1000)
+        
+        # 目录监听配置
+        self.WATCH_ENABLED = self.config.get("watch", {}).get("enabled", False)
+        self.WATCH_DIRECTORIES = self.config.get("watch", {}).get("directories") or []
+        self.WATCH_NOTEBOOK_ID = self.config.get("watch", {}).get("notebook_id", "default")
+        self.WATCH_DEBOUNCE_SECONDS = self.config.get("watch", {}).get("debounce_seconds", 2.0)
+        self.WATCH_BATCH_SIZE = self.config.get("watch", {}).get("batch_size", 16)
+        self.WATCH_BATCH_INTERVAL = self.config.get("watch", {}).get("batch_interval_seconds", 1.0)
+        self.WATCH_PARSE_WORKERS = self.config.get("watch", {}).get("parse_workers", 1)
+        self.WATCH_RETRY_ATTEMPTS = self.config.get("watch", {}).get("retry_attempts", 5)
+        self.WATCH_RETRY_BACKOFF = self.config.get("watch", {}).get("retry_backoff_seconds", 5.0)
+        
+        # 监控配置
+        self.METRICS_ENABLED = self.config.get("metrics", {}).get("enabled", True)
+        self.METRICS_STAGE_HEADER = self.config.get("metrics", {}).get("stage_header", True)
+        
         # 路径配置
         self.UPLOAD_DIR = self.config.get("paths", {}).get("upload_dir", "./data/uploads")
-        
-        # 确保目录存在
+
+    def ensure_directories(self):
+        """创建数据目录；由服务启动时调用，导入配置模块本身没有副作用"""
         os.makedirs(self.VECTOR_DB_DIR, exist_ok=True)
         os.makedirs(self.UPLOAD_DIR, exist_ok=True)
 
@@ -0,0 +1,103 @@
+import threading
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+import numpy as np
+from langchain_core.documents import Document
+
+
+class SemanticAnswerCache:
+    """语义答案缓存
+
+    以问题的 embedding 为键，余弦相似度超过阈值即视为命中。缓存绑定索引版本，
+    版本变化 (新增文档、清空知识库) 时自动整体失效；基于旧版本索引生成的答案
+    (生成期间索引有更新) 不再写入。只应缓存无历史记录的问题。
+    """
+
+    def __init__(self, max_entries: int = 1000, threshold: float = 0.95):
+        self.max_entries = max_entries
+        self.threshold = threshold
+        self.hits = 0
+        self.misses = 0
+        
+        self._lock = threading.Lock()
+        self._version = None
+        self._next_id = 0
+        self._entries: "OrderedDict[int, Dict[str, Any]]" = OrderedDict()
+        self._matrix: Optional[np.ndarray] = None
+        self._matrix_ids: List[int] = []
+
+    def _check_version(self, version: int) -> bool:
+        """版本更新时清空缓存；version 比当前版本旧时返回 False"""
+        if self._version is not None and version < self._version:
+            return False
+        if version != self._version:
+            self._entries.clear()
+            self._matrix = None
+            self._version = version
+        return True
+
+    @staticmethod
+    def _normalize(embedding: List[float]) -> np.ndarray:
+        vector = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def lookup(self, embedding: List[float], version: int) -> Optional[Dict[str, Any]]:
+        """返回最相似且超过阈值的缓存条目 {"question", "answer", "source_documents"}"""
+        query = self._normalize(embedding)
+        with self._lock:
+            if not self._check_version(version) or not self._entries:
+                self.misses += 1
+                return None
+            
+            if self._matrix is None:
+                self._matrix_ids = list(self._entries.keys())
+                self._matrix = np.stack([self._entries[i]["vector"] for i in self._matrix_ids])
+            
+            scores = self._matrix @ query
+            best = int(np.argmax(scores))
+            if scores[best] < self.threshold:
+                self.misses += 1
+                return None
+            
+            entry_id = self._matrix_ids[best]
+            self._entries.move_to_end(entry_id)
+            self.hits += 1
+            entry = self._entries[entry_id]
+            return {
+                "question": entry["question"],
+                "answer": entry["answer"],
+                "source_documents": entry["source_documents"]
+            }
+
+    def store(self, embedding: List[float], version: int, question: str, answer: str,
+              source_documents: List[Document]):
+        with self._lock:
+            if not self._check_version(version):
+                return
+            self._entries[self._next_id] = {
+                "vector": self._normalize(embedding),
+                "question": question,
+                "answer": answer,
+                "source_documents": source_documents
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._matrix = None
+
+    def invalidate(self):
+        with self._lock:
+            self._entries.clear()
+            self._matrix = None
+
+    def stats(self) -> Dict[str, Any]:
+        total = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": round(self.hits / total, 4) if total else None,
+            "entries": len(self._entries),
+            "max_entries": self.max_entries,
+            "threshold": self.threshold
+        }
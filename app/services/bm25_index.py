@@ -0,0 +1,135 @@
+import heapq
+import json
+import math
+import os
+import re
+import threading
+from collections import Counter
+from typing import List, Dict, Tuple
+
+# 英文/数字按词切分 (保留 E1234、error-code、v1.2 这类标识符)，中日韩文字按单字+双字切分
+_WORD_RE = re.compile(r"[a-z0-9_]+(?:[-.][a-z0-9_]+)*")
+_CJK_RE = re.compile(r"[぀-ヿ㐀-䶿一-鿿가-힯]+")
+
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    tokens = _WORD_RE.findall(text)
+    for run in _CJK_RE.findall(text):
+        tokens.extend(run)
+        tokens.extend(run[i:i + 2] for i in range(len(run) - 1))
+    return tokens
+
+
+class BM25Index:
+    """进程内 BM25 倒排索引，支持按 chunk ID 增量增删
+
+    只保存词频倒排表与文档长度 (JSON)，不保存 chunk 正文：检索返回 chunk ID 与分数，
+    正文和元数据由调用方从向量库读取。加载时直接恢复倒排表，不需要重新分词。
+    """
+
+    def __init__(self, path: str, k1: float = 1.5, b: float = 0.75):
+        self.path = path
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.Lock()
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._doc_lengths: Dict[str, int] = {}
+        # 每个 chunk 包含的词，删除时只需访问这些词的倒排表
+        self._doc_terms: Dict[str, List[str]] = {}
+        self._total_length = 0
+        self._load()
+
+    def __len__(self) -> int:
+        return len(self._doc_lengths)
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                data = json.load(f)
+        except (OSError, ValueError) as e:
+            print(f"Failed to load BM25 index {self.path}: {e}")
+            return
+        # 旧格式 ({"docs": ...}) 不加载，数量与向量库不一致时 VectorStoreService 会重建
+        self._postings = data.get("postings", {})
+        self._doc_lengths = data.get("doc_lengths", {})
+        self._total_length = sum(self._doc_lengths.values())
+        for term, postings in self._postings.items():
+            for chunk_id in postings:
+                self._doc_terms.setdefault(chunk_id, []).append(term)
+
+    def _add_one(self, chunk_id: str, text: str):
+        if chunk_id in self._doc_lengths:
+            self._remove_one(chunk_id)
+        term_freqs = Counter(tokenize(text))
+        for term, freq in term_freqs.items():
+            self._postings.setdefault(term, {})[chunk_id] = freq
+        self._doc_terms[chunk_id] = list(term_freqs)
+        length = sum(term_freqs.values())
+        self._doc_lengths[chunk_id] = length
+        self._total_length += length
+
+    def _remove_one(self, chunk_id: str):
+        if chunk_id not in self._doc_lengths:
+            return
+        for term in self._doc_terms.pop(chunk_id, []):
+            postings = self._postings.get(term)
+            if postings is not None:
+                postings.pop(chunk_id, None)
+                if not postings:
+                    del self._postings[term]
+        self._total_length -= self._doc_lengths.pop(chunk_id)
+
+    def add(self, ids: List[str], texts: List[str]):
+        with self._lock:
+            for chunk_id, text in zip(ids, texts):
+                self._add_one(chunk_id, text)
+
+    def remove(self, ids: List[str]):
+        with self._lock:
+            for chunk_id in ids:
+                self._remove_one(chunk_id)
+
+    def clear(self):
+        with self._lock:
+            self._postings = {}
+            self._doc_lengths = {}
+            self._doc_terms = {}
+            self._total_length = 0
+
+    def search(self, query: str, k: int) -> List[Tuple[str, float]]:
+        """返回 BM25 得分最高的 k 个 (chunk ID, 分数)
+
+        锁内只复制查询词的倒排表，打分在锁外进行，不阻塞写入和其他查询。
+        """
+        terms = set(tokenize(query))
+        with self._lock:
+            n_docs = len(self._doc_lengths)
+            if n_docs == 0:
+                return []
+            avg_length = self._total_length / n_docs
+            doc_lengths = self._doc_lengths
+            matched = [dict(self._postings[term]) for term in terms if term in self._postings]
+        
+        scores: Dict[str, float] = {}
+        for postings in matched:
+            idf = math.log(1 + (n_docs - len(postings) + 0.5) / (len(postings) + 0.5))
+            for chunk_id, freq in postings.items():
+                # 复制之后 chunk 可能已被删除，按平均长度计算即可
+                norm = self.k1 * (1 - self.b + self.b * doc_lengths.get(chunk_id, avg_length) / avg_length)
+                scores[chunk_id] = scores.get(chunk_id, 0.0) + idf * freq * (self.k1 + 1) / (freq + norm)
+        return heapq.nlargest(k, scores.items(), key=lambda item: item[1])
+
+    def save(self):
+        """原子写入：锁内复制倒排表，序列化与写文件在锁外进行"""
+        with self._lock:
+            postings = {term: dict(chunk_freqs) for term, chunk_freqs in self._postings.items()}
+            doc_lengths = dict(self._doc_lengths)
+        data = json.dumps({"postings": postings, "doc_lengths": doc_lengths}, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
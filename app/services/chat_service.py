@@ -1,8 +1,11 @@
 import os
-from typing import List, Dict, Any
+import time
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Dict, Any, AsyncIterator, Callable, Iterator, Optional, Tuple
 from langchain.chains.retrieval import create_retrieval_chain
 from langchain.chains.combine_documents import create_stuff_documents_chain
-from langchain.chains.history_aware_retriever import create_history_aware_retriever
 from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
 from langchain_core.messages import HumanMessage, AIMessage
 
@@ -10,58 +13,188 @@ from app.core.config import settings
 from app.services.document_processor import DocumentProcessor
 from app.services.vector_store import VectorStoreService
 from app.services.llm_service import LLMService
+from app.services.ingest_manifest import hash_file
+from app.services.context_packer import ContextPacker, PackedRetriever
+from app.services.query_rewriter import QueryRewriter
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.session_store import SessionStore, SessionNotFoundError, MemorySessionBackend, SQLiteSessionBackend
+from app.services.conversation_memory import ConversationMemory
+from app.services.metrics import timed, observe_first_token, ANSWER_CACHE_LOOKUPS
 
 class ChatService:
-    def __init__(self):
-        self.doc_processor = DocumentProcessor()
-        self.vector_store = VectorStoreService()
-        self.llm_service = LLMService()
+    def __init__(self, vector_store: VectorStoreService = None, llm_service: LLMService = None,
+                 doc_processor: DocumentProcessor = None, sessions: SessionStore = None):
+        # 各组件可由外部注入，便于多个笔记本共享 LLM 与文档处理器 (共享的由注入方负责关闭)；
+        # 会话存储由 NotebookManager 持有，ChatService 被释放后会话仍然保留
+        self._owns_doc_processor = doc_processor is None
+        self.doc_processor = doc_processor or DocumentProcessor()
+        self.vector_store = vector_store or VectorStoreService()
+        self.llm_service = llm_service or LLMService()
         self.llm = self.llm_service.get_llm()
         
+        # 检索结果后处理：合并重叠 chunk、可选重排并按 token 预算截断
+        self.context_packer = None
+        if settings.CONTEXT_PACKING_ENABLED:
+            self.context_packer = ContextPacker(
+                max_tokens=settings.CONTEXT_MAX_TOKENS,
+                rerank=settings.CONTEXT_RERANK,
+                max_overlap=settings.CHUNK_OVERLAP * 2
+            )
+        
+        # 历史感知的问题改写：自包含问题跳过改写，改写结果做 LRU 缓存
+        self.query_rewriter = QueryRewriter(
+            self.llm,
+            cache_size=settings.REWRITE_CACHE_SIZE,
+            skip_self_contained=settings.REWRITE_SKIP_SELF_CONTAINED,
+            parallel_retrieval=settings.REWRITE_PARALLEL_RETRIEVAL
+        )
+        
+        # 语义答案缓存：仅用于无历史记录的问题，索引版本变化时自动失效
+        self.answer_cache = None
+        if settings.ANSWER_CACHE_ENABLED:
+            self.answer_cache = SemanticAnswerCache(
+                max_entries=settings.ANSWER_CACHE_MAX_ENTRIES,
+                threshold=settings.ANSWER_CACHE_THRESHOLD
+            )
+        
+        # 服务端会话：历史记录保存在服务端，prompt 只带摘要和最近窗口
+        if sessions is None:
+            if settings.SESSION_BACKEND == "sqlite":
+                session_backend = SQLiteSessionBackend(settings.SESSION_SQLITE_PATH)
+            else:
+                session_backend = MemorySessionBackend(max_sessions=settings.SESSION_MAX_SESSIONS)
+            sessions = SessionStore(session_backend, ttl_seconds=settings.SESSION_TTL_SECONDS)
+        self.sessions = sessions
+        self.memory = ConversationMemory(self.llm, window_tokens=settings.SESSION_HISTORY_TOKENS)
+        # 后台生成会话摘要，同一会话同时只有一个摘要任务
+        self._summary_executor = ThreadPoolExecutor(max_workers=2, thread_name_prefix="session-summary")
+        self._summary_lock = threading.Lock()
+        self._summarizing = set()
+        
         # 初始化 Chain (惰性加载，因为 retrieval 需要 vector store 有数据)
+        # _chain_version 记录 chain 构建时的索引版本，索引变化后下次请求时重建
         self.qa_chain = None
+        self.retriever = None
+        self.document_chain = None
+        self._chain_version = None
+
+        # 有界线程池：解析文档等阻塞操作放到这里，避免阻塞事件循环
+        self._executor = ThreadPoolExecutor(
+            max_workers=settings.INGEST_WORKERS,
+            thread_name_prefix="ingest"
+        )
+
+    def index_files(self, file_paths: List[str],
+                    on_progress: Optional[Callable[[str, str, int, Optional[Exception]], None]] = None,
+                    parse_workers: Optional[int] = None) -> Dict[str, int]:
+        """并行解析多个文件并逐个写入索引
+
+        每个文件解析完成后立即写入向量库；通过 on_progress(path, stage, chunks, error)
+        汇报进度，stage 依次为 parsing / indexing / done，失败时为 failed，
+        内容未变化的文件直接标记为 skipped，不重新解析和向量化。
+        超过 stream_threshold_mb 的大文件不进入进程池，而是逐页流式解析并分批写入，
+        每写入一批都会汇报 indexing 进度。parse_workers 可限制解析进程数 (默认 PARSE_WORKERS)。
+        返回每个成功文件的 chunk 数。
+        """
+        def report(path, stage, chunks=0, error=None):
+            if on_progress:
+                on_progress(path, stage, chunks, error)
+        
+        indexed = {}
+        file_hashes = {}
+        pending = []
+        large = []
+        stream_threshold = settings.STREAM_THRESHOLD_MB * 1024 * 1024
+        for path in file_paths:
+            try:
+                file_hashes[path] = hash_file(path)
+            except OSError as e:
+                report(path, "failed", 0, e)
+                continue
+            
+            entry = self.vector_store.manifest.get(path)
+            if entry and entry["file_hash"] == file_hashes[path]:
+                indexed[path] = len(entry["chunk_ids"])
+                report(path, "skipped", indexed[path])
+                continue
+            
+            if stream_threshold and os.path.getsize(path) > stream_threshold:
+                large.append(path)
+            else:
+                pending.append(path)
+            report(path, "parsing")
+        
+        # 小文件先走进程池，尽快可检索；大文件随后流式处理
+        for path, docs, error in self.doc_processor.process_files(pending, max_workers=parse_workers):
+            if error is not None:
+                print(f"Failed to process {path}: {error}")
+                report(path, "failed", 0, error)
+                continue
+            
+            try:
+                report(path, "indexing", len(docs))
+                # 只写入新增 chunk、删除过期 chunk；索引变化会递增版本，chain 在下次对话时自动重建
+                with timed("sync_file"):
+                    added, removed = self.vector_store.sync_file(path, file_hashes[path], docs)
+                print(f"Indexed {path}: {added} added, {removed} removed, {len(docs) - added} unchanged")
+            except Exception as e:
+                print(f"Failed to index {path}: {e}")
+                report(path, "failed", len(docs), e)
+                continue
+            
+            indexed[path] = len(docs)
+            report(path, "done", len(docs))
+        
+        for path in large:
+            try:
+                with timed("sync_file"):
+                    total, added, removed = self.vector_store.sync_file_stream(
+                        path,
+                        file_hashes[path],
+                        self.doc_processor.iter_chunk_batches(path),
+                        on_batch=lambda chunks, path=path: report(path, "indexing", chunks)
+                    )
+                print(f"Indexed {path} (streamed): {added} added, {removed} removed, {total - added} unchanged")
+            except Exception as e:
+                print(f"Failed to index {path}: {e}")
+                report(path, "failed", 0, e)
+                continue
+            
+            indexed[path] = total
+            report(path, "done", total)
+        
+        return indexed
 
     def process_and_index_files(self, file_paths: List[str]):
         """处理文件并建立索引"""
-        all_docs = []
-        for path in file_paths:
-            print(f"Processing {path}...")
-            docs = self.doc_processor.process_file(path)
-            all_docs.extend(docs)
-        
-        if all_docs:
-            print(f"Indexing {len(all_docs)} chunks...")
-            self.vector_store.add_documents(all_docs)
-            # 重置 chain 以使用新的检索器
-            self._update_chain()
+        errors = []
+        
+        def on_progress(path, stage, chunks, error):
+            if stage == "failed":
+                errors.append(error)
         
-        return len(all_docs)
+        indexed = self.index_files(file_paths, on_progress=on_progress)
+        
+        # 全部失败时抛出第一个错误，部分失败时只记录日志
+        if errors and not indexed:
+            raise errors[0]
+        
+        return sum(indexed.values())
+
+    async def aprocess_and_index_files(self, file_paths: List[str]) -> int:
+        """异步处理文件并建立索引 (解析与写入在线程池中执行)"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, self.process_and_index_files, file_paths)
 
     def _update_chain(self):
         """更新 RAG Chain，增加历史记录感知能力"""
         retriever = self.vector_store.get_retriever(search_kwargs={"k": settings.SEARCH_TOP_K})
+        if self.context_packer:
+            retriever = PackedRetriever(retriever=retriever, packer=self.context_packer)
         
         # 1. 历史感知检索器 (History Aware Retriever)
-        # 负责将"整合了历史上下文的问题"重写为"独立问题"
-        contextualize_q_system_prompt = (
-            "Given a chat history and the latest user question "
-            "which might reference context in the chat history, "
-            "formulate a standalone question which can be understood "
-            "without the chat history. Do NOT answer the question, "
-            "just reformulate it if needed and otherwise return it as is."
-        )
-        
-        contextualize_q_prompt = ChatPromptTemplate.from_messages(
-            [
-                ("system", contextualize_q_system_prompt),
-                MessagesPlaceholder("chat_history"),
-                ("human", "{input}"),
-            ]
-        )
-        
-        history_aware_retriever = create_history_aware_retriever(
-            self.llm, retriever, contextualize_q_prompt
-        )
+        # 负责将"整合了历史上下文的问题"重写为"独立问题"，必要时才调用 LLM
+        history_aware_retriever = self.query_rewriter.as_retriever(retriever)
         
         # 2. 问答链 (QA Chain)
         # 负责根据检索到的文档回答问题
@@ -84,13 +217,28 @@ class ChatService:
         
         # 3. 最终的 RAG 链
         self.qa_chain = create_retrieval_chain(history_aware_retriever, document_chain)
+        # 批量问答绕过单问题的改写与检索，直接使用检索器和问答链
+        self.retriever = retriever
+        self.document_chain = document_chain
+        self._chain_version = self.vector_store.version
 
-    def chat(self, question: str, chat_history: List[Dict] = None) -> Dict[str, Any]:
-        """进行对话"""
-        if not self.qa_chain:
+    def _ensure_chain(self):
+        """索引版本变化时重建 chain，否则复用"""
+        if self.qa_chain is None or self._chain_version != self.vector_store.version:
             self._update_chain()
+
+    def warm_up(self):
+        """预先构建检索链，避免首个请求承担初始化耗时"""
+        self._ensure_chain()
+
+    def _build_chain_input(self, question: str, chat_history: List[Dict] = None,
+                           embedding: List[float] = None) -> Dict[str, Any]:
+        """构造 chain 输入，处理历史记录格式
+
+        embedding 为查答案缓存时已经算好的问题向量，检索时直接使用，不再重复计算。
+        """
+        self._ensure_chain()
             
-        # 处理历史记录格式
         langchain_history = []
         if chat_history:
             for msg in chat_history:
@@ -99,42 +247,364 @@ class ChatService:
                 elif msg["role"] == "assistant":
                     langchain_history.append(AIMessage(content=msg["content"]))
         
-        response = self.qa_chain.invoke({
+        chain_input = {
             "input": question,
             "chat_history": langchain_history
-        })
-        
-        return {
-            "answer": response["answer"],
-            "source_documents": response["context"]
         }
+        if embedding is not None:
+            chain_input["query_embedding"] = embedding
+        return chain_input
+
+    def _use_answer_cache(self, chat_history: List[Dict] = None) -> bool:
+        return self.answer_cache is not None and not chat_history
+
+    def _lookup_answer_cache(self, question: str, chat_history: List[Dict] = None):
+        """返回 (问题向量, 缓存命中的答案)；不使用缓存时均为 None"""
+        if not self._use_answer_cache(chat_history):
+            return None, None
+        with timed("answer_cache_lookup"):
+            embedding = self.vector_store.embeddings.embed_query(question)
+            cached = self.answer_cache.lookup(embedding, self.vector_store.version)
+        ANSWER_CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+        return embedding, cached
+
+    async def _alookup_answer_cache(self, question: str, chat_history: List[Dict] = None):
+        if not self._use_answer_cache(chat_history):
+            return None, None
+        with timed("answer_cache_lookup"):
+            embedding = await self.vector_store.embeddings.aembed_query(question)
+            cached = self.answer_cache.lookup(embedding, self.vector_store.version)
+        ANSWER_CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+        return embedding, cached
+
+    @staticmethod
+    def _replay_cached(cached: Dict[str, Any], chunk_size: int = 64):
+        """把缓存的答案拆成流式片段，格式与 chain 的流式输出一致"""
+        yield {"type": "source", "content": cached["source_documents"]}
+        answer = cached["answer"]
+        for i in range(0, len(answer), chunk_size):
+            yield {"type": "answer", "content": answer[i:i + chunk_size]}
 
-    def chat_stream(self, question: str, chat_history: List[Dict] = None):
+    def _resolve_history(self, chat_history: List[Dict] = None, session_id: str = None):
+        """有 session_id 时使用服务端会话 (摘要 + 最近窗口)，忽略客户端传入的历史"""
+        if session_id is None:
+            return None, chat_history
+        session = self.sessions.get(session_id)
+        return session, self.memory.build_history(session)
+
+    def _record_turn(self, session: Dict[str, Any], question: str, answer: str):
+        """保存本轮问答；需要更新摘要时交给后台线程，不占用请求的响应时间"""
+        session = self.sessions.append_turn(session["id"], question, answer)
+        _, new_lines = self.memory.pending(session)
+        if not new_lines:
+            return
+        with self._summary_lock:
+            if session["id"] in self._summarizing:
+                return
+            self._summarizing.add(session["id"])
+        try:
+            self._summary_executor.submit(self._summarize_session, session["id"])
+        except RuntimeError:
+            # 服务正在关闭，下一轮对话时再合并
+            with self._summary_lock:
+                self._summarizing.discard(session["id"])
+
+    def _summarize_session(self, session_id: str):
+        try:
+            session = self.sessions.get(session_id)
+            start, new_lines = self.memory.pending(session)
+            if new_lines:
+                summary = self.memory.summarize(session["summary"], new_lines)
+                self.sessions.apply_summary(session_id, session["summary"], start, summary)
+        except SessionNotFoundError:
+            pass
+        except Exception as e:
+            # 摘要失败不影响对话，下一轮会再次尝试
+            print(f"Failed to summarize session {session_id}: {e}")
+        finally:
+            with self._summary_lock:
+                self._summarizing.discard(session_id)
+
+    def chat(self, question: str, chat_history: List[Dict] = None, session_id: str = None) -> Dict[str, Any]:
+        """进行对话"""
+        session, chat_history = self._resolve_history(chat_history, session_id)
+        embedding, cached = self._lookup_answer_cache(question, chat_history)
+        chain_input = self._build_chain_input(question, chat_history, embedding)
+        
+        if cached:
+            result = {"answer": cached["answer"], "source_documents": cached["source_documents"]}
+        else:
+            version = self.vector_store.version
+            response = self.qa_chain.invoke(chain_input)
+            result = {"answer": response["answer"], "source_documents": response["context"]}
+            if embedding is not None:
+                self.answer_cache.store(embedding, version, question, result["answer"], result["source_documents"])
+        
+        if session is not None:
+            self._record_turn(session, question, result["answer"])
+        return result
+
+    async def achat(self, question: str, chat_history: List[Dict] = None, session_id: str = None) -> Dict[str, Any]:
+        """异步对话，不阻塞事件循环"""
+        session, chat_history = self._resolve_history(chat_history, session_id)
+        embedding, cached = await self._alookup_answer_cache(question, chat_history)
+        chain_input = self._build_chain_input(question, chat_history, embedding)
+        
+        if cached:
+            result = {"answer": cached["answer"], "source_documents": cached["source_documents"]}
+        else:
+            version = self.vector_store.version
+            response = await self.qa_chain.ainvoke(chain_input)
+            result = {"answer": response["answer"], "source_documents": response["context"]}
+            if embedding is not None:
+                self.answer_cache.store(embedding, version, question, result["answer"], result["source_documents"])
+        
+        if session is not None:
+            self._record_turn(session, question, result["answer"])
+        return result
+
+    def chat_stream(self, question: str, chat_history: List[Dict] = None, session_id: str = None):
         """流式对话"""
-        if not self.qa_chain:
-            self._update_chain()
-            
-        # 处理历史记录格式
-        langchain_history = []
-        if chat_history:
-            for msg in chat_history:
-                if msg["role"] == "user":
-                    langchain_history.append(HumanMessage(content=msg["content"]))
-                elif msg["role"] == "assistant":
-                    langchain_history.append(AIMessage(content=msg["content"]))
+        start = time.perf_counter()
+        session, chat_history = self._resolve_history(chat_history, session_id)
+        embedding, cached = self._lookup_answer_cache(question, chat_history)
+        chain_input = self._build_chain_input(question, chat_history, embedding)
         
-        chain_input = {
-            "input": question,
-            "chat_history": langchain_history
-        }
+        version = self.vector_store.version
+        stream = self._replay_cached(cached) if cached else self._iter_chain_stream(chain_input)
+        answer_parts, sources = [], []
+        for chunk in stream:
+            if chunk["type"] == "answer":
+                if not answer_parts:
+                    observe_first_token(time.perf_counter() - start)
+                answer_parts.append(chunk["content"])
+            else:
+                sources = chunk["content"]
+            yield chunk
+        
+        answer = "".join(answer_parts)
+        if embedding is not None and not cached:
+            self.answer_cache.store(embedding, version, question, answer, sources)
+        if session is not None:
+            self._record_turn(session, question, answer)
+
+    async def achat_stream(self, question: str, chat_history: List[Dict] = None,
+                           session_id: str = None) -> AsyncIterator[Dict[str, Any]]:
+        """异步流式对话"""
+        start = time.perf_counter()
+        session, chat_history = self._resolve_history(chat_history, session_id)
+        embedding, cached = await self._alookup_answer_cache(question, chat_history)
+        chain_input = self._build_chain_input(question, chat_history, embedding)
         
+        version = self.vector_store.version
+        stream = self._aiter_cached(cached) if cached else self._aiter_chain_stream(chain_input)
+        answer_parts, sources = [], []
+        async for chunk in stream:
+            if chunk["type"] == "answer":
+                if not answer_parts:
+                    observe_first_token(time.perf_counter() - start)
+                answer_parts.append(chunk["content"])
+            else:
+                sources = chunk["content"]
+            yield chunk
+        
+        answer = "".join(answer_parts)
+        if embedding is not None and not cached:
+            self.answer_cache.store(embedding, version, question, answer, sources)
+        if session is not None:
+            self._record_turn(session, question, answer)
+
+    def _iter_chain_stream(self, chain_input: Dict[str, Any]):
         for chunk in self.qa_chain.stream(chain_input):
             if "answer" in chunk:
                 yield {"type": "answer", "content": chunk["answer"]}
             if "context" in chunk:
                 yield {"type": "source", "content": chunk["context"]}
 
+    async def _aiter_chain_stream(self, chain_input: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        async for chunk in self.qa_chain.astream(chain_input):
+            if "answer" in chunk:
+                yield {"type": "answer", "content": chunk["answer"]}
+            if "context" in chunk:
+                yield {"type": "source", "content": chunk["context"]}
+
+    async def _aiter_cached(self, cached: Dict[str, Any]) -> AsyncIterator[Dict[str, Any]]:
+        for chunk in self._replay_cached(cached):
+            yield chunk
+
+    @staticmethod
+    def _group_questions(questions: List[str]) -> Tuple[List[str], List[List[int]]]:
+        """按问题文本去重：返回 (唯一问题列表, 每个唯一问题对应的原始下标)"""
+        groups: Dict[str, List[int]] = {}
+        for index, question in enumerate(questions):
+            groups.setdefault(question.strip(), []).append(index)
+        return list(groups), list(groups.values())
+
+    def _prepare_batch(self, questions: List[str]) -> List[Dict[str, Any]]:
+        """为一组问题准备生成所需的数据
+
+        查询向量一次请求算完，先查答案缓存，未命中的问题再一起做向量检索。
+        返回与 questions 对应的 {"embedding", "version", "cached", "documents"}。
+        """
+        self._ensure_chain()
+        version = self.vector_store.version
+        with timed("batch_retrieve"):
+            embeddings = self.vector_store.embed_queries(questions)
+            
+            prepared = []
+            for embedding in embeddings:
+                cached = None
+                if self.answer_cache is not None:
+                    cached = self.answer_cache.lookup(embedding, version)
+                    ANSWER_CACHE_LOOKUPS.inc(result="hit" if cached else "miss")
+                prepared.append({"embedding": embedding, "version": version, "cached": cached, "documents": None})
+            
+            misses = [i for i, item in enumerate(prepared) if item["cached"] is None]
+            if misses:
+                documents = self.retriever.retrieve_batch(
+                    [questions[i] for i in misses], [embeddings[i] for i in misses]
+                )
+                for i, docs in zip(misses, documents):
+                    prepared[i]["documents"] = docs
+        return prepared
+
+    @staticmethod
+    def _batch_chain_input(question: str, item: Dict[str, Any]) -> Dict[str, Any]:
+        return {"input": question, "chat_history": [], "context": item["documents"]}
+
+    def _store_batch_answer(self, question: str, item: Dict[str, Any], answer: str):
+        if self.answer_cache is not None:
+            self.answer_cache.store(item["embedding"], item["version"], question, answer, item["documents"])
+
+    @staticmethod
+    def _batch_entry(index: int, question: str, answer: Optional[str], sources: Optional[List],
+                     error: Optional[Exception]) -> Dict[str, Any]:
+        if error is not None:
+            return {"type": "error", "index": index, "question": question, "content": str(error)}
+        return {"type": "result", "index": index, "question": question, "answer": answer, "sources": sources}
+
+    def _generate_batch_answer(self, question: str, item: Dict[str, Any]) -> Tuple[str, List]:
+        cached = item["cached"]
+        if cached:
+            return cached["answer"], cached["source_documents"]
+        answer = self.document_chain.invoke(self._batch_chain_input(question, item))
+        self._store_batch_answer(question, item, answer)
+        return answer, item["documents"]
+
+    def chat_batch(self, questions: List[str], max_concurrency: int = None) -> Iterator[Dict[str, Any]]:
+        """批量问答 (无历史记录)，按完成顺序逐个产出结果
+
+        - 重复问题只检索和生成一次，结果分发给每个原始下标
+        - 问题按 batch.retrieval_batch_size 分组，每组的查询向量一次请求算完、向量检索一起执行
+        - 生成在线程池中并发执行，并发数不超过 max_concurrency
+        产出 {"type": "result", "index", "question", "answer", "sources"}，
+        单个问题失败时产出 {"type": "error", "index", "question", "content"}。
+        """
+        unique, groups = self._group_questions(questions)
+        pool = ThreadPoolExecutor(
+            max_workers=max_concurrency or settings.BATCH_MAX_CONCURRENCY,
+            thread_name_prefix="batch"
+        )
+        try:
+            futures = {}
+            for start in range(0, len(unique), settings.BATCH_RETRIEVAL_SIZE):
+                positions = range(start, min(start + settings.BATCH_RETRIEVAL_SIZE, len(unique)))
+                try:
+                    prepared = self._prepare_batch([unique[p] for p in positions])
+                except Exception as e:
+                    for p in positions:
+                        for index in groups[p]:
+                            yield self._batch_entry(index, questions[index], None, None, e)
+                    continue
+                # 提交后立即开始生成，与下一组的检索重叠
+                for p, item in zip(positions, prepared):
+                    futures[pool.submit(self._generate_batch_answer, unique[p], item)] = p
+            
+            for future in as_completed(futures):
+                p = futures[future]
+                try:
+                    answer, sources = future.result()
+                    error = None
+                except Exception as e:
+                    answer, sources, error = None, None, e
+                for index in groups[p]:
+                    yield self._batch_entry(index, questions[index], answer, sources, error)
+        finally:
+            # 调用方提前停止迭代时不再等待剩余的生成
+            pool.shutdown(wait=False, cancel_futures=True)
+
+    async def achat_batch(self, questions: List[str], max_concurrency: int = None) -> AsyncIterator[Dict[str, Any]]:
+        """异步批量问答，行为与 chat_batch 相同
+
+        每组问题的向量化与检索在线程池中执行，与前面各组的生成重叠进行；
+        生成并发由信号量限制，先完成的问题先产出。
+        """
+        unique, groups = self._group_questions(questions)
+        semaphore = asyncio.Semaphore(max_concurrency or settings.BATCH_MAX_CONCURRENCY)
+        queue: asyncio.Queue = asyncio.Queue()
+        loop = asyncio.get_running_loop()
+        tasks = []
+        
+        async def generate(position: int, item: Dict[str, Any]):
+            question = unique[position]
+            try:
+                cached = item["cached"]
+                if cached:
+                    answer, sources = cached["answer"], cached["source_documents"]
+                else:
+                    async with semaphore:
+                        answer = await self.document_chain.ainvoke(self._batch_chain_input(question, item))
+                    self._store_batch_answer(question, item, answer)
+                    sources = item["documents"]
+                queue.put_nowait((position, answer, sources, None))
+            except Exception as e:
+                queue.put_nowait((position, None, None, e))
+        
+        async def schedule():
+            for start in range(0, len(unique), settings.BATCH_RETRIEVAL_SIZE):
+                positions = range(start, min(start + settings.BATCH_RETRIEVAL_SIZE, len(unique)))
+                scheduled = 0
+                try:
+                    prepared = await loop.run_in_executor(
+                        self._executor, self._prepare_batch, [unique[p] for p in positions]
+                    )
+                    for i, p in enumerate(positions):
+                        tasks.append(asyncio.create_task(generate(p, prepared[i])))
+                        scheduled += 1
+                except Exception as e:
+                    # 检索失败或其他意外错误：尚未开始生成的问题逐个返回错误，整批不会一直等待
+                    for p in positions[scheduled:]:
+                        queue.put_nowait((p, None, None, e))
+        
+        scheduler = asyncio.create_task(schedule())
+        try:
+            for _ in range(len(unique)):
+                position, answer, sources, error = await queue.get()
+                for index in groups[position]:
+                    yield self._batch_entry(index, questions[index], answer, sources, error)
+        finally:
+            # 客户端断开等提前结束时取消尚未完成的检索与生成
+            scheduler.cancel()
+            for task in tasks:
+                task.cancel()
+
+    def remove_files(self, file_paths: List[str]) -> int:
+        """从索引中删除文件 (源文件被删除时调用)，返回删除的 chunk 数"""
+        removed = 0
+        for path in file_paths:
+            removed += self.vector_store.remove_file(path)
+        return removed
+
     def clear_knowledge_base(self):
         """清空知识库"""
         self.vector_store.clear()
-        self.qa_chain = None
+        if self.answer_cache:
+            self.answer_cache.invalidate()
+
+    def close(self):
+        """释放后台资源，并把未落盘的索引变化写入磁盘"""
+        self._executor.shutdown(wait=False)
+        self._summary_executor.shutdown(wait=False)
+        if self._owns_doc_processor:
+            self.doc_processor.close()
+        self.vector_store.close()
@@ -0,0 +1,104 @@
+import json
+import os
+import sqlite3
+import threading
+import zlib
+from typing import List, Dict
+from langchain_core.documents import Document
+
+
+class ChunkStore:
+    """父段落存储 (SQLite)
+
+    启用父子分块时，向量库只保存子 chunk 的向量和定位信息 (parent_id 与在父段落中的偏移)，
+    父段落正文以 zlib 压缩后与元数据一起保存在这里，检索命中子 chunk 后按 parent_id 取回。
+    children 记录每个父段落切出的子 chunk 数，删除父段落时据此删除对应的向量。
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS parents ("
+            "id TEXT PRIMARY KEY, text BLOB NOT NULL, metadata TEXT, children INTEGER NOT NULL)"
+        )
+        self._conn.commit()
+
+    def _select(self, columns: str, ids: List[str]) -> List[tuple]:
+        rows = []
+        unique_ids = list(dict.fromkeys(ids))
+        with self._lock:
+            # 分批查询，避免超过 SQLite 参数个数限制
+            for i in range(0, len(unique_ids), 500):
+                batch = unique_ids[i:i + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows.extend(self._conn.execute(
+                    f"SELECT id, {columns} FROM parents WHERE id IN ({placeholders})", batch
+                ).fetchall())
+        return rows
+
+    def put(self, ids: List[str], documents: List[Document], children: List[int]):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO parents (id, text, metadata, children) VALUES (?, ?, ?, ?)",
+                [
+                    (parent_id, zlib.compress(doc.page_content.encode("utf-8")),
+                     json.dumps(doc.metadata, ensure_ascii=False), count)
+                    for parent_id, doc, count in zip(ids, documents, children)
+                ]
+            )
+            self._conn.commit()
+
+    def get(self, ids: List[str]) -> Dict[str, Document]:
+        """按 ID 取回父段落，不存在的 ID 不出现在结果中"""
+        return {
+            parent_id: Document(
+                page_content=zlib.decompress(text).decode("utf-8"),
+                metadata=json.loads(metadata or "{}")
+            )
+            for parent_id, text, metadata in self._select("text, metadata", ids)
+        }
+
+    def child_counts(self, ids: List[str]) -> Dict[str, int]:
+        """返回其中属于父段落的 ID 及其子 chunk 数"""
+        return dict(self._select("children", ids))
+
+    def delete(self, ids: List[str]):
+        if not ids:
+            return
+        with self._lock:
+            self._conn.executemany("DELETE FROM parents WHERE id = ?", [(parent_id,) for parent_id in ids])
+            self._conn.commit()
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM parents").fetchone()[0]
+
+    def backup(self, path: str):
+        """用 SQLite 在线备份把当前内容复制到 path (一致的时间点副本)"""
+        with self._lock:
+            target = sqlite3.connect(path)
+            try:
+                self._conn.backup(target)
+            finally:
+                target.close()
+
+    def restore(self, path: str):
+        """用 path 处的备份整体替换当前内容"""
+        with self._lock:
+            source = sqlite3.connect(path)
+            try:
+                source.backup(self._conn)
+            finally:
+                source.close()
+
+    def clear(self):
+        with self._lock:
+            self._conn.execute("DELETE FROM parents")
+            self._conn.commit()
+            self._conn.execute("VACUUM")
@@ -0,0 +1,180 @@
+from typing import Any, List, Dict, Optional, Tuple
+from langchain_core.callbacks import (
+    AsyncCallbackManagerForRetrieverRun,
+    CallbackManagerForRetrieverRun,
+)
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+
+from app.services.bm25_index import tokenize
+from app.services.metrics import timed, RETRIEVED_CHUNKS, CONTEXT_TOKENS, CONTEXT_TOKENS_SAVED
+
+_encoding = None
+
+def get_encoding():
+    """返回 cl100k_base 编码；tiktoken 或编码文件不可用时返回 None"""
+    global _encoding
+    if _encoding is None:
+        try:
+            import tiktoken
+            _encoding = tiktoken.get_encoding("cl100k_base")
+        except Exception as e:
+            print(f"tiktoken unavailable, falling back to character estimate: {e}")
+            _encoding = False
+    return _encoding or None
+
+
+def estimate_tokens(text: str) -> int:
+    """不依赖编码文件的估算：UTF-8 中占 3 字节的字符 (CJK 文字与全角标点) 按 1 token，其余按 4 字符/token
+
+    用编码后的字节数推算宽字符个数，避免逐字符判断。
+    """
+    wide = (len(text.encode("utf-8")) - len(text)) // 2
+    return wide + (len(text) - wide + 3) // 4
+
+
+def count_tokens(text: str) -> int:
+    """用 tiktoken 统计 token 数；编码文件不可用时按字符估算"""
+    encoding = get_encoding()
+    if encoding is None:
+        return max(1, estimate_tokens(text))
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _overlap_length(left: str, right: str, min_overlap: int, max_overlap: int) -> int:
+    """left 的结尾与 right 的开头重叠的字符数，不足 min_overlap 时返回 0"""
+    if len(right) < min_overlap:
+        return 0
+    probe = right[:min_overlap]
+    start = max(0, len(left) - max_overlap)
+    idx = left.find(probe, start)
+    while idx != -1:
+        length = len(left) - idx
+        if right.startswith(left[idx:]) and length >= min_overlap:
+            return length
+        idx = left.find(probe, idx + 1)
+    return 0
+
+
+def _merge_spans(metadata: Dict, other: Dict) -> Dict:
+    """合并后的 chunk 覆盖两者的字符区间 (start_index / end_index)"""
+    if "start_index" not in metadata or "start_index" not in other or "end_index" not in metadata:
+        return metadata
+    return dict(
+        metadata,
+        start_index=min(metadata["start_index"], other["start_index"]),
+        end_index=max(metadata["end_index"], other.get("end_index", metadata["end_index"]))
+    )
+
+
+class ContextPacker:
+    """检索后处理：合并重叠 chunk、可选重排、按 token 预算装入 prompt"""
+
+    def __init__(self, max_tokens: int, rerank: bool = False, max_overlap: int = 400, min_overlap: int = 20,
+                 rrf_k: int = 60):
+        self.max_tokens = max_tokens
+        self.rerank = rerank
+        self.rrf_k = rrf_k
+        self.max_overlap = max_overlap
+        self.min_overlap = min_overlap
+
+    def merge_overlaps(self, documents: List[Document]) -> List[Document]:
+        """合并同一来源/页面中首尾重叠或重复的 chunk，保留首次出现的位置"""
+        merged: List[Document] = []
+        groups: Dict[Tuple, List[int]] = {}
+        for doc in documents:
+            key = (doc.metadata.get("source"), doc.metadata.get("page"))
+            text = doc.page_content
+            absorbed = False
+            for i in groups.get(key, []):
+                current = merged[i].page_content
+                if text in current:
+                    absorbed = True
+                elif current in text:
+                    merged[i] = Document(page_content=text, metadata=_merge_spans(merged[i].metadata, doc.metadata))
+                    absorbed = True
+                elif overlap := _overlap_length(current, text, self.min_overlap, self.max_overlap):
+                    merged[i] = Document(page_content=current + text[overlap:],
+                                         metadata=_merge_spans(merged[i].metadata, doc.metadata))
+                    absorbed = True
+                elif overlap := _overlap_length(text, current, self.min_overlap, self.max_overlap):
+                    merged[i] = Document(page_content=text + current[overlap:],
+                                         metadata=_merge_spans(merged[i].metadata, doc.metadata))
+                    absorbed = True
+                if absorbed:
+                    break
+            if not absorbed:
+                groups.setdefault(key, []).append(len(merged))
+                merged.append(doc)
+        return merged
+
+    def rerank_documents(self, query: str, documents: List[Document]) -> List[Document]:
+        """本地轻量重排：查询词覆盖率排序与检索排序做倒数排名融合
+
+        只按覆盖率排序会把检索 (向量/RRF) 排名靠前的相关段落挤到后面；融合后
+        覆盖率只在排名接近的段落之间起作用。得分相同时保持检索顺序。
+        """
+        query_terms = set(tokenize(query))
+        if not query_terms:
+            return documents
+        
+        coverage = [len(query_terms & set(tokenize(doc.page_content))) for doc in documents]
+        by_coverage = sorted(range(len(documents)), key=lambda i: (-coverage[i], i))
+        scores = [1.0 / (self.rrf_k + rank) for rank in range(1, len(documents) + 1)]
+        for rank, i in enumerate(by_coverage, start=1):
+            scores[i] += 1.0 / (self.rrf_k + rank)
+        order = sorted(range(len(documents)), key=lambda i: (-scores[i], i))
+        return [documents[i] for i in order]
+
+    def pack(self, query: str, documents: List[Document]) -> List[Document]:
+        with timed("context_packing"):
+            return self._pack(query, documents)
+
+    def _pack(self, query: str, documents: List[Document]) -> List[Document]:
+        merged = self.merge_overlaps(documents)
+        if self.rerank:
+            merged = self.rerank_documents(query, merged)
+        
+        # 未被合并的 chunk 与检索结果是同一个对象，token 数只计算一次
+        token_counts = {id(doc): count_tokens(doc.page_content) for doc in documents}
+        
+        # 按顺序贪心装入，放不下的 chunk 跳过，继续尝试后面更短的
+        packed, used = [], 0
+        for doc in merged:
+            tokens = token_counts.get(id(doc))
+            if tokens is None:
+                tokens = count_tokens(doc.page_content)
+            if used + tokens > self.max_tokens:
+                continue
+            packed.append(doc)
+            used += tokens
+        
+        RETRIEVED_CHUNKS.observe(len(documents), phase="retrieved")
+        RETRIEVED_CHUNKS.observe(len(packed), phase="packed")
+        CONTEXT_TOKENS.inc(used)
+        # 合并重叠与预算截断共节省的 token 数 (检索结果原样拼接时的 token 数减去实际装入的)
+        retrieved = sum(token_counts[id(doc)] for doc in documents)
+        CONTEXT_TOKENS_SAVED.observe(max(0, retrieved - used))
+        return packed
+
+
+class PackedRetriever(BaseRetriever):
+    """包装任意检索器，对检索结果做 ContextPacker 处理"""
+
+    retriever: Any
+    packer: Any
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        with timed("retrieve"):
+            docs = self.retriever.invoke(query, config={"callbacks": run_manager.get_child()})
+        return self.packer.pack(query, docs)
+
+    async def _aget_relevant_documents(self, query: str, *, run_manager: AsyncCallbackManagerForRetrieverRun) -> List[Document]:
+        with timed("retrieve"):
+            docs = await self.retriever.ainvoke(query, config={"callbacks": run_manager.get_child()})
+        return self.packer.pack(query, docs)
+
+    def retrieve_batch(self, queries: List[str], embeddings: Optional[List[List[float]]] = None) -> List[List[Document]]:
+        with timed("retrieve_batch"):
+            results = self.retriever.retrieve_batch(queries, embeddings)
+        return [self.packer.pack(query, docs) for query, docs in zip(queries, results)]
@@ -0,0 +1,60 @@
+from typing import List, Dict, Any, Tuple
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate
+
+from app.services.context_packer import count_tokens
+
+SUMMARY_PROMPT = (
+    "Progressively summarize the conversation below, adding onto the previous summary. "
+    "Keep facts, names, numbers and open questions that later turns may refer to. "
+    "Return only the new summary.\n\n"
+    "Previous summary:\n{summary}\n\n"
+    "New lines of conversation:\n{new_lines}"
+)
+
+
+class ConversationMemory:
+    """滚动摘要式对话记忆
+
+    prompt 中只保留 token 预算内的最近几轮原文，更早的轮次被增量合并进摘要，
+    每轮的 prompt 大小因此与对话长度无关。摘要由 ChatService 在后台生成。
+    """
+
+    def __init__(self, llm, window_tokens: int = 2000):
+        self.window_tokens = window_tokens
+        self.summary_chain = ChatPromptTemplate.from_template(SUMMARY_PROMPT) | llm.with_config(tags=["summary"]) | StrOutputParser()
+
+    def _window_start(self, turns: List[Dict[str, str]]) -> int:
+        """从最新一轮往前累加，返回能放进 token 预算的最早轮次下标"""
+        used = 0
+        start = len(turns)
+        while start > 0:
+            tokens = count_tokens(turns[start - 1]["content"])
+            if used + tokens > self.window_tokens:
+                break
+            used += tokens
+            start -= 1
+        # 按问答对对齐，窗口总是从用户消息开始
+        return start + start % 2
+
+    def build_history(self, session: Dict[str, Any]) -> List[Dict[str, str]]:
+        """摘要 + 最近窗口内的原文，格式与 ChatRequest.history 相同"""
+        turns = session["turns"]
+        start = max(self._window_start(turns), session["summarized_turns"])
+        history = []
+        if session["summary"]:
+            history.append({"role": "user", "content": f"Summary of our earlier conversation:\n{session['summary']}"})
+            history.append({"role": "assistant", "content": "Understood."})
+        history.extend(turns[start:])
+        return history
+
+    def pending(self, session: Dict[str, Any]) -> Tuple[int, str]:
+        """返回 (摘要覆盖到的轮次下标, 滑出窗口且尚未摘要的对话文本)"""
+        start = self._window_start(session["turns"])
+        pending = session["turns"][session["summarized_turns"]:start]
+        new_lines = "\n".join(f"{turn['role']}: {turn['content']}" for turn in pending)
+        return start, new_lines
+
+    def summarize(self, summary: str, new_lines: str) -> str:
+        """把新的对话内容合并进已有摘要"""
+        return self.summary_chain.invoke({"summary": summary or "(none)", "new_lines": new_lines})
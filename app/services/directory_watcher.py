@@ -0,0 +1,234 @@
+import os
+import threading
+import time
+from typing import Dict, List, Optional, Tuple
+
+from app.core.config import settings
+from app.services.metrics import timed
+from app.services.notebook_service import NotebookManager, DEFAULT_NOTEBOOK_ID
+
+
+class DirectoryWatcher:
+    """监听目录变化并增量更新索引
+
+    - 事件去抖：同一文件在 debounce_seconds 内的多次事件合并为一次，
+      最后一次事件之后才处理 (避免处理写了一半的文件)
+    - 只处理变化的文件：新增/修改的文件走 ChatService.index_files
+      (内容哈希未变的直接跳过)，删除的文件按来源删除其全部 chunk
+    - 分批处理：每批最多 batch_size 个文件、使用 parse_workers 个解析进程，
+      批次之间间隔 batch_interval 秒，大批量拷贝时不会挤占查询资源
+    - 失败重试：处理失败的文件按指数退避重新排队，最多 retry_attempts 次
+    - 启动时全量扫描一次，补上监听停止期间发生的变化；扫描失败同样按退避重试，
+      重试用完后只处理监听到的事件，错误记录在 stats() 中
+
+    处理期间笔记本保持固定，不会被 LRU 释放；与上传任务同时处理同一文件时，
+    由 VectorStoreService 按文件串行，后完成的一方发现内容未变直接跳过。
+    """
+
+    def __init__(self, notebooks: NotebookManager, directories: List[str],
+                 notebook_id: str = DEFAULT_NOTEBOOK_ID, debounce_seconds: float = None,
+                 batch_size: int = None, batch_interval: float = None, parse_workers: int = None,
+                 retry_attempts: int = None, retry_backoff: float = None):
+        self.notebooks = notebooks
+        self.directories = [os.path.abspath(directory) for directory in directories]
+        self.notebook_id = notebook_id
+        self.debounce_seconds = settings.WATCH_DEBOUNCE_SECONDS if debounce_seconds is None else debounce_seconds
+        self.batch_size = batch_size or settings.WATCH_BATCH_SIZE
+        self.batch_interval = settings.WATCH_BATCH_INTERVAL if batch_interval is None else batch_interval
+        self.parse_workers = parse_workers or settings.WATCH_PARSE_WORKERS
+        self.retry_attempts = settings.WATCH_RETRY_ATTEMPTS if retry_attempts is None else retry_attempts
+        self.retry_backoff = settings.WATCH_RETRY_BACKOFF if retry_backoff is None else retry_backoff
+        self.extensions = {ext.lower() for ext in settings.SUPPORTED_FORMATS}
+
+        # path -> (可以处理的时间, 是否已删除)；新事件推迟 debounce_seconds，重试推迟退避时间
+        self._pending: Dict[str, Tuple[float, bool]] = {}
+        # path -> 连续失败次数
+        self._failures: Dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._observer = None
+        self._worker: Optional[threading.Thread] = None
+
+        self.indexed_files = 0
+        self.removed_files = 0
+        self.failed_files = 0
+        # 初始扫描状态：pending / done / failed
+        self.initial_scan = "pending"
+        self.last_error: Optional[str] = None
+
+    def _is_supported(self, path: str) -> bool:
+        name = os.path.basename(path)
+        # 跳过隐藏文件和编辑器/Office 的临时文件
+        if name.startswith((".", "~$")) or name.endswith((".tmp", ".swp", ".part")):
+            return False
+        return os.path.splitext(name)[1].lower() in self.extensions
+
+    def _in_watched_directory(self, path: str) -> bool:
+        return any(path == directory or path.startswith(directory + os.sep) for directory in self.directories)
+
+    def enqueue(self, path: str, deleted: bool = False):
+        path = os.path.abspath(path)
+        if not self._is_supported(path):
+            return
+        with self._lock:
+            self._pending[path] = (time.monotonic() + self.debounce_seconds, deleted)
+            # 文件有新变化，重新开始计算重试次数
+            self._failures.pop(path, None)
+
+    def _initial_scan(self):
+        """入队全部现有文件 (未变化的会按哈希跳过)，以及清单中已不存在的文件"""
+        for directory in self.directories:
+            for root, _, files in os.walk(directory):
+                for name in files:
+                    self.enqueue(os.path.join(root, name))
+
+        with self.notebooks.use(self.notebook_id) as chat_service:
+            sources = chat_service.vector_store.manifest.sources()
+        for source in sources:
+            if self._in_watched_directory(source) and not os.path.exists(source):
+                self.enqueue(source, deleted=True)
+
+    def _take_batch(self) -> List[Tuple[str, bool]]:
+        """取出已经到处理时间的文件，最多 batch_size 个"""
+        now = time.monotonic()
+        with self._lock:
+            ready = sorted(
+                (ready_at, path) for path, (ready_at, _) in self._pending.items()
+                if ready_at <= now
+            )[:self.batch_size]
+            return [(path, self._pending.pop(path)[1]) for _, path in ready]
+
+    def _retry(self, batch: List[Tuple[str, bool]]):
+        """失败的文件按指数退避重新排队；期间有新事件的文件以新事件为准"""
+        now = time.monotonic()
+        with self._lock:
+            for path, deleted in batch:
+                attempts = self._failures.get(path, 0) + 1
+                if attempts > self.retry_attempts:
+                    self._failures.pop(path, None)
+                    self.failed_files += 1
+                    print(f"Watcher gave up on {path} after {self.retry_attempts} retries")
+                    continue
+                self._failures[path] = attempts
+                if path not in self._pending:
+                    self._pending[path] = (now + self.retry_backoff * 2 ** (attempts - 1), deleted)
+
+    def process_batch(self, batch: List[Tuple[str, bool]]) -> List[Tuple[str, bool]]:
+        """处理一批文件，返回处理失败的 (path, deleted)"""
+        # 事件可能已经过时：以处理时文件是否存在为准
+        removed = [path for path, deleted in batch if deleted or not os.path.exists(path)]
+        changed = [path for path, _ in batch if path not in removed]
+        failed = []
+
+        def on_progress(path, stage, chunks, error):
+            if stage == "failed":
+                failed.append((path, False))
+
+        with self.notebooks.use(self.notebook_id) as chat_service, timed("watch_batch"):
+            if removed:
+                chunks = chat_service.remove_files(removed)
+                self.removed_files += len(removed)
+                print(f"Watcher removed {len(removed)} files ({chunks} chunks)")
+            if changed:
+                indexed = chat_service.index_files(changed, on_progress=on_progress, parse_workers=self.parse_workers)
+                self.indexed_files += len(indexed)
+        
+        failed_paths = {path for path, _ in failed}
+        with self._lock:
+            for path, _ in batch:
+                if path not in failed_paths:
+                    self._failures.pop(path, None)
+        return failed
+
+    def _run_initial_scan(self):
+        """初始扫描失败时按指数退避重试，最多 retry_attempts 次"""
+        attempts = 0
+        while not self._stop.is_set():
+            try:
+                self._initial_scan()
+                self.initial_scan = "done"
+                return
+            except Exception as e:
+                attempts += 1
+                self.last_error = f"Initial scan failed: {e}"
+                print(f"Watcher initial scan failed (attempt {attempts}): {e}")
+                if attempts > self.retry_attempts:
+                    self.initial_scan = "failed"
+                    print("Watcher gave up on the initial scan, only watching for new changes")
+                    return
+                self._stop.wait(self.retry_backoff * 2 ** (attempts - 1))
+
+    def _run(self):
+        self._run_initial_scan()
+        while not self._stop.is_set():
+            batch = self._take_batch()
+            if not batch:
+                self._stop.wait(min(0.5, self.debounce_seconds or 0.5))
+                continue
+            try:
+                failed = self.process_batch(batch)
+            except Exception as e:
+                self.last_error = f"Batch failed: {e}"
+                print(f"Watcher batch failed: {e}")
+                failed = batch
+            if failed:
+                self._retry(failed)
+            # 批次之间让出资源给查询请求
+            self._stop.wait(self.batch_interval)
+
+    def start(self):
+        # 延迟导入：只有启用监听时才需要 watchdog
+        from watchdog.events import FileSystemEventHandler
+        from watchdog.observers import Observer
+
+        watcher = self
+
+        class Handler(FileSystemEventHandler):
+            def on_created(self, event):
+                if not event.is_directory:
+                    watcher.enqueue(event.src_path)
+
+            def on_modified(self, event):
+                if not event.is_directory:
+                    watcher.enqueue(event.src_path)
+
+            def on_deleted(self, event):
+                if not event.is_directory:
+                    watcher.enqueue(event.src_path, deleted=True)
+
+            def on_moved(self, event):
+                if not event.is_directory:
+                    watcher.enqueue(event.src_path, deleted=True)
+                    watcher.enqueue(event.dest_path)
+
+        self._observer = Observer()
+        for directory in self.directories:
+            os.makedirs(directory, exist_ok=True)
+            self._observer.schedule(Handler(), directory, recursive=True)
+        self._observer.start()
+
+        self._worker = threading.Thread(target=self._run, name="directory-watcher", daemon=True)
+        self._worker.start()
+        print(f"Watching {', '.join(self.directories)} for notebook {self.notebook_id}")
+
+    def stop(self):
+        self._stop.set()
+        if self._observer is not None:
+            self._observer.stop()
+            self._observer.join()
+        if self._worker is not None:
+            self._worker.join()
+
+    def stats(self) -> dict:
+        with self._lock:
+            pending = len(self._pending)
+        return {
+            "directories": self.directories,
+            "notebook_id": self.notebook_id,
+            "pending": pending,
+            "indexed_files": self.indexed_files,
+            "removed_files": self.removed_files,
+            "failed_files": self.failed_files,
+            "initial_scan": self.initial_scan,
+            "last_error": self.last_error
+        }
@@ -1,55 +1,263 @@
 import os
-from typing import List
-from langchain_community.document_loaders import (
-    PyPDFLoader,
-    TextLoader,
-    Docx2txtLoader,
-    UnstructuredMarkdownLoader,
-    BSHTMLLoader
-)
-from langchain.text_splitter import RecursiveCharacterTextSplitter
-from langchain.schema import Document
+import time
+import importlib
+import threading
+import multiprocessing
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from concurrent.futures.process import BrokenProcessPool
+from typing import Dict, List, Iterator, Optional, Tuple
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+from langchain_core.documents import Document
 from app.core.config import settings
+from app.services.metrics import observe_stage
+from app.services.text_splitter import StructuredTokenSplitter
+
+# 子进程内复用的处理器实例 (每个工作进程只初始化一次)
+_worker_processor = None
+
+def _process_file_in_worker(file_path: str) -> Tuple[List[Document], float]:
+    """进程池入口：必须是模块级函数才能被 pickle
+
+    同时返回解析耗时，由父进程记录指标 (子进程中的指标无法被 /metrics 看到)。
+    """
+    global _worker_processor
+    if _worker_processor is None:
+        _worker_processor = DocumentProcessor()
+    start = time.perf_counter()
+    docs = _worker_processor.process_file(file_path)
+    return docs, time.perf_counter() - start
 
 class DocumentProcessor:
     def __init__(self):
+        # 扩展名 -> langchain_community.document_loaders 中的 loader 类名，首次使用时才导入
         self.supported_extensions = {
-            ".pdf": PyPDFLoader,
-            ".txt": TextLoader,
-            ".docx": Docx2txtLoader,
-            ".md": UnstructuredMarkdownLoader,
-            ".html": BSHTMLLoader
+            ".pdf": "PyPDFLoader",
+            ".txt": "TextLoader",
+            ".docx": "Docx2txtLoader",
+            ".md": "UnstructuredMarkdownLoader",
+            ".html": "BSHTMLLoader"
         }
+        self._loader_classes = {}
+        
+        # 解析进程池：第一次需要并行解析时创建，之后一直复用，close() 时关闭
+        self._pool: Optional[ProcessPoolExecutor] = None
+        self._pool_lock = threading.Lock()
         
-        self.text_splitter = RecursiveCharacterTextSplitter(
-            chunk_size=settings.CHUNK_SIZE,
-            chunk_overlap=settings.CHUNK_OVERLAP,
-            separators=["\n\n", "\n", " ", ""]
-        )
+        # 启用父子分块时这里切出的是不重叠的父段落，子 chunk 在写入索引时由 VectorStoreService 切分
+        if settings.SPLITTER == "token":
+            if settings.PARENT_RETRIEVAL_ENABLED:
+                chunk_size, chunk_overlap = settings.TOKEN_PARENT_CHUNK_SIZE, 0
+            else:
+                chunk_size, chunk_overlap = settings.TOKEN_CHUNK_SIZE, settings.TOKEN_CHUNK_OVERLAP
+            self.text_splitter = StructuredTokenSplitter(chunk_size=chunk_size, chunk_overlap=chunk_overlap)
+        else:
+            if settings.PARENT_RETRIEVAL_ENABLED:
+                chunk_size, chunk_overlap = settings.PARENT_CHUNK_SIZE, 0
+            else:
+                chunk_size, chunk_overlap = settings.CHUNK_SIZE, settings.CHUNK_OVERLAP
+            self.text_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=chunk_size,
+                chunk_overlap=chunk_overlap,
+                separators=["\n\n", "\n", " ", ""]
+            )
 
-    def load_document(self, file_path: str) -> List[Document]:
-        """加载单个文档"""
+    def _create_loader(self, file_path: str):
         file_ext = os.path.splitext(file_path)[1].lower()
         
         if file_ext not in self.supported_extensions:
             raise ValueError(f"Unsupported file format: {file_ext}")
             
-        loader_cls = self.supported_extensions[file_ext]
+        loader_cls = self._loader_class(file_ext)
         
         # 针对不同 loader 的特殊处理
         if file_ext == ".txt":
-            loader = loader_cls(file_path, encoding="utf-8")
+            return loader_cls(file_path, encoding="utf-8")
+        return loader_cls(file_path)
+
+    def _loader_class(self, file_ext: str):
+        loader_cls = self._loader_classes.get(file_ext)
+        if loader_cls is None:
+            loaders = importlib.import_module("langchain_community.document_loaders")
+            loader_cls = self._loader_classes[file_ext] = getattr(loaders, self.supported_extensions[file_ext])
+        return loader_cls
+
+    def load_document(self, file_path: str) -> List[Document]:
+        """加载单个文档"""
+        return self._create_loader(file_path).load()
+
+    def lazy_load_document(self, file_path: str) -> Iterator[Document]:
+        """逐页加载文档，不一次性读入全部页面
+
+        PDF 按页产出；TXT 按段落边界分块读取，避免整个文件读入内存；
+        其他格式的 loader 本身只能整体解析，按其 lazy_load 行为产出。
+        """
+        loader = self._create_loader(file_path)
+        if os.path.splitext(file_path)[1].lower() == ".txt":
+            yield from self._lazy_load_text(file_path)
         else:
-            loader = loader_cls(file_path)
-            
-        return loader.load()
+            yield from loader.lazy_load()
+
+    def _lazy_load_text(self, file_path: str, block_size: int = None) -> Iterator[Document]:
+        """按固定大小读取文本，在最后一个段落 (或换行) 边界处切开
+
+        每块的 start_index 为其在文件中的起始字符，分割后的 chunk 偏移相对整个文件。
+        """
+        block_size = block_size or settings.CHUNK_SIZE * 32
+        offset = 0
+        buffer = ""
+        with open(file_path, "r", encoding="utf-8") as f:
+            for data in iter(lambda: f.read(block_size), ""):
+                buffer += data
+                cut = buffer.rfind("\n\n")
+                if cut <= 0:
+                    cut = buffer.rfind("\n")
+                if cut <= 0:
+                    if len(buffer) < block_size * 4:
+                        continue
+                    cut = len(buffer)
+                yield Document(page_content=buffer[:cut], metadata={"source": file_path, "start_index": offset})
+                offset += cut
+                buffer = buffer[cut:]
+        if buffer.strip():
+            yield Document(page_content=buffer, metadata={"source": file_path, "start_index": offset})
 
-    def split_documents(self, documents: List[Document]) -> List[Document]:
-        """将文档分割为 chunk"""
-        return self.text_splitter.split_documents(documents)
+    def split_documents(self, documents: List[Document],
+                        headings_by_source: Optional[Dict[str, List[str]]] = None) -> List[Document]:
+        """将文档分割为 chunk；headings_by_source 用于流式分批分割时延续标题路径"""
+        if isinstance(self.text_splitter, StructuredTokenSplitter):
+            return self.text_splitter.split_documents(documents, headings_by_source)
+        # 字符分割器不计算偏移，去掉分块读取时记录的起始字符，避免被误当作 chunk 的位置
+        return self.text_splitter.split_documents([
+            Document(page_content=doc.page_content,
+                     metadata={key: value for key, value in doc.metadata.items() if key != "start_index"})
+            for doc in documents
+        ])
 
     def process_file(self, file_path: str) -> List[Document]:
         """加载并分割文件的快捷方法"""
         docs = self.load_document(file_path)
         return self.split_documents(docs)
 
+    def iter_chunk_batches(self, file_path: str, batch_size: int = None) -> Iterator[List[Document]]:
+        """流式解析：逐页加载、分割，每凑满 batch_size 个 chunk 产出一批"""
+        batch_size = batch_size or settings.STREAM_BATCH_SIZE
+        batch = []
+        # 标题路径跨页、跨块延续，与一次性分割的结果一致
+        headings_by_source = {}
+        for page in self.lazy_load_document(file_path):
+            batch.extend(self.split_documents([page], headings_by_source))
+            while len(batch) >= batch_size:
+                yield batch[:batch_size]
+                batch = batch[batch_size:]
+        if batch:
+            yield batch
+
+    def _get_pool(self) -> ProcessPoolExecutor:
+        with self._pool_lock:
+            if self._pool is None:
+                # 使用 spawn 而不是 fork：父进程中可能已有 gRPC 客户端和线程
+                self._pool = ProcessPoolExecutor(
+                    max_workers=settings.PARSE_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn")
+                )
+            return self._pool
+
+    def _discard_pool(self, pool: ProcessPoolExecutor):
+        """工作进程异常退出后进程池不可再用，丢弃后下次重新创建"""
+        with self._pool_lock:
+            if self._pool is pool:
+                self._pool = None
+        pool.shutdown(wait=False, cancel_futures=True)
+
+    def _worth_parallel(self, file_paths: List[str], max_workers: int) -> bool:
+        """多个文件且总大小超过 parallel_parse_min_mb 时才用进程池
+
+        小文件在当前进程中解析只需几毫秒，进程间传递结果 (以及首次启动进程池) 的开销反而更大。
+        """
+        if max_workers <= 1 or len(file_paths) <= 1:
+            return False
+        total = 0
+        for path in file_paths:
+            try:
+                total += os.path.getsize(path)
+            except OSError:
+                pass
+        return total >= settings.PARALLEL_PARSE_MIN_MB * 1024 * 1024
+
+    def process_files(self, file_paths: List[str], max_workers: int = None) -> Iterator[Tuple[str, List[Document], Optional[Exception]]]:
+        """并行加载并分割多个文件
+
+        按完成顺序逐个产出 (file_path, chunks, error)，单个文件失败时
+        error 为对应异常，chunks 为空列表，不影响其他文件。
+        批次较小时直接在当前进程中解析；否则使用常驻的进程池，
+        同时进行的文件数不超过 max_workers (默认 PARSE_WORKERS)。
+        """
+        if max_workers is None:
+            max_workers = settings.PARSE_WORKERS
+        
+        if not self._worth_parallel(file_paths, max_workers):
+            for path in file_paths:
+                try:
+                    start = time.perf_counter()
+                    docs = self.process_file(path)
+                    observe_stage("parse", time.perf_counter() - start)
+                    yield path, docs, None
+                except Exception as e:
+                    yield path, [], e
+            return
+        
+        # 工作进程崩溃会让进程池中所有进行中的文件一起失败，无法直接知道是哪个文件导致的：
+        # 这些文件换新的进程池逐个重试，单独运行时仍然让进程池崩溃的才判定为失败
+        pool = self._get_pool()
+        remaining = list(reversed(file_paths))
+        suspects: List[str] = []
+        futures = {}
+        try:
+            while remaining or suspects or futures:
+                isolating = any(isolated for _, _, isolated in futures.values())
+                if suspects and not futures:
+                    batch, isolated = [suspects.pop()], True
+                elif not suspects and not isolating:
+                    batch, isolated = [remaining.pop() for _ in range(min(len(remaining), max_workers - len(futures)))], False
+                else:
+                    batch = []
+                for path in batch:
+                    try:
+                        futures[pool.submit(_process_file_in_worker, path)] = (path, pool, isolated)
+                    except BrokenProcessPool as e:
+                        self._discard_pool(pool)
+                        pool = self._get_pool()
+                        if isolated:
+                            yield path, [], e
+                        else:
+                            suspects.append(path)
+                if not futures:
+                    continue
+                done, _ = wait(futures, return_when=FIRST_COMPLETED)
+                for future in done:
+                    path, used_pool, isolated = futures.pop(future)
+                    try:
+                        docs, seconds = future.result()
+                        observe_stage("parse", seconds)
+                        yield path, docs, None
+                    except BrokenProcessPool as e:
+                        if used_pool is pool:
+                            self._discard_pool(pool)
+                            pool = self._get_pool()
+                        if isolated:
+                            yield path, [], e
+                        else:
+                            suspects.append(path)
+                    except Exception as e:
+                        yield path, [], e
+        finally:
+            # 调用方提前停止迭代时取消尚未开始的文件
+            for future in futures:
+                future.cancel()
+
+    def close(self):
+        """关闭解析进程池"""
+        with self._pool_lock:
+            pool, self._pool = self._pool, None
+        if pool is not None:
+            pool.shutdown(wait=False, cancel_futures=True)
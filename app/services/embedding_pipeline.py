@@ -0,0 +1,107 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import List, Callable, Optional, Tuple
+from langchain_core.embeddings import Embeddings
+
+from app.services.llm_gateway import is_retryable
+from app.services.metrics import timed
+
+
+class EmbeddingBatchError(Exception):
+    """部分批次在重试后仍然失败；已成功的批次已经通过回调写入"""
+
+    def __init__(self, failed_ranges: List[Tuple[int, int]], last_error: Exception):
+        self.failed_ranges = failed_ranges
+        self.last_error = last_error
+        super().__init__(f"{len(failed_ranges)} embedding batches failed: {last_error}")
+
+
+class TokenBucket:
+    """令牌桶限流：平均每秒 rate 个请求，允许 capacity 大小的突发"""
+
+    def __init__(self, rate: float, capacity: Optional[float] = None):
+        self.rate = rate
+        self.capacity = capacity or max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+                self._updated = now
+                if self._tokens >= 1:
+                    self._tokens -= 1
+                    return
+                wait = (1 - self._tokens) / self.rate
+            time.sleep(wait)
+
+
+class EmbeddingPipeline:
+    """分批、并发受限、带限流与重试的向量化流水线
+
+    文本按 batch_size 切分，最多 max_in_flight 个批次同时请求，每个请求前
+    从令牌桶取令牌；单个批次失败时按指数退避重试，不影响其他批次。每个批次
+    完成后立即调用 on_batch(start, end, vectors)，调用方在回调中写入向量库，
+    相当于按批次做检查点。只重试临时故障 (超时、429、5xx)，参数错误等直接失败。
+    """
+
+    def __init__(self, embeddings: Embeddings, batch_size: int = 64, max_in_flight: int = 4,
+                 requests_per_second: float = 0, max_retries: int = 5,
+                 backoff_base: float = 1.0, backoff_max: float = 30.0):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.max_in_flight = max_in_flight
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.rate_limiter = TokenBucket(requests_per_second)
+
+    def _embed_batch(self, texts: List[str]) -> List[List[float]]:
+        attempt = 0
+        while True:
+            self.rate_limiter.acquire()
+            try:
+                with timed("embed_documents"):
+                    return self.embeddings.embed_documents(texts)
+            except Exception as e:
+                attempt += 1
+                if attempt > self.max_retries or not is_retryable(e):
+                    raise
+                # 指数退避 + 随机抖动，避免所有批次同时重试 (例如遇到 429)
+                delay = min(self.backoff_max, self.backoff_base * (2 ** (attempt - 1)))
+                delay *= random.uniform(0.5, 1.0)
+                print(f"Embedding batch failed ({e}), retry {attempt}/{self.max_retries} in {delay:.1f}s")
+                time.sleep(delay)
+
+    def run(self, texts: List[str], on_batch: Callable[[int, int, List[List[float]]], None]):
+        """向量化所有文本，按完成顺序回调 on_batch；有批次最终失败时抛出 EmbeddingBatchError"""
+        ranges = [(i, min(i + self.batch_size, len(texts))) for i in range(0, len(texts), self.batch_size)]
+        if not ranges:
+            return
+        
+        failed = []
+        last_error = None
+        with ThreadPoolExecutor(max_workers=min(self.max_in_flight, len(ranges))) as pool:
+            futures = {
+                pool.submit(self._embed_batch, texts[start:end]): (start, end)
+                for start, end in ranges
+            }
+            for future in as_completed(futures):
+                start, end = futures[future]
+                try:
+                    vectors = future.result()
+                except Exception as e:
+                    failed.append((start, end))
+                    last_error = e
+                    continue
+                on_batch(start, end, vectors)
+        
+        if failed:
+            raise EmbeddingBatchError(sorted(failed), last_error)
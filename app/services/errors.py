@@ -0,0 +1,5 @@
+"""不依赖 LangChain 等重量级模块的异常类型，API 层可以直接导入而不拖慢启动"""
+
+
+class LLMQueueTimeoutError(Exception):
+    """等待 LLM 并发名额超时"""
@@ -0,0 +1,153 @@
+import json
+import os
+import shutil
+import tarfile
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+import numpy as np
+
+# 快照格式版本：格式发生不兼容的变化时递增，导入时拒绝更高版本的快照
+SNAPSHOT_FORMAT_VERSION = 1
+
+_HEADER = "snapshot.json"
+_VECTORS = "vectors.npy"
+_CHUNKS = "chunks.jsonl"
+_MANIFEST = "ingest_manifest.json"
+_CHUNK_STORE = "chunk_store.sqlite"
+_MEMBERS = (_HEADER, _VECTORS, _CHUNKS, _MANIFEST, _CHUNK_STORE)
+
+
+class SnapshotError(ValueError):
+    """快照文件损坏、版本不支持或与当前索引配置不兼容"""
+
+
+def write_snapshot(path: str, workdir: str, header: Dict, ids: List[str], vectors: np.ndarray,
+                   texts: List[str], metadatas: List[Optional[Dict]], manifest_files: Dict[str, Dict],
+                   chunk_store_path: str) -> Dict:
+    """把索引内容写成 tar.gz 快照，返回快照头
+
+    归档内容：snapshot.json (格式版本、向量维度、chunk 数等)、vectors.npy (float32 矩阵，
+    行与 chunks.jsonl 一一对应)、chunks.jsonl (ID、正文、元数据)、入库清单与父段落库。
+    workdir 用于存放中间文件；先写临时文件再替换，中途失败不会留下不完整的快照。
+    """
+    if len(ids) != len(vectors):
+        raise SnapshotError(f"{len(ids)} chunks but {len(vectors)} vectors")
+    header = dict(
+        header,
+        format_version=SNAPSHOT_FORMAT_VERSION,
+        created_at=time.time(),
+        count=len(ids),
+        dim=int(vectors.shape[1]) if len(ids) else None
+    )
+
+    np.save(os.path.join(workdir, _VECTORS), np.ascontiguousarray(vectors, dtype=np.float32))
+    with open(os.path.join(workdir, _CHUNKS), "w", encoding="utf-8") as f:
+        for chunk_id, text, metadata in zip(ids, texts, metadatas):
+            f.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata or {}}, ensure_ascii=False) + "\n")
+    with open(os.path.join(workdir, _MANIFEST), "w", encoding="utf-8") as f:
+        json.dump({"files": manifest_files}, f, ensure_ascii=False)
+    with open(os.path.join(workdir, _HEADER), "w", encoding="utf-8") as f:
+        json.dump(header, f, ensure_ascii=False)
+    if os.path.abspath(chunk_store_path) != os.path.join(os.path.abspath(workdir), _CHUNK_STORE):
+        shutil.copyfile(chunk_store_path, os.path.join(workdir, _CHUNK_STORE))
+
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = path + ".tmp"
+    # 快照头放在最前面，读取时可以先校验版本
+    with tarfile.open(tmp_path, "w:gz", compresslevel=6) as tar:
+        for name in _MEMBERS:
+            tar.add(os.path.join(workdir, name), arcname=name)
+    os.replace(tmp_path, path)
+    return header
+
+
+class Snapshot:
+    """解压后的快照，向量以内存映射方式读取，不整体载入内存"""
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.chunk_store_path = os.path.join(directory, _CHUNK_STORE)
+        try:
+            with open(os.path.join(directory, _HEADER), "r", encoding="utf-8") as f:
+                self.header: Dict = json.load(f)
+            with open(os.path.join(directory, _MANIFEST), "r", encoding="utf-8") as f:
+                self.manifest_files: Dict[str, Dict] = json.load(f).get("files", {})
+            self.vectors: Optional[np.ndarray] = None
+            if self.header["count"]:
+                self.vectors = np.load(os.path.join(directory, _VECTORS), mmap_mode="r")
+        except (ValueError, KeyError, OSError) as e:
+            raise SnapshotError(f"Invalid snapshot: {e}") from e
+        if self.vectors is not None and self.vectors.shape != (self.header["count"], self.header["dim"]):
+            raise SnapshotError(f"Vector matrix shape {self.vectors.shape} does not match snapshot header")
+
+    def validate(self):
+        """导入前完整读一遍 chunks.jsonl：每行可解析、字段齐全且行数与快照头一致
+
+        导入会先清空现有索引，必须在那之前发现损坏或截断的快照。
+        """
+        count = 0
+        with open(os.path.join(self.directory, _CHUNKS), "r", encoding="utf-8") as f:
+            for count, line in enumerate(f, 1):
+                try:
+                    chunk = json.loads(line)
+                except ValueError as e:
+                    raise SnapshotError(f"Invalid chunk on line {count}: {e}") from e
+                if not isinstance(chunk, dict) or not {"id", "text", "metadata"} <= chunk.keys():
+                    raise SnapshotError(f"Invalid chunk on line {count}")
+        if count != self.header["count"]:
+            raise SnapshotError(f"Snapshot has {count} chunks, header says {self.header['count']}")
+
+    def iter_batches(self, batch_size: int) -> Iterator[Tuple[List[str], np.ndarray, List[str], List[Optional[Dict]]]]:
+        """按批返回 (ids, 向量, texts, metadatas)"""
+        ids, texts, metadatas = [], [], []
+        start = 0
+        with open(os.path.join(self.directory, _CHUNKS), "r", encoding="utf-8") as f:
+            for line in f:
+                chunk = json.loads(line)
+                ids.append(chunk["id"])
+                texts.append(chunk["text"])
+                # Chroma 不接受空字典形式的元数据
+                metadatas.append(chunk["metadata"] or None)
+                if len(ids) == batch_size:
+                    yield ids, np.asarray(self.vectors[start:start + len(ids)]), texts, metadatas
+                    start += len(ids)
+                    ids, texts, metadatas = [], [], []
+        if ids:
+            yield ids, np.asarray(self.vectors[start:start + len(ids)]), texts, metadatas
+            start += len(ids)
+        if start != self.header["count"]:
+            raise SnapshotError(f"Snapshot has {start} chunks, header says {self.header['count']}")
+
+    def close(self):
+        # 释放内存映射，之后才能删除解压目录
+        self.vectors = None
+
+
+def open_snapshot(path: str, workdir: str) -> Snapshot:
+    """把快照解压到 workdir，校验格式版本、向量矩阵形状与全部 chunk
+
+    只提取已知的成员文件，不信任归档中的路径。
+    """
+    try:
+        with tarfile.open(path, "r:gz") as tar:
+            for name in _MEMBERS:
+                member = tar.extractfile(name)
+                if member is None:
+                    raise SnapshotError(f"Snapshot member {name} is not a regular file")
+                with member, open(os.path.join(workdir, name), "wb") as f:
+                    shutil.copyfileobj(member, f, 1024 * 1024)
+    except (tarfile.TarError, KeyError, EOFError, OSError) as e:
+        raise SnapshotError(f"Invalid snapshot {path}: {e}") from e
+
+    with open(os.path.join(workdir, _HEADER), "r", encoding="utf-8") as f:
+        version = json.load(f).get("format_version")
+    if not isinstance(version, int) or version > SNAPSHOT_FORMAT_VERSION:
+        raise SnapshotError(f"Unsupported snapshot format version {version}")
+    snapshot = Snapshot(workdir)
+    try:
+        snapshot.validate()
+    except BaseException:
+        snapshot.close()
+        raise
+    return snapshot
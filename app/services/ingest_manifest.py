@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import threading
+from typing import List, Dict, Optional
+from langchain_core.documents import Document
+
+
+def hash_file(file_path: str) -> str:
+    """计算文件内容的 sha256"""
+    digest = hashlib.sha256()
+    with open(file_path, "rb") as f:
+        for block in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def make_chunk_ids(source: str, documents: List[Document], seen: Optional[Dict[str, int]] = None) -> List[str]:
+    """根据来源、内容和元数据生成稳定的 chunk ID
+
+    元数据 (页码、start_index/end_index、章节等) 也计入 ID：chunk 位置变化时
+    按新 chunk 重新写入，索引中不会留下过期的位置信息；内容不变的 chunk
+    向量化时命中 Embedding 缓存，不会重复调用远程接口。
+    同一文件中内容相同的 chunk 按出现顺序追加序号，保证 ID 唯一。
+    分批生成时传入同一个 seen 字典，结果与一次性生成一致。
+    """
+    ids = []
+    if seen is None:
+        seen = {}
+    for doc in documents:
+        metadata = json.dumps(doc.metadata, sort_keys=True, ensure_ascii=False, default=str)
+        base = hashlib.sha256(f"{source}\0{doc.page_content}\0{metadata}".encode("utf-8")).hexdigest()[:32]
+        count = seen.get(base, 0)
+        seen[base] = count + 1
+        ids.append(base if count == 0 else f"{base}-{count}")
+    return ids
+
+
+class IngestManifest:
+    """记录已入库文件的内容哈希及其 chunk ID，用于去重和增量更新
+
+    以 JSON 保存在向量库目录下：{"files": {source: {"file_hash": ..., "chunk_ids": [...]}}}
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._lock = threading.Lock()
+        self._files: Dict[str, Dict] = self._load()
+
+    def _load(self) -> Dict[str, Dict]:
+        if not os.path.exists(self.path):
+            return {}
+        try:
+            with open(self.path, "r", encoding="utf-8") as f:
+                return json.load(f).get("files", {})
+        except (OSError, ValueError) as e:
+            # 清单损坏时当作空清单处理，最坏情况是重新向量化
+            print(f"Failed to load ingest manifest {self.path}: {e}")
+            return {}
+
+    def get(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            return self._files.get(source)
+
+    def update(self, source: str, file_hash: str, chunk_ids: List[str]):
+        with self._lock:
+            self._files[source] = {"file_hash": file_hash, "chunk_ids": chunk_ids}
+
+    def sources(self) -> List[str]:
+        with self._lock:
+            return list(self._files)
+
+    def remove(self, source: str) -> Optional[Dict]:
+        with self._lock:
+            return self._files.pop(source, None)
+
+    def clear(self):
+        with self._lock:
+            self._files = {}
+
+    def files(self) -> Dict[str, Dict]:
+        """全部记录的副本，用于导出快照"""
+        with self._lock:
+            return dict(self._files)
+
+    def replace(self, files: Dict[str, Dict]):
+        with self._lock:
+            self._files = dict(files)
+
+    def save(self):
+        """原子写入：先写临时文件再替换"""
+        with self._lock:
+            data = json.dumps({"files": self._files}, ensure_ascii=False)
+        os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+        tmp_path = self.path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            f.write(data)
+        os.replace(tmp_path, self.path)
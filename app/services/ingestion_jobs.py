@@ -0,0 +1,161 @@
+import os
+import queue
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import List, Dict, Any, Optional
+
+from app.core.config import settings
+from app.services.notebook_service import NotebookManager, DEFAULT_NOTEBOOK_ID
+
+
+class JobQueueFullError(Exception):
+    """待处理任务已满，调用方应稍后重试"""
+
+
+class IngestionJob:
+    def __init__(self, file_paths: List[str], notebook_id: str = DEFAULT_NOTEBOOK_ID):
+        self.id = uuid.uuid4().hex
+        self.notebook_id = notebook_id
+        self.file_paths = file_paths
+        self.status = "queued"
+        self.error: Optional[str] = None
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        
+        # 每个文件的处理阶段: queued -> parsing -> indexing -> done / failed
+        self.files: Dict[str, Dict[str, Any]] = {
+            path: {"filename": os.path.basename(path), "status": "queued", "chunks": 0, "error": None}
+            for path in file_paths
+        }
+
+    def to_dict(self) -> Dict[str, Any]:
+        total_chunks = sum(f["chunks"] for f in self.files.values() if f["status"] == "done")
+        
+        elapsed = 0.0
+        if self.started_at:
+            elapsed = (self.finished_at or time.time()) - self.started_at
+        
+        return {
+            "job_id": self.id,
+            "notebook_id": self.notebook_id,
+            "status": self.status,
+            "files": list(self.files.values()),
+            "total_chunks": total_chunks,
+            "elapsed_seconds": round(elapsed, 3),
+            "chunks_per_second": round(total_chunks / elapsed, 2) if elapsed > 0 else 0.0,
+            "error": self.error
+        }
+
+
+class IngestionJobManager:
+    """后台文档入库任务队列
+
+    上传接口只负责保存文件并提交任务，由固定数量的工作线程执行
+    DocumentProcessor -> VectorStoreService 流水线。排队任务数有上限，
+    超出时 submit 抛出 JobQueueFullError，实现背压。上传接口先用 reserve
+    预留名额再保存文件，队列已满时直接拒绝，不会留下没有任务处理的文件。
+    """
+
+    def __init__(self, notebooks: NotebookManager, num_workers: int = None,
+                 max_pending: int = None, max_finished: int = None):
+        self.notebooks = notebooks
+        num_workers = num_workers or settings.JOB_WORKERS
+        self.max_finished = max_finished or settings.MAX_FINISHED_JOBS
+        self.max_pending = max_pending or settings.MAX_PENDING_JOBS
+        
+        # 队列本身不设上限，排队数 (含已预留的名额) 由 max_pending 控制
+        self._queue: "queue.Queue[Optional[IngestionJob]]" = queue.Queue()
+        self._reserved = 0
+        self._jobs: "OrderedDict[str, IngestionJob]" = OrderedDict()
+        self._lock = threading.Lock()
+        
+        self._workers = [
+            threading.Thread(target=self._worker_loop, name=f"ingest-job-{i}", daemon=True)
+            for i in range(num_workers)
+        ]
+        for worker in self._workers:
+            worker.start()
+
+    def _check_capacity(self):
+        if self._queue.qsize() + self._reserved >= self.max_pending:
+            raise JobQueueFullError("Too many pending ingestion jobs, please retry later")
+
+    def reserve(self):
+        """预留一个排队名额，之后必须调用 submit(..., reserved=True) 或 release"""
+        with self._lock:
+            self._check_capacity()
+            self._reserved += 1
+
+    def release(self):
+        """归还未使用的预留名额"""
+        with self._lock:
+            self._reserved -= 1
+
+    def submit(self, file_paths: List[str], notebook_id: str = DEFAULT_NOTEBOOK_ID,
+               reserved: bool = False) -> IngestionJob:
+        """提交入库任务，立即返回；reserved 为 True 时使用之前预留的名额"""
+        job = IngestionJob(file_paths, notebook_id)
+        with self._lock:
+            if reserved:
+                self._reserved -= 1
+            else:
+                self._check_capacity()
+            self._queue.put_nowait(job)
+            self._jobs[job.id] = job
+            self._evict_finished()
+        return job
+
+    def get(self, job_id: str) -> Optional[IngestionJob]:
+        with self._lock:
+            return self._jobs.get(job_id)
+
+    def shutdown(self):
+        """通知工作线程退出 (不等待正在执行的任务)"""
+        for _ in self._workers:
+            self._queue.put_nowait(None)
+
+    def _evict_finished(self):
+        """只保留最近 max_finished 个已结束的任务记录"""
+        finished = [job_id for job_id, job in self._jobs.items() if job.finished_at is not None]
+        for job_id in finished[:max(0, len(finished) - self.max_finished)]:
+            del self._jobs[job_id]
+
+    def _worker_loop(self):
+        while True:
+            job = self._queue.get()
+            if job is None:
+                break
+            try:
+                self._run_job(job)
+            finally:
+                self._queue.task_done()
+
+    def _run_job(self, job: IngestionJob):
+        job.status = "running"
+        job.started_at = time.time()
+        
+        def on_progress(path: str, stage: str, chunks: int, error: Optional[Exception]):
+            progress = job.files[path]
+            progress["status"] = stage
+            progress["chunks"] = chunks
+            if error is not None:
+                progress["error"] = str(error)
+        
+        try:
+            # 单个文件失败不影响同一任务中的其他文件
+            with self.notebooks.use(job.notebook_id) as chat_service:
+                indexed = chat_service.index_files(job.file_paths, on_progress=on_progress)
+        except Exception as e:
+            print(f"Ingestion job {job.id} failed: {e}")
+            indexed = {}
+            job.error = str(e)
+        
+        job.finished_at = time.time()
+        if not indexed and job.file_paths:
+            job.status = "failed"
+            job.error = job.error or "All files failed to index"
+        else:
+            job.status = "completed"
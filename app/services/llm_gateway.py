@@ -0,0 +1,437 @@
+import asyncio
+import hashlib
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, AsyncIterator, Awaitable, Callable, Dict, Iterator, List, Optional
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from app.services.errors import LLMQueueTimeoutError
+from app.services.metrics import observe_stage, LLM_GATEWAY_EVENTS
+
+# 视为临时故障、值得重试的 HTTP 状态码 (google.api_core 异常的 code 属性即为 HTTP 状态码)
+_RETRYABLE_STATUS = {408, 429, 500, 502, 503, 504}
+
+
+class _LeaderCancelled(Exception):
+    """合并请求的发起方被取消，等待同一结果的其他调用方需要自己重新发起"""
+
+
+def is_retryable(error: BaseException) -> bool:
+    """超时、连接错误和 408/429/5xx 视为临时故障
+
+    langchain_google_genai 会把原始异常包装成 GoogleGenerativeAIError，因此沿 __cause__ 逐层检查。
+    """
+    while error is not None:
+        if isinstance(error, (ConnectionError, TimeoutError)):
+            return True
+        code = getattr(error, "code", None)
+        # grpc 异常的 code 是方法，google.api_core 的是 HTTP 状态码
+        if not callable(code) and isinstance(code, int) and code in _RETRYABLE_STATUS:
+            return True
+        error = error.__cause__
+    return False
+
+
+def backoff_delay(attempt: int, base: float, maximum: float) -> float:
+    """full jitter 指数退避：在 [0, min(maximum, base * 2^attempt)] 内均匀取值，避免重试同步涌入"""
+    return random.uniform(0, min(maximum, base * (2 ** attempt)))
+
+
+class _Waiter:
+    __slots__ = ("notify", "granted")
+
+    def __init__(self, notify: Callable[[], None]):
+        self.notify = notify
+        self.granted = False
+
+
+class ConcurrencyLimiter:
+    """同步与异步调用共用的并发上限
+
+    名额用完后按 FIFO 排队，释放的名额直接交给队首；排队超过 queue_timeout 秒
+    抛出 LLMQueueTimeoutError (0 表示一直等待)。limit <= 0 表示不限制。
+    """
+
+    def __init__(self, limit: int, queue_timeout: float = 0):
+        self.limit = limit
+        self.queue_timeout = queue_timeout
+        self._active = 0
+        self._waiters = deque()
+        self._lock = threading.Lock()
+
+    def _acquire_or_enqueue(self, waiter: Optional[_Waiter]) -> bool:
+        with self._lock:
+            if self._active < self.limit and not self._waiters:
+                self._active += 1
+                return True
+            if waiter is not None:
+                self._waiters.append(waiter)
+            return False
+
+    def _abandon(self, waiter: _Waiter) -> bool:
+        """放弃排队；返回 True 表示在放弃前已经拿到名额"""
+        with self._lock:
+            if waiter.granted:
+                return True
+            self._waiters.remove(waiter)
+            return False
+
+    def try_acquire(self) -> bool:
+        """不排队：有空闲名额且没有人在排队时才占用"""
+        if self.limit <= 0:
+            return True
+        return self._acquire_or_enqueue(None)
+
+    def acquire(self):
+        if self.limit <= 0:
+            return
+        event = threading.Event()
+        waiter = _Waiter(event.set)
+        if self._acquire_or_enqueue(waiter):
+            return
+        start = time.perf_counter()
+        event.wait(self.queue_timeout or None)
+        if not self._abandon(waiter):
+            LLM_GATEWAY_EVENTS.inc(event="queue_timeout")
+            raise LLMQueueTimeoutError(f"Timed out after {self.queue_timeout}s waiting for an LLM slot")
+        observe_stage("llm_queue_wait", time.perf_counter() - start)
+
+    async def aacquire(self):
+        if self.limit <= 0:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def notify():
+            loop.call_soon_threadsafe(lambda: future.done() or future.set_result(None))
+
+        waiter = _Waiter(notify)
+        if self._acquire_or_enqueue(waiter):
+            return
+        start = time.perf_counter()
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout or None)
+        except asyncio.TimeoutError:
+            if not self._abandon(waiter):
+                LLM_GATEWAY_EVENTS.inc(event="queue_timeout")
+                raise LLMQueueTimeoutError(f"Timed out after {self.queue_timeout}s waiting for an LLM slot")
+        except asyncio.CancelledError:
+            # 取消时名额可能刚好交过来，需要还回去
+            if self._abandon(waiter):
+                self.release()
+            raise
+        observe_stage("llm_queue_wait", time.perf_counter() - start)
+
+    def release(self):
+        if self.limit <= 0:
+            return
+        with self._lock:
+            while self._waiters:
+                waiter = self._waiters.popleft()
+                try:
+                    waiter.notify()
+                except RuntimeError:
+                    # 等待方的事件循环已关闭，交给下一个
+                    continue
+                waiter.granted = True
+                return
+            self._active -= 1
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {"limit": self.limit, "active": self._active, "waiting": len(self._waiters)}
+
+
+class LLMGateway:
+    """LLM 调用网关：并发上限与排队、相同请求合并、带抖动的重试、对冲请求
+
+    - 并发：同时进行的调用不超过 max_concurrency，其余排队，排队超时报错
+    - 合并：完全相同的非流式请求 (如同一问题的改写、同一问题的回答) 正在进行时，
+      后来者等待同一个结果，不再重复调用
+    - 重试：连接错误、超时、429/5xx 按 full jitter 指数退避重试；
+      流式调用只在尚未输出任何片段时重试
+    - 对冲：hedge_delay > 0 时，非流式调用超过该时间仍未返回且有空闲名额，
+      再发一个相同请求，取先成功的结果 (异步调用会取消较慢的一个)
+    """
+
+    def __init__(self, max_concurrency: int = 16, queue_timeout: float = 30.0, coalesce: bool = True,
+                 max_retries: int = 3, backoff_base: float = 0.5, backoff_max: float = 8.0,
+                 hedge_delay: float = 0.0):
+        self.limiter = ConcurrencyLimiter(max_concurrency, queue_timeout)
+        self.coalesce = coalesce
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_delay = hedge_delay
+
+        self._inflight: Dict[str, Future] = {}
+        self._lock = threading.Lock()
+        # 同步对冲请求需要在线程中执行，慢的一方无法取消，完成后自行释放名额
+        self._pool = None
+        if hedge_delay > 0:
+            self._pool = ThreadPoolExecutor(
+                max_workers=max(max_concurrency, 8) * 2,
+                thread_name_prefix="llm-hedge"
+            )
+
+    # ---------- 合并 ----------
+
+    def _join(self, key: str):
+        """返回 (future, 是否为发起方)"""
+        with self._lock:
+            future = self._inflight.get(key)
+            if future is None:
+                future = self._inflight[key] = Future()
+                return future, True
+            return future, False
+
+    def _finish(self, key: str, future: Future, result: Any = None, error: BaseException = None):
+        with self._lock:
+            self._inflight.pop(key, None)
+        if error is not None:
+            future.set_exception(error if isinstance(error, Exception) else _LeaderCancelled())
+        else:
+            future.set_result(result)
+
+    def generate(self, key: str, call: Callable[[], ChatResult]) -> ChatResult:
+        if not self.coalesce:
+            return self._generate_with_retries(call)
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                LLM_GATEWAY_EVENTS.inc(event="coalesced")
+                try:
+                    # 每个调用方拿到独立副本，LangChain 会在结果上写入各自的 run id
+                    return future.result().model_copy(deep=True)
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = self._generate_with_retries(call)
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result)
+            return result
+
+    async def agenerate(self, key: str, acall: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        if not self.coalesce:
+            return await self._agenerate_with_retries(acall)
+        while True:
+            future, leader = self._join(key)
+            if not leader:
+                LLM_GATEWAY_EVENTS.inc(event="coalesced")
+                try:
+                    # shield：等待方被取消时不能连带取消共享的 future
+                    result = await asyncio.shield(asyncio.wrap_future(future))
+                    return result.model_copy(deep=True)
+                except _LeaderCancelled:
+                    continue
+            try:
+                result = await self._agenerate_with_retries(acall)
+            except BaseException as e:
+                self._finish(key, future, error=e)
+                raise
+            self._finish(key, future, result)
+            return result
+
+    # ---------- 重试 ----------
+
+    def _should_retry(self, error: Exception, attempt: int) -> bool:
+        if attempt >= self.max_retries or not is_retryable(error):
+            return False
+        LLM_GATEWAY_EVENTS.inc(event="retry")
+        print(f"LLM call failed ({type(error).__name__}: {error}), retrying ({attempt + 1}/{self.max_retries})")
+        return True
+
+    def _generate_with_retries(self, call: Callable[[], ChatResult]) -> ChatResult:
+        attempt = 0
+        while True:
+            try:
+                return self._hedged(call)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+            time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    async def _agenerate_with_retries(self, acall: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        attempt = 0
+        while True:
+            try:
+                return await self._ahedged(acall)
+            except Exception as e:
+                if not self._should_retry(e, attempt):
+                    raise
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    # ---------- 对冲 ----------
+
+    def _run_and_release(self, call: Callable[[], ChatResult]) -> ChatResult:
+        try:
+            return call()
+        finally:
+            self.limiter.release()
+
+    def _hedged(self, call: Callable[[], ChatResult]) -> ChatResult:
+        self.limiter.acquire()
+        if self._pool is None:
+            return self._run_and_release(call)
+
+        primary = self._pool.submit(self._run_and_release, call)
+        done, _ = wait([primary], timeout=self.hedge_delay)
+        # 对冲请求只使用空闲名额，不与排队中的请求抢
+        if done or not self.limiter.try_acquire():
+            return primary.result()
+
+        LLM_GATEWAY_EVENTS.inc(event="hedge")
+        hedge = self._pool.submit(self._run_and_release, call)
+        pending, error = {primary, hedge}, None
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                if future.exception() is None:
+                    if future is hedge:
+                        LLM_GATEWAY_EVENTS.inc(event="hedge_won")
+                    return future.result()
+                error = future.exception()
+        raise error
+
+    async def _arun_and_release(self, acall: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        try:
+            return await acall()
+        finally:
+            self.limiter.release()
+
+    async def _ahedged(self, acall: Callable[[], Awaitable[ChatResult]]) -> ChatResult:
+        await self.limiter.aacquire()
+        if self.hedge_delay <= 0:
+            return await self._arun_and_release(acall)
+
+        primary = asyncio.ensure_future(self._arun_and_release(acall))
+        done, _ = await asyncio.wait({primary}, timeout=self.hedge_delay)
+        if done or not self.limiter.try_acquire():
+            return await primary
+
+        LLM_GATEWAY_EVENTS.inc(event="hedge")
+        hedge = asyncio.ensure_future(self._arun_and_release(acall))
+        try:
+            pending, error = {primary, hedge}, None
+            while pending:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is hedge:
+                            LLM_GATEWAY_EVENTS.inc(event="hedge_won")
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            # 取消较慢的一方，名额在其 finally 中释放
+            primary.cancel()
+            hedge.cancel()
+
+    # ---------- 流式 ----------
+
+    def stream(self, start: Callable[[], Iterator[ChatGenerationChunk]]) -> Iterator[ChatGenerationChunk]:
+        attempt = 0
+        while True:
+            emitted = False
+            self.limiter.acquire()
+            try:
+                for chunk in start():
+                    emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                # 已经输出的片段无法撤回，之后的错误直接抛出
+                if emitted or not self._should_retry(e, attempt):
+                    raise
+            finally:
+                self.limiter.release()
+            time.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    async def astream(self, start: Callable[[], AsyncIterator[ChatGenerationChunk]]) -> AsyncIterator[ChatGenerationChunk]:
+        attempt = 0
+        while True:
+            emitted = False
+            await self.limiter.aacquire()
+            try:
+                async for chunk in start():
+                    emitted = True
+                    yield chunk
+                return
+            except Exception as e:
+                if emitted or not self._should_retry(e, attempt):
+                    raise
+            finally:
+                self.limiter.release()
+            await asyncio.sleep(backoff_delay(attempt, self.backoff_base, self.backoff_max))
+            attempt += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            inflight = len(self._inflight)
+        return {**self.limiter.stats(), "coalescing": inflight, "hedge_delay": self.hedge_delay}
+
+    def close(self):
+        if self._pool is not None:
+            self._pool.shutdown(wait=False)
+
+
+def prompt_key(messages: List[BaseMessage], stop: Optional[List[str]], kwargs: Dict[str, Any]) -> str:
+    """请求合并的键：消息类型与内容、stop 以及其他调用参数"""
+    parts = [repr([(message.type, message.content) for message in messages]), repr(stop),
+             repr(sorted(kwargs.items()))]
+    return hashlib.sha256("\x00".join(parts).encode("utf-8")).hexdigest()
+
+
+class GatewayChatModel(BaseChatModel):
+    """把任意对话模型包装为经过 LLMGateway 的模型，可直接用于 LangChain chain
+
+    回调 (耗时、token 统计) 挂在这一层，每次逻辑调用只记录一次，
+    重试和对冲产生的底层调用不重复计数。
+    """
+
+    llm: Any
+    gateway: Any
+
+    @property
+    def _llm_type(self) -> str:
+        return f"gateway-{self.llm._llm_type}"
+
+    @property
+    def _identifying_params(self) -> Dict[str, Any]:
+        return self.llm._identifying_params
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return self.gateway.generate(
+            prompt_key(messages, stop, kwargs),
+            lambda: self.llm._generate(messages, stop=stop, **kwargs)
+        )
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        return await self.gateway.agenerate(
+            prompt_key(messages, stop, kwargs),
+            lambda: self.llm._agenerate(messages, stop=stop, **kwargs)
+        )
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        # 新 token 回调由 BaseChatModel.stream 负责触发
+        yield from self.gateway.stream(lambda: self.llm._stream(messages, stop=stop, **kwargs))
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        async for chunk in self.gateway.astream(lambda: self.llm._astream(messages, stop=stop, **kwargs)):
+            yield chunk
@@ -1,19 +1,39 @@
-from langchain_google_genai import ChatGoogleGenerativeAI
 from app.core.config import settings
+from app.services.metrics import MetricsCallbackHandler
+from app.services.llm_gateway import LLMGateway, GatewayChatModel
 
 class LLMService:
     def __init__(self):
         if not settings.GEMINI_API_KEY:
             raise ValueError("GEMINI_API_KEY is not set")
 
-        self.llm = ChatGoogleGenerativeAI(
+        # 延迟导入：google.generativeai 相关模块导入耗时较长
+        from langchain_google_genai import ChatGoogleGenerativeAI
+
+        llm = ChatGoogleGenerativeAI(
             model=settings.GEMINI_MODEL,
             temperature=settings.GEMINI_TEMPERATURE,
             max_tokens=settings.GEMINI_MAX_TOKENS,
             google_api_key=settings.GEMINI_API_KEY,
-            convert_system_message_to_human=True # Gemini 早期版本有时需要这个
+            convert_system_message_to_human=True, # Gemini 早期版本有时需要这个
+            max_retries=1 # 重试统一由网关处理 (带抖动的退避、只在输出前重试流式请求)
+        )
+
+        # 所有笔记本共享同一个网关：并发上限、排队、请求合并、重试与对冲
+        self.gateway = LLMGateway(
+            max_concurrency=settings.LLM_MAX_CONCURRENCY,
+            queue_timeout=settings.LLM_QUEUE_TIMEOUT,
+            coalesce=settings.LLM_COALESCE,
+            max_retries=settings.LLM_MAX_RETRIES,
+            backoff_base=settings.LLM_BACKOFF_BASE,
+            backoff_max=settings.LLM_BACKOFF_MAX,
+            hedge_delay=settings.LLM_HEDGE_DELAY
+        )
+        self.llm = GatewayChatModel(
+            llm=llm,
+            gateway=self.gateway,
+            callbacks=[MetricsCallbackHandler()] # 记录每次调用的耗时与 token 用量
         )
 
     def get_llm(self):
         return self.llm
-
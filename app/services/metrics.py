@@ -0,0 +1,245 @@
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Any, Dict, List, Optional, Tuple
+from uuid import UUID
+from langchain_core.callbacks import BaseCallbackHandler
+from langchain_core.outputs import LLMResult
+
+from app.core.config import settings
+
+# 延迟类指标的默认分桶 (秒)
+LATENCY_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+# 数量类指标的默认分桶
+COUNT_BUCKETS = (0, 1, 2, 5, 10, 20, 50, 100, 200, 500, 1000)
+TOKEN_BUCKETS = (0, 100, 250, 500, 1000, 2000, 4000, 8000, 16000, 32000, 64000)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == int(value):
+        return str(int(value))
+    return repr(value)
+
+
+class Counter:
+    """单调递增计数器"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[Tuple[str, ...], float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """累积分桶直方图，输出格式与 Prometheus client 一致"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = LATENCY_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets))
+        # key -> [各分桶计数..., +Inf 计数, sum]
+        self._values: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels.get(name, "")) for name in self.labelnames)
+        index = bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._values.get(key)
+            if series is None:
+                series = self._values[key] = [0] * (len(self.buckets) + 2)
+            series[index] += 1
+            series[-1] += value
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._values.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets, series):
+                    cumulative += count
+                    le = f'le="{_format_value(bound)}"'
+                    lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+                cumulative += series[len(self.buckets)]
+                labels = _format_labels(self.labelnames, key)
+                inf_labels = _format_labels(self.labelnames, key, 'le="+Inf"')
+                lines.append(f"{self.name}_bucket{inf_labels} {cumulative}")
+                lines.append(f"{self.name}_sum{labels} {_format_value(series[-1])}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics: List[Any] = []
+
+    def register(self, metric):
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        """Prometheus 文本格式 (version 0.0.4)"""
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+registry = MetricsRegistry()
+
+STAGE_LATENCY = registry.register(Histogram(
+    "rag_stage_latency_seconds", "Latency of each RAG pipeline stage", ("stage",)
+))
+HTTP_LATENCY = registry.register(Histogram(
+    "rag_http_request_duration_seconds", "HTTP request latency", ("method", "path", "status")
+))
+TIME_TO_FIRST_TOKEN = registry.register(Histogram(
+    "rag_time_to_first_token_seconds", "Time from request start to the first streamed answer token"
+))
+RETRIEVED_CHUNKS = registry.register(Histogram(
+    "rag_retrieved_chunks", "Chunks per query before and after context packing", ("phase",), COUNT_BUCKETS
+))
+LLM_TOKENS = registry.register(Counter(
+    "rag_llm_tokens_total", "LLM tokens reported by the model", ("call", "kind")
+))
+CONTEXT_TOKENS = registry.register(Counter(
+    "rag_context_tokens_total", "Estimated tokens of context sent to the QA prompt"
+))
+CONTEXT_TOKENS_SAVED = registry.register(Histogram(
+    "rag_context_tokens_saved", "Tokens per query removed by context packing (retrieved minus packed)",
+    buckets=TOKEN_BUCKETS
+))
+INGESTED_CHUNKS = registry.register(Counter(
+    "rag_ingested_chunks_total", "Chunks written to the index"
+))
+ANSWER_CACHE_LOOKUPS = registry.register(Counter(
+    "rag_answer_cache_lookups_total", "Semantic answer cache lookups", ("result",)
+))
+LLM_GATEWAY_EVENTS = registry.register(Counter(
+    "rag_llm_gateway_events_total", "LLM gateway retries, hedges, coalesced calls and queue timeouts", ("event",)
+))
+
+
+# 当前请求的阶段耗时 (秒)；由 start_trace 在请求入口设置，contextvars 保证并发请求互不干扰
+_current_trace: ContextVar[Optional[Dict[str, float]]] = ContextVar("rag_stage_trace", default=None)
+
+
+def start_trace() -> Dict[str, float]:
+    """开始记录当前请求的阶段耗时，返回会被后续各阶段填充的字典"""
+    trace: Dict[str, float] = {}
+    _current_trace.set(trace)
+    return trace
+
+
+def observe_stage(stage: str, seconds: float):
+    if not settings.METRICS_ENABLED:
+        return
+    STAGE_LATENCY.observe(seconds, stage=stage)
+    trace = _current_trace.get()
+    if trace is not None:
+        # 同一阶段可能执行多次 (如并行检索)，累加耗时
+        trace[stage] = trace.get(stage, 0.0) + seconds
+
+
+def observe_first_token(seconds: float):
+    """流式回答的首 token 延迟"""
+    if not settings.METRICS_ENABLED:
+        return
+    TIME_TO_FIRST_TOKEN.observe(seconds)
+    trace = _current_trace.get()
+    if trace is not None:
+        trace["time_to_first_token"] = seconds
+
+
+@contextmanager
+def timed(stage: str):
+    """记录代码块耗时到 rag_stage_latency_seconds 与当前请求的 trace"""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - start)
+
+
+def format_server_timing(trace: Dict[str, float]) -> str:
+    """转换为 Server-Timing 响应头，单位毫秒"""
+    return ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in trace.items())
+
+
+class MetricsCallbackHandler(BaseCallbackHandler):
+    """LangChain 回调：记录每次 LLM 调用的耗时和 token 用量
+
+    调用类型取自 tags (rewrite / summary)，未标记的视为回答生成 (generate)。
+    """
+
+    # 在触发回调的线程/协程内直接执行，才能访问到当前请求的 trace
+    run_inline = True
+
+    def __init__(self):
+        self._runs: Dict[UUID, Tuple[float, str]] = {}
+        self._lock = threading.Lock()
+
+    def _start(self, run_id: UUID, tags: Optional[List[str]]):
+        call = "generate"
+        for tag in tags or ():
+            if tag in ("rewrite", "summary"):
+                call = tag
+        with self._lock:
+            self._runs[run_id] = (time.perf_counter(), call)
+
+    def on_chat_model_start(self, serialized, messages, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs):
+        self._start(run_id, tags)
+
+    def on_llm_start(self, serialized, prompts, *, run_id: UUID, tags: Optional[List[str]] = None, **kwargs):
+        self._start(run_id, tags)
+
+    def on_llm_end(self, response: LLMResult, *, run_id: UUID, **kwargs):
+        with self._lock:
+            started = self._runs.pop(run_id, None)
+        if started is None:
+            return
+        start, call = started
+        observe_stage(f"llm_{call}", time.perf_counter() - start)
+
+        input_tokens = output_tokens = 0
+        for generations in response.generations:
+            for generation in generations:
+                usage = getattr(getattr(generation, "message", None), "usage_metadata", None) or {}
+                input_tokens += usage.get("input_tokens", 0)
+                output_tokens += usage.get("output_tokens", 0)
+        if input_tokens or output_tokens:
+            LLM_TOKENS.inc(input_tokens, call=call, kind="input")
+            LLM_TOKENS.inc(output_tokens, call=call, kind="output")
+
+    def on_llm_error(self, error: BaseException, *, run_id: UUID, **kwargs):
+        with self._lock:
+            self._runs.pop(run_id, None)
@@ -0,0 +1,341 @@
+import json
+import os
+import re
+import shutil
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future
+from contextlib import contextmanager
+from typing import List, Dict, Any, Iterator, Optional, Tuple, TYPE_CHECKING
+
+from app.core.config import settings
+
+if TYPE_CHECKING:
+    from app.services.chat_service import ChatService
+    from app.services.session_store import SessionStore
+
+DEFAULT_NOTEBOOK_ID = "default"
+
+_NOTEBOOK_ID_RE = re.compile(r"^[A-Za-z0-9_-]{1,64}$")
+
+
+class NotebookNotFoundError(KeyError):
+    """笔记本不存在"""
+
+
+class NotebookBusyError(RuntimeError):
+    """笔记本正在被请求、入库任务或目录监听使用，暂时不能删除"""
+
+
+class NotebookManager:
+    """笔记本管理：每个笔记本拥有独立的向量索引、BM25 索引与入库清单
+
+    默认笔记本沿用原有的 VECTOR_DB_DIR 与 COLLECTION_NAME，其他笔记本保存在
+    VECTOR_DB_DIR/notebooks/<id> 下。每个笔记本的 ChatService (检索器、chain、
+    答案缓存) 在首次访问时创建，并按 LRU 最多保留 max_loaded 个，
+    不活跃的笔记本会被释放。Embedding 客户端、LLM 与文档处理器在所有笔记本间共享。
+
+    使用 ChatService 期间必须固定 (acquire/release 或 use)：被请求、入库任务或目录监听
+    固定的笔记本不会被释放，用完后才按 LRU 释放。会话存储由管理器持有，不随
+    ChatService 释放而丢失。
+
+    管理器的锁只保护内部字典：创建与关闭 ChatService 都在锁外进行，同一笔记本的
+    并发请求等待同一次加载，加载慢的笔记本不会阻塞其他笔记本和 /health。
+    acquire/release 可能阻塞，异步接口应在线程池中调用。
+
+    构造本身很轻：LangChain / Gemini 相关模块和客户端在首次使用时才导入和创建，
+    或由 start_warm_up 在后台线程中提前完成，服务启动后可以立即响应 /health。
+    """
+
+    def __init__(self, max_loaded: int = None):
+        self.max_loaded = max_loaded or settings.MAX_LOADED_NOTEBOOKS
+        self.registry_path = os.path.join(settings.VECTOR_DB_DIR, "notebooks.json")
+        
+        settings.ensure_directories()
+        self._lock = threading.RLock()
+        self._notebooks: Dict[str, Dict[str, Any]] = self._load_registry()
+        self._loaded: "OrderedDict[str, ChatService]" = OrderedDict()
+        # 每个笔记本被固定的次数，以及正在关闭的笔记本 (关闭完成前不重新创建)
+        self._pins: Dict[str, int] = {}
+        self._closing: Dict[str, threading.Event] = {}
+        # 正在创建的笔记本，同一笔记本的并发请求等待同一次加载
+        self._loading: Dict[str, Future] = {}
+        self._session_stores: Dict[str, "SessionStore"] = {}
+        # 正在删除的笔记本，acquire 直接失败
+        self._deleting: set = set()
+        
+        # 共享组件，首次使用时创建 (导入依赖、创建客户端较慢，使用单独的锁)
+        self._shared: Optional[Dict[str, Any]] = None
+        self._shared_lock = threading.Lock()
+        
+        # 预热状态：lazy (未预热，首次请求时初始化) / warming_up / ready / failed
+        self.warm_up_status = "lazy"
+        self.warm_up_error: Optional[str] = None
+        self.warm_up_seconds: Optional[float] = None
+
+    def _shared_components(self) -> Dict[str, Any]:
+        with self._shared_lock:
+            if self._shared is None:
+                from app.services.document_processor import DocumentProcessor
+                from app.services.llm_service import LLMService
+                from app.services.vector_store import create_embeddings, create_embedding_pipeline
+                
+                embeddings = create_embeddings()
+                self._shared = {
+                    "embeddings": embeddings,
+                    "embedding_pipeline": create_embedding_pipeline(embeddings),
+                    "llm_service": LLMService(),
+                    "doc_processor": DocumentProcessor()
+                }
+            return self._shared
+
+    def warm_up(self):
+        """导入依赖、创建共享客户端并加载默认笔记本的检索链"""
+        self.warm_up_status = "warming_up"
+        start = time.perf_counter()
+        try:
+            with self.use(DEFAULT_NOTEBOOK_ID) as service:
+                service.warm_up()
+        except Exception as e:
+            self.warm_up_status = "failed"
+            self.warm_up_error = str(e)
+            print(f"Warm-up failed: {e}")
+            return
+        self.warm_up_seconds = time.perf_counter() - start
+        self.warm_up_status = "ready"
+        print(f"Warm-up finished in {self.warm_up_seconds:.2f}s")
+
+    def start_warm_up(self) -> threading.Thread:
+        """在后台线程中预热，不阻塞服务启动"""
+        self.warm_up_status = "warming_up"
+        thread = threading.Thread(target=self.warm_up, name="notebook-warm-up", daemon=True)
+        thread.start()
+        return thread
+
+    def _load_registry(self) -> Dict[str, Dict[str, Any]]:
+        notebooks = {}
+        if os.path.exists(self.registry_path):
+            with open(self.registry_path, "r", encoding="utf-8") as f:
+                notebooks = json.load(f).get("notebooks", {})
+        notebooks.setdefault(DEFAULT_NOTEBOOK_ID, {"id": DEFAULT_NOTEBOOK_ID, "name": "Default", "created_at": 0})
+        return notebooks
+
+    def _save_registry(self):
+        tmp_path = self.registry_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump({"notebooks": self._notebooks}, f, ensure_ascii=False)
+        os.replace(tmp_path, self.registry_path)
+
+    def _notebook_directory(self, notebook_id: str) -> str:
+        if notebook_id == DEFAULT_NOTEBOOK_ID:
+            return settings.VECTOR_DB_DIR
+        return os.path.join(settings.VECTOR_DB_DIR, "notebooks", notebook_id)
+
+    def upload_directory(self, notebook_id: str) -> str:
+        """笔记本的上传目录，避免不同笔记本的同名文件互相覆盖"""
+        self._get_notebook(notebook_id)
+        if notebook_id == DEFAULT_NOTEBOOK_ID:
+            return settings.UPLOAD_DIR
+        path = os.path.join(settings.UPLOAD_DIR, notebook_id)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def _get_notebook(self, notebook_id: str) -> Dict[str, Any]:
+        with self._lock:
+            notebook = self._notebooks.get(notebook_id)
+        if notebook is None:
+            raise NotebookNotFoundError(notebook_id)
+        return notebook
+
+    def create(self, name: str) -> Dict[str, Any]:
+        notebook = {"id": uuid.uuid4().hex[:12], "name": name, "created_at": time.time()}
+        with self._lock:
+            self._notebooks[notebook["id"]] = notebook
+            self._save_registry()
+        return notebook
+
+    def list(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            return sorted(self._notebooks.values(), key=lambda nb: nb["created_at"])
+
+    def _session_store(self, notebook_id: str) -> "SessionStore":
+        """笔记本的会话存储 (SQLite 后端时每个笔记本一个数据库文件)"""
+        with self._lock:
+            store = self._session_stores.get(notebook_id)
+            if store is None:
+                from app.services.session_store import SessionStore, MemorySessionBackend, SQLiteSessionBackend
+                
+                if settings.SESSION_BACKEND == "sqlite":
+                    path = settings.SESSION_SQLITE_PATH
+                    if notebook_id != DEFAULT_NOTEBOOK_ID:
+                        path = os.path.join(self._notebook_directory(notebook_id), "sessions.sqlite")
+                    backend = SQLiteSessionBackend(path)
+                else:
+                    backend = MemorySessionBackend(max_sessions=settings.SESSION_MAX_SESSIONS)
+                store = SessionStore(backend, ttl_seconds=settings.SESSION_TTL_SECONDS)
+                self._session_stores[notebook_id] = store
+            return store
+
+    def _create_service(self, notebook_id: str) -> "ChatService":
+        from app.services.chat_service import ChatService
+        from app.services.vector_store import VectorStoreService
+        
+        shared = self._shared_components()
+        vector_store = VectorStoreService(
+            persist_directory=self._notebook_directory(notebook_id),
+            collection_name=settings.COLLECTION_NAME,
+            embeddings=shared["embeddings"],
+            embedding_pipeline=shared["embedding_pipeline"]
+        )
+        # 新副本冷启动：默认笔记本为空时从快照导入，不需要重新向量化
+        if notebook_id == DEFAULT_NOTEBOOK_ID and settings.BOOTSTRAP_SNAPSHOT and vector_store.backend.count() == 0:
+            vector_store.import_snapshot(settings.BOOTSTRAP_SNAPSHOT)
+        return ChatService(
+            vector_store=vector_store,
+            llm_service=shared["llm_service"],
+            doc_processor=shared["doc_processor"],
+            sessions=self._session_store(notebook_id)
+        )
+
+    def acquire(self, notebook_id: str = DEFAULT_NOTEBOOK_ID) -> "ChatService":
+        """获取并固定笔记本的 ChatService，首次访问时创建；用完后必须调用 release"""
+        if not _NOTEBOOK_ID_RE.match(notebook_id or ""):
+            raise NotebookNotFoundError(notebook_id)
+        
+        while True:
+            with self._lock:
+                # 等待加载或关闭期间笔记本可能已被删除
+                if notebook_id in self._deleting or notebook_id not in self._notebooks:
+                    raise NotebookNotFoundError(notebook_id)
+                service = self._loaded.get(notebook_id)
+                if service is not None:
+                    self._loaded.move_to_end(notebook_id)
+                    self._pins[notebook_id] = self._pins.get(notebook_id, 0) + 1
+                    return service
+                closing = self._closing.get(notebook_id)
+                loading = self._loading.get(notebook_id)
+                if closing is None and loading is None:
+                    loading = self._loading[notebook_id] = Future()
+                    break
+            if closing is not None:
+                # 上一个实例还在落盘，等它关闭后再创建，避免两个实例同时写同一个目录
+                closing.wait()
+            else:
+                # 其他请求正在创建，等它完成后重新获取；创建失败时抛出同样的异常
+                loading.result()
+        
+        # 在锁外创建，只有同一笔记本的请求需要等待
+        try:
+            service = self._create_service(notebook_id)
+        except BaseException as e:
+            with self._lock:
+                del self._loading[notebook_id]
+            loading.set_exception(e)
+            raise
+        with self._lock:
+            del self._loading[notebook_id]
+            self._loaded[notebook_id] = service
+            self._pins[notebook_id] = self._pins.get(notebook_id, 0) + 1
+            evicted = self._take_evictable()
+        loading.set_result(None)
+        self._close_services(evicted)
+        return service
+
+    def release(self, notebook_id: str):
+        """取消一次固定；超出 max_loaded 时释放不再使用的笔记本"""
+        with self._lock:
+            pins = self._pins.get(notebook_id, 0) - 1
+            if pins > 0:
+                self._pins[notebook_id] = pins
+            else:
+                self._pins.pop(notebook_id, None)
+            evicted = self._take_evictable()
+        self._close_services(evicted)
+
+    @contextmanager
+    def use(self, notebook_id: str = DEFAULT_NOTEBOOK_ID) -> Iterator["ChatService"]:
+        service = self.acquire(notebook_id)
+        try:
+            yield service
+        finally:
+            self.release(notebook_id)
+
+    def _take_evictable(self) -> List[Tuple[str, "ChatService", threading.Event]]:
+        """超出 max_loaded 时从最久未使用的开始取出未被固定的笔记本 (需持有 _lock)"""
+        evicted = []
+        for notebook_id in list(self._loaded):
+            if len(self._loaded) <= self.max_loaded:
+                break
+            if self._pins.get(notebook_id):
+                continue
+            done = threading.Event()
+            self._closing[notebook_id] = done
+            evicted.append((notebook_id, self._loaded.pop(notebook_id), done))
+        return evicted
+
+    def _close_services(self, evicted: List[Tuple[str, "ChatService", threading.Event]]):
+        """在锁外关闭被释放的笔记本 (落盘可能较慢)"""
+        for notebook_id, service, done in evicted:
+            print(f"Releasing inactive notebook {notebook_id}")
+            try:
+                service.close()
+            except Exception as e:
+                print(f"Failed to close notebook {notebook_id}: {e}")
+            finally:
+                with self._lock:
+                    if self._closing.get(notebook_id) is done:
+                        del self._closing[notebook_id]
+                done.set()
+
+    def clear(self, notebook_id: str):
+        """只清空指定笔记本的知识库"""
+        with self.use(notebook_id) as service:
+            service.clear_knowledge_base()
+
+    def delete(self, notebook_id: str):
+        """删除笔记本及其索引、会话和上传文件
+
+        仍被固定或正在加载的笔记本抛出 NotebookBusyError；标记删除后新的 acquire 直接失败。
+        """
+        if notebook_id == DEFAULT_NOTEBOOK_ID:
+            raise ValueError("The default notebook cannot be deleted")
+        with self._lock:
+            if notebook_id in self._deleting or notebook_id not in self._notebooks:
+                raise NotebookNotFoundError(notebook_id)
+            if self._pins.get(notebook_id) or notebook_id in self._loading:
+                raise NotebookBusyError(f"Notebook {notebook_id} is in use")
+            self._deleting.add(notebook_id)
+            service = self._loaded.pop(notebook_id, None)
+            closing = self._closing.get(notebook_id)
+            sessions = self._session_stores.pop(notebook_id, None)
+            del self._notebooks[notebook_id]
+            self._save_registry()
+        try:
+            # 被 LRU 释放的实例可能还在落盘，等它关闭后再删除目录
+            if closing is not None:
+                closing.wait()
+            if service is not None:
+                service.close()
+            if sessions is not None:
+                sessions.close()
+            shutil.rmtree(self._notebook_directory(notebook_id), ignore_errors=True)
+            shutil.rmtree(os.path.join(settings.UPLOAD_DIR, notebook_id), ignore_errors=True)
+        finally:
+            with self._lock:
+                self._deleting.discard(notebook_id)
+
+    def close(self):
+        with self._lock:
+            services = list(self._loaded.values())
+            self._loaded.clear()
+            self._pins.clear()
+            stores = list(self._session_stores.values())
+            self._session_stores.clear()
+        for service in services:
+            service.close()
+        for store in stores:
+            store.close()
+        if self._shared is not None:
+            self._shared["doc_processor"].close()
@@ -0,0 +1,181 @@
+import asyncio
+import re
+import threading
+from collections import OrderedDict
+from typing import Any, List, Tuple
+from langchain_core.messages import BaseMessage
+from langchain_core.output_parsers import StrOutputParser
+from langchain_core.prompts import ChatPromptTemplate, MessagesPlaceholder
+from langchain_core.runnables import RunnableLambda
+from langchain_core.runnables.config import run_in_executor
+from langchain_core.documents import Document
+
+CONTEXTUALIZE_Q_SYSTEM_PROMPT = (
+    "Given a chat history and the latest user question "
+    "which might reference context in the chat history, "
+    "formulate a standalone question which can be understood "
+    "without the chat history. Do NOT answer the question, "
+    "just reformulate it if needed and otherwise return it as is."
+)
+
+# 指代或承接上文的词：出现这些词时问题通常依赖历史记录
+_EN_REFERENCE_RE = re.compile(
+    r"\b(it|its|this|that|these|those|they|them|their|he|him|his|she|her|"
+    r"above|previous|earlier|former|latter|same|also|else|more|again|another|other)\b",
+    re.IGNORECASE
+)
+_EN_FOLLOW_UP_RE = re.compile(r"^\s*(and|but|so|what about|how about|why|then)\b", re.IGNORECASE)
+_ZH_REFERENCE_RE = re.compile(r"[它他她其该此这那]|上面|上述|前面|刚才|之前|继续|还有|为什么|呢[？?]?\s*$")
+
+
+def _normalize(text: str) -> str:
+    return " ".join(text.lower().split()).rstrip("?？。.!！")
+
+
+class QueryRewriter:
+    """历史感知的问题改写，替代 create_history_aware_retriever
+
+    - 快速路径：问题不含指代/承接词 (本地启发式判断) 时跳过改写，直接检索
+    - 只把最近 history_turns 条消息发给 LLM，LRU 缓存也按 (这些消息, 问题) 作为键
+    - 并行检索 (仅异步路径)：缓存未命中时，改写的同时用原问题检索，若改写结果
+      与原问题相同则直接复用这次检索结果
+    """
+
+    def __init__(self, llm, cache_size: int = 512, history_turns: int = 6,
+                 skip_self_contained: bool = True, parallel_retrieval: bool = True):
+        prompt = ChatPromptTemplate.from_messages(
+            [
+                ("system", CONTEXTUALIZE_Q_SYSTEM_PROMPT),
+                MessagesPlaceholder("chat_history"),
+                ("human", "{input}"),
+            ]
+        )
+        self.rewrite_chain = prompt | llm.with_config(tags=["rewrite"]) | StrOutputParser()
+        self.cache_size = cache_size
+        self.history_turns = history_turns
+        self.skip_self_contained = skip_self_contained
+        self.parallel_retrieval = parallel_retrieval
+        
+        self._cache: "OrderedDict[Tuple, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.skipped = 0
+        self.cache_hits = 0
+        self.llm_calls = 0
+
+    def needs_rewrite(self, question: str, chat_history: List[BaseMessage]) -> bool:
+        if not chat_history:
+            return False
+        if not self.skip_self_contained:
+            return True
+        if len(question.split()) <= 3 and not re.search(r"[一-鿿]{6,}", question):
+            return True
+        return bool(
+            _EN_REFERENCE_RE.search(question)
+            or _EN_FOLLOW_UP_RE.search(question)
+            or _ZH_REFERENCE_RE.search(question)
+        )
+
+    def _recent(self, chat_history: List[BaseMessage]) -> List[BaseMessage]:
+        """改写时发送给 LLM 的历史消息"""
+        return chat_history[-self.history_turns:] if self.history_turns > 0 else chat_history
+
+    def _cache_key(self, question: str, recent: List[BaseMessage]) -> Tuple:
+        return tuple((msg.type, msg.content) for msg in recent) + (("question", question.strip()),)
+
+    def _cache_get(self, key: Tuple):
+        with self._lock:
+            if key in self._cache:
+                self._cache.move_to_end(key)
+                self.cache_hits += 1
+                return self._cache[key]
+        return None
+
+    def _cache_put(self, key: Tuple, value: str):
+        with self._lock:
+            self._cache[key] = value
+            self._cache.move_to_end(key)
+            while len(self._cache) > self.cache_size:
+                self._cache.popitem(last=False)
+
+    def rewrite(self, question: str, chat_history: List[BaseMessage]) -> str:
+        if not self.needs_rewrite(question, chat_history):
+            self.skipped += bool(chat_history)
+            return question
+        recent = self._recent(chat_history)
+        key = self._cache_key(question, recent)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        self.llm_calls += 1
+        rewritten = self.rewrite_chain.invoke({"input": question, "chat_history": recent}).strip() or question
+        self._cache_put(key, rewritten)
+        return rewritten
+
+    async def arewrite(self, question: str, chat_history: List[BaseMessage]) -> str:
+        if not self.needs_rewrite(question, chat_history):
+            self.skipped += bool(chat_history)
+            return question
+        recent = self._recent(chat_history)
+        key = self._cache_key(question, recent)
+        cached = self._cache_get(key)
+        if cached is not None:
+            return cached
+        self.llm_calls += 1
+        rewritten = (await self.rewrite_chain.ainvoke({"input": question, "chat_history": recent})).strip() or question
+        self._cache_put(key, rewritten)
+        return rewritten
+
+    def as_retriever(self, retriever: Any) -> RunnableLambda:
+        """返回接收 {"input", "chat_history"} 并输出文档列表的 Runnable，用于 create_retrieval_chain
+
+        输入中带 "query_embedding" 且问题无需改写时，用该向量检索，不再重新计算。
+        """
+
+        def retrieve(inputs: dict, config=None) -> List[Document]:
+            question = inputs["input"]
+            query = self.rewrite(question, inputs.get("chat_history") or [])
+            embedding = inputs.get("query_embedding")
+            # 未改写的问题直接使用调用方已经算好的查询向量
+            if embedding is not None and query == question:
+                return retriever.retrieve_batch([query], [embedding])[0]
+            return retriever.invoke(query, config=config)
+
+        async def aretrieve(inputs: dict, config=None) -> List[Document]:
+            question = inputs["input"]
+            chat_history = inputs.get("chat_history") or []
+            embedding = inputs.get("query_embedding")
+            
+            if embedding is not None and not self.needs_rewrite(question, chat_history):
+                self.skipped += bool(chat_history)
+                return (await run_in_executor(config, retriever.retrieve_batch, [question], [embedding]))[0]
+            
+            if not (self.parallel_retrieval and self.needs_rewrite(question, chat_history)):
+                query = await self.arewrite(question, chat_history)
+                return await retriever.ainvoke(query, config=config)
+            
+            # 缓存命中时不需要投机检索
+            cached = self._cache_get(self._cache_key(question, self._recent(chat_history)))
+            if cached is not None:
+                return await retriever.ainvoke(cached, config=config)
+            
+            # 投机检索：改写与原问题检索同时进行
+            raw_task = asyncio.ensure_future(retriever.ainvoke(question, config=config))
+            try:
+                query = await self.arewrite(question, chat_history)
+            except BaseException:
+                raw_task.cancel()
+                raise
+            if _normalize(query) == _normalize(question):
+                return await raw_task
+            raw_task.cancel()
+            return await retriever.ainvoke(query, config=config)
+
+        return RunnableLambda(retrieve, afunc=aretrieve, name="history_aware_retriever")
+
+    def stats(self) -> dict:
+        return {
+            "skipped": self.skipped,
+            "cache_hits": self.cache_hits,
+            "llm_calls": self.llm_calls,
+            "cache_entries": len(self._cache)
+        }
@@ -0,0 +1,62 @@
+from typing import Any, List, Optional
+from langchain_core.callbacks import CallbackManagerForRetrieverRun
+from langchain_core.retrievers import BaseRetriever
+from langchain_core.documents import Document
+
+from app.services.metrics import timed
+
+
+def reciprocal_rank_fusion(result_lists: List[List[Document]], k: int, rrf_k: int = 60) -> List[Document]:
+    """倒数排名融合：score = Σ 1 / (rrf_k + rank)，按 (来源, 内容) 去重"""
+    scores = {}
+    docs = {}
+    for results in result_lists:
+        for rank, doc in enumerate(results, start=1):
+            key = (doc.metadata.get("source"), doc.page_content)
+            scores[key] = scores.get(key, 0.0) + 1.0 / (rrf_k + rank)
+            docs.setdefault(key, doc)
+    
+    ranked = sorted(scores, key=scores.get, reverse=True)[:k]
+    return [docs[key] for key in ranked]
+
+
+class DenseRetriever(BaseRetriever):
+    """向量相似度检索"""
+
+    vector_store: Any
+    k: int = 10
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        return self.vector_store.similarity_search(query, k=self.k)
+
+    def retrieve_batch(self, queries: List[str], embeddings: Optional[List[List[float]]] = None) -> List[List[Document]]:
+        """批量检索，结果顺序与 queries 一致"""
+        return self.vector_store.similarity_search_batch(queries, self.k, embeddings)
+
+
+class HybridRetriever(BaseRetriever):
+    """混合检索：向量相似度检索 + BM25 关键词检索，用 RRF 融合排序
+
+    启用父子分块时两路结果都先换成父段落并去重，融合与截断按父段落进行。
+    """
+
+    vector_store: Any
+    k: int = 10
+    fetch_k: int = 30
+    rrf_k: int = 60
+
+    def _get_relevant_documents(self, query: str, *, run_manager: CallbackManagerForRetrieverRun) -> List[Document]:
+        dense = self.vector_store.similarity_search(query, k=self.fetch_k)
+        with timed("lexical_search"):
+            lexical = self.vector_store.lexical_search(query, self.fetch_k)
+        return reciprocal_rank_fusion([dense, lexical], self.k, self.rrf_k)
+
+    def retrieve_batch(self, queries: List[str], embeddings: Optional[List[List[float]]] = None) -> List[List[Document]]:
+        """批量检索：向量检索一次完成，BM25 逐条执行后分别融合"""
+        dense = self.vector_store.similarity_search_batch(queries, self.fetch_k, embeddings)
+        results = []
+        with timed("lexical_search_batch"):
+            for query, dense_docs in zip(queries, dense):
+                lexical = self.vector_store.lexical_search(query, self.fetch_k)
+                results.append(reciprocal_rank_fusion([dense_docs, lexical], self.k, self.rrf_k))
+        return results
@@ -0,0 +1,181 @@
+import json
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Dict, Any, Optional
+
+# 会话级锁的分段数：同一会话的读改写互斥，不同会话大多互不影响
+_LOCK_STRIPES = 64
+
+
+class SessionNotFoundError(KeyError):
+    """会话不存在或已过期"""
+
+
+def _copy_session(session: Dict[str, Any]) -> Dict[str, Any]:
+    # 轮次字典写入后不再修改，复制列表即可
+    return dict(session, turns=list(session["turns"]))
+
+
+class MemorySessionBackend:
+    """进程内会话存储，读写都复制一份，调用方拿到的会话不与其他请求共享"""
+
+    def __init__(self, max_sessions: int = 10000):
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            session = self._sessions.get(session_id)
+            if session is None:
+                return None
+            self._sessions.move_to_end(session_id)
+            return _copy_session(session)
+
+    def save(self, session: Dict[str, Any]):
+        with self._lock:
+            self._sessions[session["id"]] = _copy_session(session)
+            self._sessions.move_to_end(session["id"])
+            while len(self._sessions) > self.max_sessions:
+                self._sessions.popitem(last=False)
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+    def evict_expired(self, before: float):
+        with self._lock:
+            expired = [sid for sid, s in self._sessions.items() if s["updated_at"] < before]
+            for sid in expired:
+                del self._sessions[sid]
+
+    def close(self):
+        pass
+
+
+class SQLiteSessionBackend:
+    def __init__(self, path: str):
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS sessions ("
+            "id TEXT PRIMARY KEY, data TEXT NOT NULL, updated_at REAL NOT NULL)"
+        )
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_sessions_updated ON sessions(updated_at)")
+        self._conn.commit()
+
+    def get(self, session_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            row = self._conn.execute("SELECT data FROM sessions WHERE id = ?", (session_id,)).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def save(self, session: Dict[str, Any]):
+        with self._lock:
+            self._conn.execute(
+                "INSERT OR REPLACE INTO sessions (id, data, updated_at) VALUES (?, ?, ?)",
+                (session["id"], json.dumps(session, ensure_ascii=False), session["updated_at"])
+            )
+            self._conn.commit()
+
+    def delete(self, session_id: str) -> bool:
+        with self._lock:
+            cursor = self._conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+            self._conn.commit()
+            return cursor.rowcount > 0
+
+    def evict_expired(self, before: float):
+        with self._lock:
+            self._conn.execute("DELETE FROM sessions WHERE updated_at < ?", (before,))
+            self._conn.commit()
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+class SessionStore:
+    """服务端会话存储，超过 ttl_seconds 未活动的会话被淘汰
+
+    会话结构: {"id", "turns": [{"role", "content"}], "summary", "summarized_turns", "updated_at"}
+    已合并进摘要的轮次会从 turns 中删除。修改会话的操作 (append_turn / apply_summary)
+    在会话级锁内完成读改写，同一会话的并发请求不会互相覆盖。
+    """
+
+    def __init__(self, backend, ttl_seconds: float = 86400):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self._last_eviction = 0.0
+        self._locks = [threading.Lock() for _ in range(_LOCK_STRIPES)]
+
+    def _lock_for(self, session_id: str) -> threading.Lock:
+        return self._locks[hash(session_id) % _LOCK_STRIPES]
+
+    def _maybe_evict(self):
+        now = time.time()
+        if now - self._last_eviction > min(60.0, self.ttl_seconds):
+            self._last_eviction = now
+            self.backend.evict_expired(now - self.ttl_seconds)
+
+    def create(self) -> Dict[str, Any]:
+        self._maybe_evict()
+        session = {
+            "id": uuid.uuid4().hex,
+            "turns": [],
+            "summary": "",
+            "summarized_turns": 0,
+            "updated_at": time.time()
+        }
+        self.backend.save(session)
+        return session
+
+    def get(self, session_id: str) -> Dict[str, Any]:
+        self._maybe_evict()
+        session = self.backend.get(session_id)
+        if session is None or time.time() - session["updated_at"] > self.ttl_seconds:
+            raise SessionNotFoundError(session_id)
+        return session
+
+    def save(self, session: Dict[str, Any]):
+        session["updated_at"] = time.time()
+        self.backend.save(session)
+
+    def append_turn(self, session_id: str, question: str, answer: str) -> Dict[str, Any]:
+        """追加一轮问答并保存，返回更新后的会话"""
+        with self._lock_for(session_id):
+            session = self.get(session_id)
+            session["turns"].append({"role": "user", "content": question})
+            session["turns"].append({"role": "assistant", "content": answer})
+            self.save(session)
+            return session
+
+    def apply_summary(self, session_id: str, previous_summary: str, start: int, summary: str) -> bool:
+        """用新摘要替换 turns[:start]
+
+        previous_summary 是生成新摘要时依据的旧摘要；期间会话已被其他摘要任务
+        更新或已删除时放弃本次结果，返回 False。
+        """
+        with self._lock_for(session_id):
+            try:
+                session = self.get(session_id)
+            except SessionNotFoundError:
+                return False
+            if session["summary"] != previous_summary:
+                return False
+            session["summary"] = summary
+            session["turns"] = session["turns"][start:]
+            session["summarized_turns"] = 0
+            self.save(session)
+            return True
+
+    def delete(self, session_id: str):
+        if not self.backend.delete(session_id):
+            raise SessionNotFoundError(session_id)
+
+    def close(self):
+        self.backend.close()
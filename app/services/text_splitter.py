@@ -0,0 +1,211 @@
+import re
+from typing import Callable, Dict, List, Optional, Tuple
+from langchain_core.documents import Document
+
+from app.services.context_packer import estimate_tokens, get_encoding
+
+# 分割点的优先级，数值越小越适合作为 chunk 边界
+HEADING, PARAGRAPH, LINE, SENTENCE, CLAUSE, WORD = range(6)
+
+# 结构扫描：每个换行处检查其后是否为空行、Markdown 标题 (空行后紧跟的标题一并匹配)。
+# 以换行字面量开头的正则可以走快速查找，比在每个位置尝试各分支快数倍
+_STRUCTURE_RE = re.compile(
+    r"\n(?P<blank>[ \t]*\n\s*)?"
+    r"(?:^(?P<marks>#{1,6})[ \t]+(?P<title>[^\n]*?)[ \t#]*$)?",
+    re.MULTILINE
+)
+
+# 超过 chunk_size 的片段依次按这些规则细分 (在匹配结束处切开)：换行、中英文句末、分句标点、空白
+_FINER_BOUNDARIES = [
+    (re.compile(r"\n"), LINE),
+    (re.compile(r"(?:[。！？]+[”’」』）]*|[.!?]+[\"'”’)\]]*(?=\s))\s*"), SENTENCE),
+    (re.compile(r"(?:[，、；：]|[,;:](?=\s))\s*"), CLAUSE),
+    (re.compile(r"\s+"), WORD),
+]
+
+# 分割结果：(起始字符, 结束字符, 所属章节)
+_Span = Tuple[int, int, str]
+
+
+class StructuredTokenSplitter:
+    """按 token 数分割文本的单遍扫描分割器
+
+    先按 Markdown 标题和空行把文本扫描成段落，每段统计一次 token 数；超过 chunk_size 的段落
+    再依次按换行、句末 (包括 。！？ 等中文标点)、分句标点、空白细分，仍然过长的按字符等分。
+    之后顺序装箱：片段累计超过 chunk_size 时，在后半段中优先级最高的分割点处切开，
+    chunk 之间按 chunk_overlap 个 token 重叠。不像 RecursiveCharacterTextSplitter 那样
+    把合并后的文本反复交给下一级分隔符重切，只有超长的片段才会被更细的规则再扫描。
+
+    Markdown 标题总是开始新的 chunk，chunk 不会跨越章节；同一来源的多个文档
+    (如 PDF 各页) 分别切分，页边界同样不会被跨越，章节标题则沿用到后续页面。
+    每个 chunk 的元数据带有 section (标题路径，如 "安装 > 配置")，以及在所属文档中的
+    字符偏移 start_index / end_index (page_content == 原文[start_index:end_index])。
+
+    token 数按 cl100k_base 统计；编码文件不可用时按 CJK 字符 1 token、其余 4 字符/token 估算。
+    """
+
+    def __init__(self, chunk_size: int = 300, chunk_overlap: int = 50,
+                 length_function: Optional[Callable[[str], int]] = None):
+        if chunk_overlap >= chunk_size:
+            raise ValueError(f"chunk_overlap ({chunk_overlap}) must be smaller than chunk_size ({chunk_size})")
+        self.chunk_size = chunk_size
+        self.chunk_overlap = chunk_overlap
+        if length_function is None:
+            encoding = get_encoding()
+            if encoding is None:
+                length_function = estimate_tokens
+            else:
+                length_function = lambda text: len(encoding.encode_ordinary(text))
+        self.length_function = length_function
+
+    def _scan(self, text: str, headings: List[str]) -> Tuple[List[int], List[int], List[str]]:
+        """按标题和空行切分，返回每段的起始位置、起始处分割点的优先级与所属章节
+
+        headings 是当前的标题路径 (按级别)，扫描过程中原地更新，供同一来源的下一个文档沿用。
+        """
+        section = " > ".join(filter(None, headings))
+        starts, levels, sections = [0], [HEADING], [section]
+        # 前面补一个换行，文本开头的标题也能匹配；位置相应减一
+        for match in _STRUCTURE_RE.finditer("\n" + text):
+            marks = match.group("marks")
+            if marks:
+                depth = len(marks)
+                del headings[depth - 1:]
+                headings.extend([""] * (depth - 1 - len(headings)))
+                headings.append(match.group("title").strip())
+                section = " > ".join(filter(None, headings))
+                position, level = match.start("marks") - 1, HEADING
+            elif match.group("blank") is not None:
+                position, level = match.end() - 1, PARAGRAPH
+            else:
+                continue
+            if position >= len(text):
+                continue
+            if position == starts[-1]:
+                # 文本以标题或空行开头：取优先级更高的分割点
+                levels[-1] = min(levels[-1], level)
+                sections[-1] = section
+                continue
+            starts.append(position)
+            levels.append(level)
+            sections.append(section)
+        return starts, levels, sections
+
+    def _subdivide(self, text: str, start: int, end: int, tokens: int, level: int,
+                   rung: int = 0) -> List[Tuple[int, int, int]]:
+        """把超过 chunk_size 的片段按更细的分割点切开，返回 (起始位置, token 数, 优先级)
+
+        第一段沿用片段原有的优先级；rung 为下一个尝试的细分规则，切出的片段仍超长时继续往下细分。
+        """
+        if tokens <= self.chunk_size or end - start <= 1:
+            return [(start, tokens, level)]
+        while rung < len(_FINER_BOUNDARIES):
+            pattern, piece_level = _FINER_BOUNDARIES[rung]
+            rung += 1
+            offsets = [start] + [
+                match.end() for match in pattern.finditer(text, start, end) if start < match.end() < end
+            ]
+            if len(offsets) > 1:
+                break
+        else:
+            # 没有可用的分割点 (如无空格的长段中文)：按字符等分
+            piece_level = WORD
+            step = -(-(end - start) // -(-tokens // self.chunk_size))
+            offsets = list(range(start, end, step))
+        pieces = []
+        for i, offset in enumerate(offsets):
+            piece_end = offsets[i + 1] if i + 1 < len(offsets) else end
+            pieces.extend(self._subdivide(
+                text, offset, piece_end, self.length_function(text[offset:piece_end]),
+                level if i == 0 else piece_level, rung
+            ))
+        return pieces
+
+    def _pack(self, levels: List[int], prefix: List[int]) -> List[Tuple[int, int]]:
+        """顺序装箱，返回每个 chunk 的片段区间 [first, end)"""
+        count = len(levels)
+        size, overlap = self.chunk_size, self.chunk_overlap
+        chunks = []
+        first = 0
+        while first < count:
+            end = first + 1
+            while end < count and levels[end] != HEADING and prefix[end + 1] - prefix[first] <= size:
+                end += 1
+            if end < count and levels[end] != HEADING:
+                # 超出预算：在已装入部分的后半段中找优先级最高的分割点，同级取最靠后的
+                best = end
+                for cut in range(end - 1, first, -1):
+                    if prefix[cut] - prefix[first] < size / 2:
+                        break
+                    if levels[cut] < levels[best]:
+                        best = cut
+                end = best
+            chunks.append((first, end))
+            if end >= count or levels[end] == HEADING:
+                first = end
+                continue
+            # 重叠：从切点向前回退整片段，下一个 chunk 至少还能装下切点处的片段
+            next_first = end
+            while (next_first - 1 > first and prefix[end] - prefix[next_first - 1] <= overlap
+                   and prefix[end + 1] - prefix[next_first - 1] <= size):
+                next_first -= 1
+            first = next_first
+        return chunks
+
+    def split_spans(self, text: str, headings: Optional[List[str]] = None) -> List[_Span]:
+        """返回每个 chunk 的 (起始字符, 结束字符, 章节)，已去掉首尾空白"""
+        if headings is None:
+            headings = []
+        starts, levels, sections = self._scan(text, headings)
+        ends = starts[1:] + [len(text)]
+        tokens = [self.length_function(text[start:end]) for start, end in zip(starts, ends)]
+        if max(tokens, default=0) > self.chunk_size:
+            refined = [
+                (offset, count, piece_level, section)
+                for start, end, count, level, section in zip(starts, ends, tokens, levels, sections)
+                for offset, count, piece_level in self._subdivide(text, start, end, count, level)
+            ]
+            starts, tokens, levels, sections = (list(column) for column in zip(*refined))
+            ends = starts[1:] + [len(text)]
+
+        prefix = [0]
+        for count in tokens:
+            prefix.append(prefix[-1] + count)
+
+        spans = []
+        for first, end in self._pack(levels, prefix):
+            start, stop = starts[first], ends[end - 1]
+            chunk = text[start:stop]
+            stripped = chunk.strip()
+            if not stripped:
+                continue
+            start += len(chunk) - len(chunk.lstrip())
+            spans.append((start, start + len(stripped), sections[first]))
+        return spans
+
+    def split_text(self, text: str) -> List[str]:
+        return [text[start:end] for start, end, _ in self.split_spans(text)]
+
+    def split_documents(self, documents: List[Document],
+                        headings_by_source: Optional[Dict[str, List[str]]] = None) -> List[Document]:
+        """分割文档，chunk 元数据带 section 与 start_index / end_index
+
+        文档元数据中已有 start_index 时 (大文本分块读取的起始字符)，chunk 偏移在其基础上累加。
+        分批调用时传入同一个 headings_by_source，标题路径在批次之间延续。
+        """
+        chunks = []
+        # 同一来源的标题路径延续到后续文档 (如 PDF 的下一页)
+        if headings_by_source is None:
+            headings_by_source = {}
+        for doc in documents:
+            headings = headings_by_source.setdefault(doc.metadata.get("source", ""), [])
+            text = doc.page_content
+            base = doc.metadata.get("start_index", 0)
+            for start, end, section in self.split_spans(text, headings):
+                metadata = dict(doc.metadata)
+                if section:
+                    metadata["section"] = section
+                metadata["start_index"] = base + start
+                metadata["end_index"] = base + end
+                chunks.append(Document(page_content=text[start:end], metadata=metadata))
+        return chunks
@@ -0,0 +1,18 @@
+import os
+from app.services.vector_backends.base import VectorBackend
+
+
+def create_backend(backend_type: str, persist_directory: str, collection_name: str, **options) -> VectorBackend:
+    """按 vector_store.type 创建向量索引后端
+
+    后端模块在这里才导入，未使用的后端 (尤其是 chromadb) 不会拖慢启动。
+    """
+    if backend_type == "chroma":
+        from app.services.vector_backends.chroma_backend import ChromaBackend
+        return ChromaBackend(persist_directory, collection_name)
+    if backend_type == "numpy":
+        from app.services.vector_backends.numpy_backend import NumpyBackend
+        return NumpyBackend(os.path.join(persist_directory, collection_name), **options)
+    raise ValueError(f"Unsupported vector store type: {backend_type}")
+
+__all__ = ["VectorBackend", "create_backend"]
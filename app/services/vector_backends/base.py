@@ -0,0 +1,51 @@
+from abc import ABC, abstractmethod
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+
+class VectorBackend(ABC):
+    """向量索引后端接口
+
+    只负责存取已经计算好的向量；Embedding、BM25、清单等由 VectorStoreService 管理。
+    """
+
+    @abstractmethod
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+               metadatas: List[Optional[Dict]]):
+        """写入或覆盖向量"""
+
+    @abstractmethod
+    def delete(self, ids: List[str]):
+        """按 chunk ID 删除"""
+
+    @abstractmethod
+    def search(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        """按查询向量返回最相似的 k 个 chunk 及其分数，按相似度从高到低排列"""
+
+    def search_batch(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        """一次检索多个查询向量，结果与逐个调用 search 相同 (默认逐个执行，后端可覆盖为批量实现)"""
+        return [self.search(embedding, k) for embedding in embeddings]
+
+    @abstractmethod
+    def get(self, ids: List[str]) -> List[Document]:
+        """按 chunk ID 读取正文与元数据，按 ids 的顺序返回，不存在的 ID 跳过"""
+
+    @abstractmethod
+    def get_all(self) -> Tuple[List[str], List[str], List[Optional[Dict]]]:
+        """返回全部 (ids, texts, metadatas)"""
+
+    @abstractmethod
+    def export(self) -> Tuple[List[str], np.ndarray, List[str], List[Optional[Dict]]]:
+        """返回全部 (ids, 向量矩阵 float32, texts, metadatas)，用于导出快照"""
+
+    @abstractmethod
+    def count(self) -> int:
+        """当前 chunk 数"""
+
+    @abstractmethod
+    def clear(self):
+        """删除全部数据"""
+
+    def persist(self):
+        """将缓冲中的数据落盘 (默认无操作)"""
@@ -0,0 +1,80 @@
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from langchain_community.vectorstores import Chroma
+from langchain_core.documents import Document
+
+from app.services.vector_backends.base import VectorBackend
+
+
+class ChromaBackend(VectorBackend):
+    """基于 Chroma 的向量索引 (默认后端)"""
+
+    def __init__(self, persist_directory: str, collection_name: str):
+        self.persist_directory = persist_directory
+        self.collection_name = collection_name
+        self.store = self._open()
+
+    def _open(self) -> Chroma:
+        # 向量由 VectorStoreService 计算后写入，这里不需要 embedding_function
+        return Chroma(
+            persist_directory=self.persist_directory,
+            collection_name=self.collection_name
+        )
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+               metadatas: List[Optional[Dict]]):
+        self.store._collection.upsert(ids=ids, embeddings=embeddings, documents=texts, metadatas=metadatas)
+
+    def delete(self, ids: List[str]):
+        self.store.delete(ids=ids)
+
+    def search(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        if self.count() == 0:
+            return []
+        return self.store.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+
+    def search_batch(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        if self.count() == 0:
+            return [[] for _ in embeddings]
+        # 一次 query 调用检索全部查询向量；分数与 search 一致，为距离值
+        results = self.store._collection.query(
+            query_embeddings=embeddings, n_results=k, include=["documents", "metadatas", "distances"]
+        )
+        return [
+            [
+                (Document(page_content=text, metadata=metadata or {}), distance)
+                for text, metadata, distance in zip(texts, metadatas, distances)
+            ]
+            for texts, metadatas, distances in zip(results["documents"], results["metadatas"], results["distances"])
+        ]
+
+    def get(self, ids: List[str]) -> List[Document]:
+        if not ids:
+            return []
+        results = self.store._collection.get(ids=ids, include=["documents", "metadatas"])
+        found = {
+            chunk_id: Document(page_content=text, metadata=metadata or {})
+            for chunk_id, text, metadata in zip(results["ids"], results["documents"], results["metadatas"])
+        }
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Optional[Dict]]]:
+        results = self.store._collection.get(include=["documents", "metadatas"])
+        return results["ids"], results["documents"], results["metadatas"]
+
+    def export(self) -> Tuple[List[str], np.ndarray, List[str], List[Optional[Dict]]]:
+        results = self.store._collection.get(include=["embeddings", "documents", "metadatas"])
+        if not results["ids"]:
+            return [], np.zeros((0, 0), dtype=np.float32), [], []
+        vectors = np.asarray(results["embeddings"], dtype=np.float32)
+        return results["ids"], vectors, results["documents"], results["metadatas"]
+
+    def count(self) -> int:
+        return self.store._collection.count()
+
+    def clear(self):
+        self.store.delete_collection()
+        self.store = self._open()
+
+    def persist(self):
+        self.store.persist()
@@ -0,0 +1,516 @@
+import json
+import os
+import shutil
+import sqlite3
+import threading
+from typing import List, Dict, Optional, Tuple
+import numpy as np
+from langchain_core.documents import Document
+
+from app.services.vector_backends.base import VectorBackend
+
+# 暴力搜索时每次参与计算的行数，控制临时内存
+_BLOCK_ROWS = 65536
+
+
+class _IndexView:
+    """检索时在锁内取出的索引状态引用，打分在锁外进行
+
+    写入只追加新行并替换这些引用，不修改已有数组；压缩或清空会改变行号，
+    用 generation 判断读取正文时行号是否仍然有效。
+    """
+    __slots__ = ("vectors", "scales", "alive", "centroids", "lists", "rows", "generation")
+
+    def __init__(self, vectors, scales, alive, centroids, lists, rows, generation):
+        self.vectors = vectors
+        self.scales = scales
+        self.alive = alive
+        self.centroids = centroids
+        self.lists = lists
+        self.rows = rows
+        self.generation = generation
+
+
+class NumpyBackend(VectorBackend):
+    """基于内存映射 NumPy 矩阵的本地向量索引
+
+    目录结构：
+    - vectors.bin：归一化后的向量，float32 或 int8 (按行量化)，np.memmap 只读映射，
+      启动时不需要整体加载到内存
+    - scales.bin：int8 模式下每行的反量化系数 (float32)
+    - chunks.sqlite：chunk ID / 文本 / 元数据，row 对应矩阵行号
+    - ivf_centroids.npy + ivf_assign.bin：可选的 IVF 分区 (聚类中心与每行所属分区)
+    - header.json：维度、行数、量化方式、数据文件代号
+
+    删除只打墓碑标记，墓碑超过一半时 persist() 会压缩重写文件。压缩写到新代号的
+    数据文件 (如 vectors.1.bin)，SQLite 中行号重排与新代号在同一事务提交后才切换，
+    旧文件随后删除；提交前退出时仍使用旧文件，提交后 header 未更新时以 SQLite 为准。
+    写入时向量直接追加到文件，SQLite 提交与 header 更新推迟到 persist() 一起完成
+    (分组提交)；崩溃后以 header 为准，多出的行在下次写入前截断。
+    """
+
+    def __init__(self, directory: str, quantization: str = "float32", ivf_lists: int = 0,
+                 ivf_nprobe: int = 8):
+        if quantization not in ("float32", "int8"):
+            raise ValueError(f"Unsupported quantization: {quantization}")
+        self.directory = directory
+        self.ivf_lists = ivf_lists
+        self.ivf_nprobe = ivf_nprobe
+        self._lock = threading.RLock()
+        # 行号布局版本：压缩、清空后递增
+        self._generation = 0
+        
+        os.makedirs(directory, exist_ok=True)
+        self._header_path = os.path.join(directory, "header.json")
+        self._centroids_path = os.path.join(directory, "ivf_centroids.npy")
+        self._load(quantization)
+
+    def _data_paths(self, file_generation: int) -> Tuple[str, str, str]:
+        """指定代号的 (向量, 反量化系数, IVF 分配) 文件路径，代号 0 沿用原文件名"""
+        suffix = f".{file_generation}" if file_generation else ""
+        return tuple(
+            os.path.join(self.directory, f"{name}{suffix}.bin")
+            for name in ("vectors", "scales", "ivf_assign")
+        )
+
+    def _load(self, quantization: str):
+        self._header = {"dim": None, "rows": 0, "quantization": quantization, "ivf_trained_rows": 0,
+                        "file_generation": 0}
+        if os.path.exists(self._header_path):
+            with open(self._header_path, "r", encoding="utf-8") as f:
+                self._header.update(json.load(f))
+        # 已有数据时以文件中的量化方式为准
+        self.quantization = self._header["quantization"]
+        
+        self._conn = sqlite3.connect(os.path.join(self.directory, "chunks.sqlite"), check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS chunks ("
+            "row INTEGER PRIMARY KEY, id TEXT UNIQUE NOT NULL, text TEXT NOT NULL, "
+            "metadata TEXT, deleted INTEGER NOT NULL DEFAULT 0)"
+        )
+        self._conn.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self._conn.execute("SELECT value FROM meta WHERE key = 'file_generation'").fetchone()
+        if row is not None and int(row[0]) != self._header["file_generation"]:
+            # 压缩已提交但 header 未更新就退出：压缩后没有墓碑，行数即记录数
+            self._header["file_generation"] = int(row[0])
+            self._header["rows"] = self._conn.execute("SELECT COUNT(*) FROM chunks").fetchone()[0]
+            self._write_header()
+        self._vectors_path, self._scales_path, self._assign_path = self._data_paths(self._header["file_generation"])
+        self._remove_stale_files()
+        
+        # 上次 SQLite 已提交但 header 未更新就退出时，丢弃超出 header 行数的记录
+        self._conn.execute("DELETE FROM chunks WHERE row >= ?", (self._header["rows"],))
+        self._conn.commit()
+        
+        self._alive = np.ones(self._header["rows"], dtype=bool)
+        for (row,) in self._conn.execute("SELECT row FROM chunks WHERE deleted = 1"):
+            self._alive[row] = False
+        
+        self._centroids = np.load(self._centroids_path) if os.path.exists(self._centroids_path) else None
+        self._open_maps()
+        self._build_lists()
+
+    # ---------- 文件映射 ----------
+
+    def _open_maps(self):
+        rows, dim = self._header["rows"], self._header["dim"]
+        self._vectors = self._scales = self._assign = None
+        if not rows:
+            return
+        dtype = np.int8 if self.quantization == "int8" else np.float32
+        self._vectors = np.memmap(self._vectors_path, dtype=dtype, mode="r", shape=(rows, dim))
+        if self.quantization == "int8":
+            self._scales = np.memmap(self._scales_path, dtype=np.float32, mode="r", shape=(rows,))
+        if self._centroids is not None:
+            self._assign = np.memmap(self._assign_path, dtype=np.int32, mode="r", shape=(rows,))
+
+    def _build_lists(self):
+        """按 IVF 分区整理行号，查询时直接取被探测分区的行，不需要扫描整个分配数组"""
+        self._lists = None
+        if self._centroids is None:
+            return
+        n_lists = len(self._centroids)
+        if self._assign is None:
+            self._lists = [np.empty(0, dtype=np.int64) for _ in range(n_lists)]
+            return
+        assign = np.asarray(self._assign)
+        order = np.argsort(assign, kind="stable").astype(np.int64)
+        counts = np.bincount(assign, minlength=n_lists)
+        self._lists = np.split(order, np.cumsum(counts)[:-1])
+
+    def _append(self, path: str, data: np.ndarray, offset: int):
+        """从 offset 处写入 (截掉上次崩溃后遗留的多余字节)"""
+        with open(path, "r+b" if os.path.exists(path) else "wb") as f:
+            f.truncate(offset)
+            f.seek(offset)
+            f.write(data.tobytes())
+
+    def _remove_stale_files(self):
+        """删除其他代号的数据文件 (压缩中途退出或切换后遗留)"""
+        current = {self._vectors_path, self._scales_path, self._assign_path}
+        for name in os.listdir(self.directory):
+            path = os.path.join(self.directory, name)
+            if name.startswith(("vectors", "scales", "ivf_assign")) and path not in current:
+                os.remove(path)
+
+    def _write_header(self):
+        tmp_path = self._header_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(self._header, f)
+        os.replace(tmp_path, self._header_path)
+
+    def _encode(self, vectors: np.ndarray) -> Tuple[np.ndarray, Optional[np.ndarray]]:
+        if self.quantization == "float32":
+            return vectors.astype(np.float32), None
+        scales = np.abs(vectors).max(axis=1) / 127.0
+        scales[scales == 0] = 1.0
+        return np.round(vectors / scales[:, None]).astype(np.int8), scales.astype(np.float32)
+
+    def _score(self, view: _IndexView, rows, query: np.ndarray) -> np.ndarray:
+        """rows 可以是切片或行号数组；返回与查询向量 (或按列排列的多个查询向量) 的余弦相似度"""
+        block = view.vectors[rows]
+        if self.quantization == "int8":
+            scales = view.scales[rows]
+            # 批量查询时 query 为 (dim, 查询数) 矩阵，系数按行广播
+            if query.ndim == 2:
+                scales = scales[:, None]
+            return (block.astype(np.float32) @ query) * scales
+        return block @ query
+
+    # ---------- 写入 ----------
+
+    def upsert(self, ids: List[str], embeddings: List[List[float]], texts: List[str],
+               metadatas: List[Optional[Dict]]):
+        if not ids:
+            return
+        vectors = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        vectors = vectors / norms
+        
+        with self._lock:
+            if self._header["dim"] is None:
+                self._header["dim"] = int(vectors.shape[1])
+            elif vectors.shape[1] != self._header["dim"]:
+                raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self._header['dim']}")
+            
+            # 覆盖写入 = 旧行打墓碑 + 追加新行
+            self._mark_deleted(ids)
+            
+            start = self._header["rows"]
+            encoded, scales = self._encode(vectors)
+            self._append(self._vectors_path, encoded, start * encoded.itemsize * self._header["dim"])
+            if scales is not None:
+                self._append(self._scales_path, scales, start * 4)
+            if self._centroids is not None:
+                assign = np.argmax(vectors @ self._centroids.T, axis=1).astype(np.int32)
+                self._append(self._assign_path, assign, start * 4)
+                new_rows = np.arange(start, start + len(ids), dtype=np.int64)
+                lists = list(self._lists)
+                for c in np.unique(assign):
+                    lists[c] = np.concatenate([lists[c], new_rows[assign == c]])
+                self._lists = lists
+            
+            self._conn.executemany(
+                "INSERT INTO chunks (row, id, text, metadata) VALUES (?, ?, ?, ?)",
+                [
+                    (start + i, chunk_id, text, json.dumps(metadata or {}, ensure_ascii=False))
+                    for i, (chunk_id, text, metadata) in enumerate(zip(ids, texts, metadatas))
+                ]
+            )
+            
+            self._header["rows"] = start + len(ids)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            self._open_maps()
+
+    def _mark_deleted(self, ids: List[str]):
+        rows = []
+        for i in range(0, len(ids), 500):
+            batch = ids[i:i + 500]
+            placeholders = ",".join("?" * len(batch))
+            rows.extend(row for (row,) in self._conn.execute(
+                f"SELECT row FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", batch
+            ))
+        if not rows:
+            return
+        # 旧行的 ID 改名腾出唯一约束，便于同 ID 重新写入
+        self._conn.executemany(
+            "UPDATE chunks SET deleted = 1, id = '#deleted:' || row WHERE row = ?",
+            [(row,) for row in rows]
+        )
+        # 检索线程可能正在使用旧数组，复制后替换而不是原地修改
+        alive = self._alive.copy()
+        alive[rows] = False
+        self._alive = alive
+
+    def delete(self, ids: List[str]):
+        with self._lock:
+            self._mark_deleted(ids)
+
+    # ---------- 查询 ----------
+
+    def _view(self) -> Optional[_IndexView]:
+        with self._lock:
+            if self._vectors is None or not self._alive.any():
+                return None
+            return _IndexView(self._vectors, self._scales, self._alive, self._centroids,
+                              self._lists, self._header["rows"], self._generation)
+
+    def search(self, embedding: List[float], k: int) -> List[Tuple[Document, float]]:
+        query = np.asarray(embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm:
+            query = query / norm
+        
+        while True:
+            view = self._view()
+            if view is None:
+                return []
+            if view.centroids is not None:
+                rows, scores = self._search_ivf(view, query)
+            else:
+                rows, scores = self._search_flat(view, query, k)
+            results = self._top_k(view, rows, scores, k)
+            # 打分期间发生压缩时行号已失效，重新检索
+            if results is not None:
+                return results
+
+    def search_batch(self, embeddings: List[List[float]], k: int) -> List[List[Tuple[Document, float]]]:
+        queries = np.asarray(embeddings, dtype=np.float32)
+        norms = np.linalg.norm(queries, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        queries = queries / norms
+        
+        while True:
+            view = self._view()
+            if view is None:
+                return [[] for _ in embeddings]
+            if view.centroids is not None:
+                candidates = [self._search_ivf(view, query) for query in queries]
+            else:
+                candidates = self._search_flat_batch(view, queries, k)
+            results = [self._top_k(view, rows, scores, k) for rows, scores in candidates]
+            if all(result is not None for result in results):
+                return results
+
+    def _top_k(self, view: _IndexView, rows: np.ndarray, scores: np.ndarray,
+               k: int) -> Optional[List[Tuple[Document, float]]]:
+        if len(rows) > k:
+            top = np.argpartition(-scores, k)[:k]
+            rows, scores = rows[top], scores[top]
+        order = np.argsort(-scores)
+        return self._load_documents(view, rows[order], scores[order])
+
+    def _search_flat(self, view: _IndexView, query: np.ndarray, k: int) -> Tuple[np.ndarray, np.ndarray]:
+        best_rows, best_scores = [], []
+        total = view.rows
+        for start in range(0, total, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, total)
+            scores = self._score(view, slice(start, end), query)
+            scores[~view.alive[start:end]] = -np.inf
+            if end - start > k:
+                top = np.argpartition(-scores, k)[:k]
+            else:
+                top = np.arange(end - start)
+            best_rows.append(top + start)
+            best_scores.append(scores[top])
+        rows = np.concatenate(best_rows)
+        scores = np.concatenate(best_scores)
+        keep = np.isfinite(scores)
+        return rows[keep], scores[keep]
+
+    def _search_flat_batch(self, view: _IndexView, queries: np.ndarray, k: int) -> List[Tuple[np.ndarray, np.ndarray]]:
+        """多个查询共用一次矩阵扫描：每个块只读取一次，用矩阵乘法同时打分"""
+        best_rows = [[] for _ in queries]
+        best_scores = [[] for _ in queries]
+        total = view.rows
+        for start in range(0, total, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, total)
+            scores = self._score(view, slice(start, end), queries.T)
+            scores[~view.alive[start:end]] = -np.inf
+            for i in range(len(queries)):
+                column = scores[:, i]
+                if end - start > k:
+                    top = np.argpartition(-column, k)[:k]
+                else:
+                    top = np.arange(end - start)
+                best_rows[i].append(top + start)
+                best_scores[i].append(column[top])
+        results = []
+        for rows, scores in zip(best_rows, best_scores):
+            rows, scores = np.concatenate(rows), np.concatenate(scores)
+            keep = np.isfinite(scores)
+            results.append((rows[keep], scores[keep]))
+        return results
+
+    def _search_ivf(self, view: _IndexView, query: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        nprobe = min(self.ivf_nprobe, len(view.centroids))
+        probe = np.argpartition(-(view.centroids @ query), nprobe - 1)[:nprobe]
+        rows = np.concatenate([view.lists[c] for c in probe])
+        rows = rows[view.alive[rows]]
+        if len(rows) == 0:
+            return rows, np.empty(0, dtype=np.float32)
+        return rows, self._score(view, rows, query)
+
+    def _load_documents(self, view: _IndexView, rows: np.ndarray,
+                        scores: np.ndarray) -> Optional[List[Tuple[Document, float]]]:
+        """按行号读取正文；行号布局已变化时返回 None，打分后才删除的行跳过"""
+        row_list = [int(row) for row in rows]
+        placeholders = ",".join("?" * len(row_list))
+        with self._lock:
+            if view.generation != self._generation:
+                return None
+            records = {
+                row: (text, metadata)
+                for row, text, metadata in self._conn.execute(
+                    f"SELECT row, text, metadata FROM chunks WHERE deleted = 0 AND row IN ({placeholders})", row_list
+                )
+            }
+        results = []
+        for row, score in zip(row_list, scores):
+            if row not in records:
+                continue
+            text, metadata = records[row]
+            results.append((Document(page_content=text, metadata=json.loads(metadata or "{}")), float(score)))
+        return results
+
+    def get(self, ids: List[str]) -> List[Document]:
+        if not ids:
+            return []
+        placeholders = ",".join("?" * len(ids))
+        with self._lock:
+            rows = self._conn.execute(
+                f"SELECT id, text, metadata FROM chunks WHERE deleted = 0 AND id IN ({placeholders})", list(ids)
+            ).fetchall()
+        found = {
+            chunk_id: Document(page_content=text, metadata=json.loads(metadata or "{}"))
+            for chunk_id, text, metadata in rows
+        }
+        return [found[chunk_id] for chunk_id in ids if chunk_id in found]
+
+    def get_all(self) -> Tuple[List[str], List[str], List[Optional[Dict]]]:
+        with self._lock:
+            rows = self._conn.execute("SELECT id, text, metadata FROM chunks WHERE deleted = 0 ORDER BY row").fetchall()
+        return [r[0] for r in rows], [r[1] for r in rows], [json.loads(r[2] or "{}") for r in rows]
+
+    def export(self) -> Tuple[List[str], np.ndarray, List[str], List[Optional[Dict]]]:
+        """导出归一化后的向量 (int8 模式下为反量化结果)"""
+        with self._lock:
+            rows = self._conn.execute(
+                "SELECT row, id, text, metadata FROM chunks WHERE deleted = 0 ORDER BY row"
+            ).fetchall()
+            if not rows:
+                return [], np.zeros((0, self._header["dim"] or 0), dtype=np.float32), [], []
+            index = np.array([r[0] for r in rows])
+            vectors = np.asarray(self._vectors[index], dtype=np.float32)
+            if self.quantization == "int8":
+                vectors *= self._scales[index][:, None]
+        return [r[1] for r in rows], vectors, [r[2] for r in rows], [json.loads(r[3] or "{}") for r in rows]
+
+    def count(self) -> int:
+        return int(self._alive.sum())
+
+    # ---------- 维护 ----------
+
+    def clear(self):
+        with self._lock:
+            self._conn.close()
+            self._vectors = self._scales = self._assign = None
+            shutil.rmtree(self.directory, ignore_errors=True)
+            os.makedirs(self.directory, exist_ok=True)
+            self._generation += 1
+            self._load(self._header["quantization"])
+
+    def persist(self):
+        """提交 SQLite 并更新 header，压缩墓碑，并在数据量足够时 (重新) 训练 IVF 分区
+
+        先提交 SQLite 再写 header：两步之间退出时，加载时会丢弃超出 header 行数的记录。
+        """
+        with self._lock:
+            self._conn.commit()
+            self._write_header()
+            rows = self._header["rows"]
+            if rows and (~self._alive).sum() * 2 > rows:
+                self._compact()
+            alive = self.count()
+            trained = self._header["ivf_trained_rows"]
+            if self.ivf_lists and alive >= self.ivf_lists * 39 and (not trained or alive > trained * 2):
+                self._train_ivf()
+
+    def _compact(self):
+        keep = np.nonzero(self._alive)[0]
+        dim = self._header["dim"]
+        file_generation = self._header["file_generation"] + 1
+        new_paths = self._data_paths(file_generation)
+        
+        def rewrite(path, new_path, dtype, shape):
+            data = np.array(np.memmap(path, dtype=dtype, mode="r", shape=shape)[keep])
+            with open(new_path, "wb") as f:
+                f.write(data.tobytes())
+                f.flush()
+                os.fsync(f.fileno())
+        
+        rows = self._header["rows"]
+        self._vectors = self._scales = self._assign = None
+        rewrite(self._vectors_path, new_paths[0], np.int8 if self.quantization == "int8" else np.float32, (rows, dim))
+        if self.quantization == "int8":
+            rewrite(self._scales_path, new_paths[1], np.float32, (rows,))
+        if self._centroids is not None:
+            rewrite(self._assign_path, new_paths[2], np.int32, (rows,))
+        
+        # 先删墓碑，再按升序重排行号，新行号总是不大于旧行号，不会冲突；
+        # 新文件代号在同一事务中提交，作为压缩生效的标志
+        self._conn.execute("DELETE FROM chunks WHERE deleted = 1")
+        self._conn.executemany(
+            "UPDATE chunks SET row = ? WHERE row = ?",
+            [(new_row, int(old_row)) for new_row, old_row in enumerate(keep)]
+        )
+        self._conn.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('file_generation', ?)", (str(file_generation),)
+        )
+        self._conn.commit()
+        
+        self._header["rows"] = len(keep)
+        self._header["file_generation"] = file_generation
+        self._write_header()
+        self._vectors_path, self._scales_path, self._assign_path = new_paths
+        self._remove_stale_files()
+        self._alive = np.ones(len(keep), dtype=bool)
+        self._generation += 1
+        self._open_maps()
+        self._build_lists()
+
+    def _train_ivf(self, iterations: int = 10, sample_size: int = 50000):
+        """球面 k-means 训练分区中心，并为所有行重新分配分区"""
+        alive_rows = np.nonzero(self._alive)[0]
+        rng = np.random.default_rng(0)
+        sample = np.sort(rng.choice(alive_rows, size=min(sample_size, len(alive_rows)), replace=False))
+        data = np.asarray(self._vectors[sample], dtype=np.float32)
+        if self.quantization == "int8":
+            data *= self._scales[sample][:, None]
+        
+        centroids = data[rng.choice(len(data), size=self.ivf_lists, replace=False)]
+        for _ in range(iterations):
+            labels = np.argmax(data @ centroids.T, axis=1)
+            for c in range(self.ivf_lists):
+                members = data[labels == c]
+                if len(members):
+                    centroid = members.sum(axis=0)
+                    centroids[c] = centroid / (np.linalg.norm(centroid) or 1.0)
+        
+        rows = self._header["rows"]
+        assign = np.empty(rows, dtype=np.int32)
+        for start in range(0, rows, _BLOCK_ROWS):
+            end = min(start + _BLOCK_ROWS, rows)
+            block = np.asarray(self._vectors[start:end], dtype=np.float32)
+            assign[start:end] = np.argmax(block @ centroids.T, axis=1)
+        
+        with open(self._assign_path + ".tmp", "wb") as f:
+            f.write(assign.tobytes())
+        os.replace(self._assign_path + ".tmp", self._assign_path)
+        np.save(self._centroids_path, centroids)
+        self._centroids = centroids
+        self._header["ivf_trained_rows"] = len(alive_rows)
+        self._write_header()
+        self._open_maps()
+        self._build_lists()
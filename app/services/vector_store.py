@@ -1,62 +1,467 @@
-from typing import List, Optional
-from langchain_google_genai import GoogleGenerativeAIEmbeddings
-from langchain_community.vectorstores import Chroma
-from langchain.schema import Document
+import os
+import tempfile
+import threading
+import uuid
+import zlib
+from typing import List, Dict, Iterable, Callable, Optional, Tuple
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
 from app.core.config import settings
-import google.generativeai as genai
+from app.services.ingest_manifest import IngestManifest, make_chunk_ids
+from app.services.embedding_cache import CachedEmbeddings, embed_queries
+from app.services.embedding_pipeline import EmbeddingPipeline
+from app.services.bm25_index import BM25Index
+from app.services.chunk_store import ChunkStore
+from app.services.text_splitter import StructuredTokenSplitter
+from app.services.index_snapshot import SnapshotError, open_snapshot, write_snapshot
+from app.services.retrievers import DenseRetriever, HybridRetriever
+from app.services.vector_backends import create_backend
+from app.services.metrics import timed, INGESTED_CHUNKS
 
-class VectorStoreService:
-    def __init__(self):
-        # 配置 Google API
-        if not settings.GEMINI_API_KEY:
-            raise ValueError("GEMINI_API_KEY is not set in environment variables")
-            
-        genai.configure(api_key=settings.GEMINI_API_KEY)
-        
-        # 初始化 Embedding 模型
-        self.embeddings = GoogleGenerativeAIEmbeddings(
-            model="models/embedding-001",
-            google_api_key=settings.GEMINI_API_KEY
+def create_embeddings():
+    """创建 Embedding 客户端 (按配置包一层磁盘缓存)"""
+    if not settings.GEMINI_API_KEY:
+        raise ValueError("GEMINI_API_KEY is not set in environment variables")
+    
+    # 延迟导入：google.generativeai 相关模块导入耗时较长
+    import google.generativeai as genai
+    from langchain_google_genai import GoogleGenerativeAIEmbeddings
+    
+    genai.configure(api_key=settings.GEMINI_API_KEY)
+    
+    embeddings = GoogleGenerativeAIEmbeddings(
+        model=settings.EMBEDDING_MODEL,
+        google_api_key=settings.GEMINI_API_KEY
+    )
+    
+    # 磁盘缓存：相同文本不再重复调用远程 Embedding 接口
+    if settings.EMBEDDING_CACHE_ENABLED:
+        embeddings = CachedEmbeddings(
+            embeddings,
+            model_name=settings.EMBEDDING_MODEL,
+            path=settings.EMBEDDING_CACHE_PATH,
+            max_entries=settings.EMBEDDING_CACHE_MAX_ENTRIES
         )
+    return embeddings
+
+def create_embedding_pipeline(embeddings) -> EmbeddingPipeline:
+    """分批向量化流水线：控制批大小、并发、限流和重试"""
+    return EmbeddingPipeline(
+        embeddings,
+        batch_size=settings.EMBEDDING_BATCH_SIZE,
+        max_in_flight=settings.EMBEDDING_MAX_IN_FLIGHT,
+        requests_per_second=settings.EMBEDDING_REQUESTS_PER_SECOND,
+        max_retries=settings.EMBEDDING_MAX_RETRIES,
+        backoff_base=settings.EMBEDDING_BACKOFF_BASE
+    )
+
+# 导入快照时每批写入后端的 chunk 数 (Chroma 单次写入上限约 5000)
+_SNAPSHOT_BATCH_SIZE = 5000
+# 按来源文件分段的锁数量
+_SOURCE_LOCK_STRIPES = 64
+
+class VectorStoreService:
+    def __init__(self, persist_directory: str = None, collection_name: str = None,
+                 embeddings=None, embedding_pipeline: EmbeddingPipeline = None):
+        # 多个笔记本共享同一组 Embedding 客户端与流水线 (限流在全局生效)
+        self.embeddings = embeddings or create_embeddings()
+        self.embedding_cache = self.embeddings if isinstance(self.embeddings, CachedEmbeddings) else None
+        self.embedding_pipeline = embedding_pipeline or create_embedding_pipeline(self.embeddings)
         
         # 初始化向量数据库路径
-        self.persist_directory = settings.VECTOR_DB_DIR
-        self.collection_name = settings.COLLECTION_NAME
-        
-        # 加载或创建向量存储
-        self.vector_store = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings,
-            collection_name=self.collection_name
+        self.persist_directory = persist_directory or settings.VECTOR_DB_DIR
+        self.collection_name = collection_name or settings.COLLECTION_NAME
+        
+        # 加载或创建向量索引后端 (vector_store.type: chroma / numpy)
+        self.backend = create_backend(
+            settings.VECTOR_STORE_TYPE,
+            self.persist_directory,
+            self.collection_name,
+            quantization=settings.NUMPY_QUANTIZATION,
+            ivf_lists=settings.NUMPY_IVF_LISTS,
+            ivf_nprobe=settings.NUMPY_IVF_NPROBE
         )
+        
+        # 索引版本号：每次索引内容变化时递增，用于让上层的 retriever/chain 失效
+        self.version = 0
+        
+        # 写锁：所有写操作与快照导出互斥，导出的快照总是某一时刻的完整索引
+        self._write_lock = threading.RLock()
+        # 按来源文件分段的锁：同一文件的同步/删除串行 (上传任务与目录监听可能同时处理同一文件)，
+        # 不同文件之间只在写入每一批时竞争写锁，不会等待整个文件入库
+        self._source_locks = [threading.Lock() for _ in range(_SOURCE_LOCK_STRIPES)]
+        # 分组落盘：写入只标记 dirty，由后台线程每 persist_interval 秒合并落盘一次
+        self.persist_interval = settings.PERSIST_INTERVAL_SECONDS
+        self._dirty = False
+        self._closed = threading.Event()
+        
+        # 入库清单：记录每个文件的哈希和 chunk ID，用于去重和增量更新
+        self.manifest = IngestManifest(os.path.join(self.persist_directory, "ingest_manifest.json"))
+        
+        # 父段落存储与子 chunk 分割器 (父子分块)：向量库只保存子 chunk 的向量与定位信息，
+        # 检索时换成父段落；未启用时已有的父段落仍可被检索
+        self.chunk_store = ChunkStore(os.path.join(self.persist_directory, "chunk_store.sqlite"))
+        self.child_splitter = None
+        if settings.PARENT_RETRIEVAL_ENABLED and settings.SPLITTER == "token":
+            self.child_splitter = StructuredTokenSplitter(
+                chunk_size=settings.TOKEN_CHILD_CHUNK_SIZE,
+                chunk_overlap=settings.TOKEN_CHILD_CHUNK_OVERLAP
+            )
+        elif settings.PARENT_RETRIEVAL_ENABLED:
+            self.child_splitter = RecursiveCharacterTextSplitter(
+                chunk_size=settings.CHILD_CHUNK_SIZE,
+                chunk_overlap=settings.CHILD_CHUNK_OVERLAP,
+                separators=["\n\n", "\n", " ", ""],
+                add_start_index=True
+            )
+        
+        # BM25 关键词索引，与向量库使用相同的 chunk ID 同步增删
+        self.lexical_index = BM25Index(os.path.join(self.persist_directory, "bm25_index.json"))
+        # 数量不一致说明上次退出前有未落盘的写入 (向量库自身已持久化)，以向量库为准重建
+        if len(self.lexical_index) != self.backend.count():
+            self.lexical_index.clear()
+            self._rebuild_lexical_index()
+        
+        self._flusher = None
+        if self.persist_interval > 0:
+            self._flusher = threading.Thread(target=self._flush_loop, name="index-flusher", daemon=True)
+            self._flusher.start()
+
+    def _lexical_texts(self, texts: List[str], metadatas: List[Optional[Dict]]) -> List[str]:
+        """子 chunk 在向量库中没有正文，按偏移从父段落还原"""
+        metadatas = [metadata or {} for metadata in metadatas]
+        parent_ids = [m["parent_id"] for m in metadatas if m.get("parent_id")]
+        if not parent_ids:
+            return texts
+        parents = self.chunk_store.get(parent_ids)
+        return [
+            parents[m["parent_id"]].page_content[m["parent_start"]:m["parent_end"]]
+            if m.get("parent_id") in parents else text
+            for text, m in zip(texts, metadatas)
+        ]
 
-    def add_documents(self, documents: List[Document]):
-        """将文档向量化并存储"""
+    def _rebuild_lexical_index(self):
+        """从已有的向量库数据重建 BM25 索引 (兼容升级前建立的向量库)"""
+        ids, texts, metadatas = self.backend.get_all()
+        if not ids:
+            return
+        print(f"Rebuilding BM25 index from {len(ids)} chunks...")
+        self.lexical_index.add(ids, self._lexical_texts(texts, metadatas))
+        self.lexical_index.save()
+
+    # ---------- 落盘 ----------
+
+    def _mark_dirty(self):
+        """记录有未落盘的变化；persist_interval 为 0 时立即落盘"""
+        self._dirty = True
+        if self.persist_interval <= 0:
+            self.flush()
+
+    def flush(self):
+        """把向量索引、BM25 索引与入库清单一起落盘 (没有变化时直接返回)"""
+        with self._write_lock:
+            if not self._dirty:
+                return
+            with timed("index_persist"):
+                self.backend.persist()
+                self.lexical_index.save()
+                self.manifest.save()
+            self._dirty = False
+
+    def _flush_loop(self):
+        while not self._closed.wait(self.persist_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                print(f"Index flush failed: {e}")
+
+    def close(self):
+        """停止后台落盘线程，并写入尚未落盘的变化"""
+        self._closed.set()
+        self.flush()
+
+    def add_documents(self, documents: List[Document], ids: Optional[List[str]] = None):
+        """将文档向量化并存储
+
+        向量化由 EmbeddingPipeline 分批完成，每个批次成功后立即写入索引后端。
+        远程调用期间不持有写锁，只在写入每个批次时持有，落盘、快照导出与其他文件的
+        写入不必等待整个文件向量化完成。部分批次失败时抛出 EmbeddingBatchError，
+        已写入的批次保留；重试时这些文本会命中 Embedding 缓存，不会重复调用远程接口。
+        """
         if not documents:
             return
-            
-        # Chroma 自动处理分批和存储
-        self.vector_store.add_documents(documents)
-        self.vector_store.persist()
         
+        if ids is None:
+            ids = [str(uuid.uuid4()) for _ in documents]
+        texts = [doc.page_content for doc in documents]
+        # Chroma 不接受 None 值的元数据，统一去掉
+        metadatas = [
+            {key: value for key, value in doc.metadata.items() if value is not None} or None
+            for doc in documents
+        ]
+        
+        # 子 chunk 的正文可由父段落还原，向量库中不再重复保存
+        stored_texts = ["" if doc.metadata.get("parent_id") else text for doc, text in zip(documents, texts)]
+        
+        def write_batch(start: int, end: int, vectors: List[List[float]]):
+            with self._write_lock, timed("index_write"):
+                self.backend.upsert(ids[start:end], vectors, stored_texts[start:end], metadatas[start:end])
+                self.lexical_index.add(ids[start:end], texts[start:end])
+                self._dirty = True
+            INGESTED_CHUNKS.inc(end - start)
+        
+        try:
+            self.embedding_pipeline.run(texts, write_batch)
+        finally:
+            with self._write_lock:
+                self.version += 1
+                self._mark_dirty()
+
+    def add_parents(self, parents: List[Document], parent_ids: List[str]):
+        """写入父段落：正文存入 chunk store，切分出的子 chunk 向量化后写入索引
+
+        子 chunk ID 为 "父段落 ID:序号"，元数据带 parent_id 与在父段落中的偏移。
+        """
+        if not parents:
+            return
+        children, child_ids, counts = [], [], []
+        for parent, parent_id in zip(parents, parent_ids):
+            pieces = self.child_splitter.split_documents([parent])
+            for i, piece in enumerate(pieces):
+                start = piece.metadata.pop("start_index")
+                piece.metadata.pop("end_index", None)
+                piece.metadata.update(parent_id=parent_id, parent_start=start,
+                                      parent_end=start + len(piece.page_content))
+                children.append(piece)
+                child_ids.append(f"{parent_id}:{i}")
+            counts.append(len(pieces))
+        
+        # 先写父段落，保证检索到的子 chunk 总能找到所属父段落；子 chunk 的向量化不持有写锁
+        with self._write_lock:
+            self.chunk_store.put(parent_ids, parents, counts)
+        self.add_documents(children, ids=child_ids)
+
+    def delete(self, ids: List[str]):
+        """按 chunk ID 删除向量 (父段落 ID 会展开为其全部子 chunk)"""
+        if not ids:
+            return
+        child_counts = self.chunk_store.child_counts(ids)
+        vector_ids = []
+        for chunk_id in ids:
+            if chunk_id in child_counts:
+                vector_ids.extend(f"{chunk_id}:{i}" for i in range(child_counts[chunk_id]))
+            else:
+                vector_ids.append(chunk_id)
+        
+        # 先删子 chunk 再删父段落，检索过程中不会命中没有父段落的子 chunk
+        with self._write_lock:
+            if vector_ids:
+                self.backend.delete(vector_ids)
+                self.lexical_index.remove(vector_ids)
+            self.chunk_store.delete(list(child_counts))
+            self.version += 1
+            self._mark_dirty()
+
+    def _source_lock(self, source: str) -> threading.Lock:
+        # 用 CRC32 而不是 hash()：分段结果不随进程的哈希种子变化，便于复现锁竞争
+        return self._source_locks[zlib.crc32(source.encode("utf-8")) % _SOURCE_LOCK_STRIPES]
+
+    def sync_file(self, source: str, file_hash: str, documents: List[Document]) -> Tuple[int, int]:
+        """增量同步单个文件的 chunk，只向量化新增部分、删除已不存在的部分
+
+        返回 (新增 chunk 数, 删除 chunk 数)。
+        """
+        _, added, removed = self.sync_file_stream(source, file_hash, [documents])
+        return added, removed
+
+    def sync_file_stream(self, source: str, file_hash: str, batches: Iterable[List[Document]],
+                         on_batch: Optional[Callable[[int], None]] = None) -> Tuple[int, int, int]:
+        """按批次增量同步单个文件，每批写入后立即可被检索
+
+        内存中只保留当前批次和 chunk ID 列表。全部批次完成后才删除过期 chunk
+        并更新入库清单；中途失败时清单记录已写入的 chunk 且哈希置空，
+        下次同步会重新处理并清理。返回 (chunk 总数, 新增数, 删除数)。
+        同一文件的同步互相等待，另一方已经写入相同内容时直接返回。
+        """
+        with self._source_lock(source):
+            entry = self.manifest.get(source)
+            if entry and entry["file_hash"] == file_hash:
+                return len(entry["chunk_ids"]), 0, 0
+            old_ids = set(entry["chunk_ids"]) if entry else set()
+        
+            chunk_ids: List[str] = []
+            seen: Dict[str, int] = {}
+            added = 0
+            try:
+                for documents in batches:
+                    batch_ids = make_chunk_ids(source, documents, seen)
+                    new_docs, new_ids = [], []
+                    for doc, chunk_id in zip(documents, batch_ids):
+                        if chunk_id not in old_ids:
+                            new_docs.append(doc)
+                            new_ids.append(chunk_id)
+                
+                    if self.child_splitter is not None:
+                        self.add_parents(new_docs, new_ids)
+                    else:
+                        self.add_documents(new_docs, ids=new_ids)
+                    chunk_ids.extend(batch_ids)
+                    added += len(new_ids)
+                    if on_batch:
+                        on_batch(len(chunk_ids))
+            except Exception:
+                with self._write_lock:
+                    self.manifest.update(source, "", list(old_ids | set(chunk_ids)))
+                    self._mark_dirty()
+                raise
+        
+            current_ids = set(chunk_ids)
+            stale_ids = [chunk_id for chunk_id in old_ids if chunk_id not in current_ids]
+            with self._write_lock:
+                self.delete(stale_ids)
+                self.manifest.update(source, file_hash, chunk_ids)
+                self._mark_dirty()
+            return len(chunk_ids), added, len(stale_ids)
+        
+    def remove_file(self, source: str) -> int:
+        """删除某个来源文件的全部 chunk，返回删除数量"""
+        with self._source_lock(source), self._write_lock:
+            entry = self.manifest.remove(source)
+            if entry is None:
+                return 0
+            self.delete(entry["chunk_ids"])
+        return len(entry["chunk_ids"])
+
+    def resolve_parents(self, documents: List[Document]) -> List[Document]:
+        """把子 chunk 换成所属父段落，按父段落去重并保持首次命中的顺序；普通 chunk 原样返回"""
+        parent_ids = [doc.metadata.get("parent_id") for doc in documents]
+        if not any(parent_ids):
+            return documents
+        with timed("resolve_parents"):
+            parents = self.chunk_store.get([parent_id for parent_id in parent_ids if parent_id])
+        results, seen = [], set()
+        for doc, parent_id in zip(documents, parent_ids):
+            if not parent_id:
+                results.append(doc)
+            elif parent_id in parents and parent_id not in seen:
+                seen.add(parent_id)
+                results.append(parents[parent_id])
+        return results
+
+    def similarity_search(self, query: str, k: int) -> List[Document]:
+        """向量相似度检索 (命中的子 chunk 换成父段落，结果可能少于 k 个)"""
+        with timed("embed_query"):
+            embedding = self.embeddings.embed_query(query)
+        with timed("vector_search"):
+            docs = [doc for doc, _ in self.backend.search(embedding, k)]
+        return self.resolve_parents(docs)
+
+    def lexical_search(self, query: str, k: int) -> List[Document]:
+        """BM25 关键词检索，正文与元数据从向量库读取 (命中的子 chunk 换成父段落)"""
+        hits = self.lexical_index.search(query, k)
+        docs = self.backend.get([chunk_id for chunk_id, _ in hits])
+        return self.resolve_parents(docs)
+
+    def embed_queries(self, queries: List[str]) -> List[List[float]]:
+        """一次请求计算多个查询向量 (命中缓存的不再请求)"""
+        with timed("embed_query_batch"):
+            return embed_queries(self.embeddings, queries)
+
+    def similarity_search_batch(self, queries: List[str], k: int,
+                                embeddings: Optional[List[List[float]]] = None) -> List[List[Document]]:
+        """批量向量检索，可传入已经计算好的查询向量"""
+        if embeddings is None:
+            embeddings = self.embed_queries(queries)
+        with timed("vector_search_batch"):
+            results = self.backend.search_batch(embeddings, k)
+        return [self.resolve_parents([doc for doc, _ in hits]) for hits in results]
+
     def search(self, query: str, k: int = None) -> List[Document]:
         """相似度搜索"""
         if k is None:
             k = settings.SEARCH_TOP_K
-        return self.vector_store.similarity_search(query, k=k)
+        return self.similarity_search(query, k=k)
 
     def get_retriever(self, search_kwargs: dict = None):
-        """获取检索器对象，用于 Chain"""
+        """获取检索器对象，用于 Chain (retrieval_mode 为 hybrid 时融合 BM25 结果)"""
         if search_kwargs is None:
             search_kwargs = {"k": settings.SEARCH_TOP_K}
-        return self.vector_store.as_retriever(search_kwargs=search_kwargs)
+        if settings.RETRIEVAL_MODE == "hybrid":
+            return HybridRetriever(
+                vector_store=self,
+                k=search_kwargs.get("k", settings.SEARCH_TOP_K),
+                fetch_k=max(settings.HYBRID_FETCH_K, search_kwargs.get("k", settings.SEARCH_TOP_K))
+            )
+        return DenseRetriever(vector_store=self, k=search_kwargs.get("k", settings.SEARCH_TOP_K))
 
     def clear(self):
         """清空向量库 (慎用)"""
-        self.vector_store.delete_collection()
-        self.vector_store = Chroma(
-            persist_directory=self.persist_directory,
-            embedding_function=self.embeddings,
-            collection_name=self.collection_name
-        )
+        with self._write_lock:
+            self.backend.clear()
+            self.chunk_store.clear()
+            self.manifest.clear()
+            self.lexical_index.clear()
+            self.version += 1
+            self._mark_dirty()
+            self.flush()
+
+    # ---------- 快照 ----------
+
+    def export_snapshot(self, path: str) -> Dict:
+        """导出索引快照 (tar.gz)：向量、chunk 正文与元数据、父段落库与入库清单
+
+        只在读取数据时持有写锁，快照对应某一时刻的完整索引；压缩写文件在锁外进行。
+        新副本用 import_snapshot 导入即可，不需要重新解析和向量化。返回快照头。
+        """
+        with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(path))) as workdir:
+            chunk_store_path = os.path.join(workdir, "chunk_store.sqlite")
+            with self._write_lock, timed("snapshot_read"):
+                ids, vectors, texts, metadatas = self.backend.export()
+                manifest_files = self.manifest.files()
+                self.chunk_store.backup(chunk_store_path)
+                version = self.version
+            header = {
+                "embedding_model": settings.EMBEDDING_MODEL,
+                "source_backend": settings.VECTOR_STORE_TYPE,
+                "index_version": version
+            }
+            with timed("snapshot_write"):
+                header = write_snapshot(path, workdir, header, ids, vectors, texts, metadatas,
+                                        manifest_files, chunk_store_path)
+        print(f"Exported snapshot of {header['count']} chunks to {path}")
+        return header
+
+    def import_snapshot(self, path: str) -> Dict:
+        """用快照替换当前索引，向量直接批量写入后端，不调用 Embedding 接口
+
+        快照可以来自另一种后端 (如 chroma 导出、numpy 导入)；Embedding 模型不同时拒绝导入。
+        快照在清空现有索引之前完整校验，损坏的快照不会影响现有索引；清空之后仍然失败时
+        整个索引连同入库清单一起清空，之后的上传会重新入库，而不是按旧清单跳过。返回快照头。
+        """
+        with tempfile.TemporaryDirectory(dir=self.persist_directory) as workdir:
+            with timed("snapshot_extract"):
+                snapshot = open_snapshot(path, workdir)
+            try:
+                model = snapshot.header.get("embedding_model")
+                if model != settings.EMBEDDING_MODEL:
+                    raise SnapshotError(f"Snapshot was built with {model}, current embedding model is {settings.EMBEDDING_MODEL}")
+                with self._write_lock, timed("snapshot_load"):
+                    try:
+                        self.backend.clear()
+                        self.lexical_index.clear()
+                        self.chunk_store.restore(snapshot.chunk_store_path)
+                        for ids, vectors, texts, metadatas in snapshot.iter_batches(_SNAPSHOT_BATCH_SIZE):
+                            self.backend.upsert(ids, vectors, texts, metadatas)
+                            self.lexical_index.add(ids, self._lexical_texts(texts, metadatas))
+                        self.manifest.replace(snapshot.manifest_files)
+                        self.version += 1
+                        self._mark_dirty()
+                        self.flush()
+                    except Exception:
+                        self.clear()
+                        raise
+            finally:
+                snapshot.close()
+        print(f"Imported snapshot of {snapshot.header['count']} chunks from {path}")
+        return snapshot.header
 
@@ -0,0 +1,145 @@
+"""Embedding 流水线基准测试 (使用本地模拟 Embedding 服务)
+
+用法:
+    python -m benchmarks.bench_embedding_pipeline --texts 2000 --latency 0.2 --error-rate 0.1
+
+在本地启动一个 HTTP 服务模拟远程 Embedding 接口：每个请求有固定延迟，
+并按给定概率或超过每秒请求上限时返回 429。分别测试单次整批请求和
+不同批大小/并发数下 EmbeddingPipeline 的耗时与重试情况。
+"""
+import argparse
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import List
+
+from langchain_core.embeddings import Embeddings
+
+from app.services.embedding_pipeline import EmbeddingPipeline, EmbeddingBatchError
+
+DIM = 64
+
+
+def fake_vector(text: str) -> List[float]:
+    digest = hashlib.sha256(text.encode("utf-8")).digest()
+    return [digest[i % len(digest)] / 255.0 for i in range(DIM)]
+
+
+class FakeEmbeddingServer:
+    """模拟延迟与限流错误的本地 Embedding 服务"""
+
+    def __init__(self, latency: float, per_text_latency: float, error_rate: float, max_rps: float):
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.error_rate = error_rate
+        self.max_rps = max_rps
+        self.requests = 0
+        self.rejected = 0
+        self._window = []
+        self._lock = threading.Lock()
+        
+        server = self
+        
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers["Content-Length"])))
+                if server._should_reject():
+                    self.send_response(429)
+                    self.end_headers()
+                    return
+                time.sleep(server.latency + server.per_text_latency * len(body["texts"]))
+                payload = json.dumps({"embeddings": [fake_vector(t) for t in body["texts"]]}).encode()
+                self.send_response(200)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(payload)))
+                self.end_headers()
+                self.wfile.write(payload)
+            
+            def log_message(self, *args):
+                pass
+        
+        self.httpd = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.url = f"http://127.0.0.1:{self.httpd.server_address[1]}/embed"
+        threading.Thread(target=self.httpd.serve_forever, daemon=True).start()
+
+    def _should_reject(self) -> bool:
+        with self._lock:
+            self.requests += 1
+            now = time.monotonic()
+            self._window = [t for t in self._window if now - t < 1.0]
+            if (self.max_rps and len(self._window) >= self.max_rps) or random.random() < self.error_rate:
+                self.rejected += 1
+                return True
+            self._window.append(now)
+            return False
+
+    def close(self):
+        self.httpd.shutdown()
+
+
+class HttpEmbeddings(Embeddings):
+    def __init__(self, url: str):
+        self.url = url
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        request = urllib.request.Request(
+            self.url, data=json.dumps({"texts": texts}).encode(),
+            headers={"Content-Type": "application/json"}
+        )
+        with urllib.request.urlopen(request, timeout=60) as response:
+            return json.loads(response.read())["embeddings"]
+
+    def embed_query(self, text: str) -> List[float]:
+        return self.embed_documents([text])[0]
+
+
+def run_case(server: FakeEmbeddingServer, texts: List[str], label: str, **pipeline_kwargs):
+    server.requests = server.rejected = 0
+    embedded = [0]
+    
+    def on_batch(start, end, vectors):
+        embedded[0] += len(vectors)
+    
+    pipeline = EmbeddingPipeline(HttpEmbeddings(server.url), backoff_base=0.1, **pipeline_kwargs)
+    start = time.perf_counter()
+    try:
+        pipeline.run(texts, on_batch)
+        status = "ok"
+    except EmbeddingBatchError as e:
+        status = f"{len(e.failed_ranges)} batches failed"
+    except urllib.error.HTTPError as e:
+        status = f"HTTP {e.code}"
+    elapsed = time.perf_counter() - start
+    
+    print(f"{label:<32} {elapsed:>8.2f}s {embedded[0]:>7} {server.requests:>9} {server.rejected:>9}  {status}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--texts", type=int, default=2000)
+    parser.add_argument("--latency", type=float, default=0.2, help="每个请求的固定延迟 (秒)")
+    parser.add_argument("--per-text-latency", type=float, default=0.001)
+    parser.add_argument("--error-rate", type=float, default=0.1, help="随机返回 429 的概率")
+    parser.add_argument("--max-rps", type=float, default=20, help="服务端每秒请求上限，超出返回 429")
+    args = parser.parse_args()
+    
+    random.seed(0)
+    server = FakeEmbeddingServer(args.latency, args.per_text_latency, args.error_rate, args.max_rps)
+    texts = [f"synthetic chunk {i} " * 20 for i in range(args.texts)]
+    
+    print(f"{'case':<32} {'time':>9} {'vectors':>7} {'requests':>9} {'rejected':>9}  status")
+    run_case(server, texts, "single request, no retry",
+             batch_size=len(texts), max_in_flight=1, max_retries=0)
+    run_case(server, texts, "batch=64, in_flight=1",
+             batch_size=64, max_in_flight=1, max_retries=8)
+    for in_flight in (4, 8):
+        run_case(server, texts, f"batch=64, in_flight={in_flight}",
+                 batch_size=64, max_in_flight=in_flight, max_retries=8)
+    run_case(server, texts, f"batch=64, in_flight=8, {args.max_rps:g} rps",
+             batch_size=64, max_in_flight=8, max_retries=8, requests_per_second=args.max_rps)
+    server.close()
@@ -0,0 +1,65 @@
+"""多文件并行解析基准测试
+
+用法:
+    python -m benchmarks.bench_parsing <corpus_dir> --workers 1 2 4 8
+
+对目录下所有支持格式的文件 (PDF/TXT/DOCX/MD/HTML) 调用
+DocumentProcessor.process_files，比较不同进程数下的解析耗时。
+进程池常驻复用，启动耗时单独输出，不计入各进程数的结果；
+为了比较进程数，这里不按 parallel_parse_min_mb 退回串行解析。
+"""
+import argparse
+import os
+import time
+
+from app.core.config import settings
+from app.services.document_processor import DocumentProcessor
+
+
+def collect_files(corpus_dir: str, extensions) -> list:
+    paths = []
+    for root, _, files in os.walk(corpus_dir):
+        for name in sorted(files):
+            if os.path.splitext(name)[1].lower() in extensions:
+                paths.append(os.path.join(root, name))
+    return paths
+
+
+def run(corpus_dir: str, worker_counts: list):
+    settings.PARSE_WORKERS = max(worker_counts)
+    settings.PARALLEL_PARSE_MIN_MB = 0
+    processor = DocumentProcessor()
+    paths = collect_files(corpus_dir, processor.supported_extensions)
+    if not paths:
+        print(f"No supported files found in {corpus_dir}")
+        return
+    
+    print(f"Corpus: {len(paths)} files, CPU cores: {os.cpu_count()}")
+    if max(worker_counts) > 1:
+        # 启动进程池并让每个工作进程完成一次导入
+        start = time.perf_counter()
+        for _ in processor.process_files(paths[:1] * settings.PARSE_WORKERS * 2, max_workers=settings.PARSE_WORKERS):
+            pass
+        print(f"Process pool start-up: {time.perf_counter() - start:.2f}s")
+    print(f"{'workers':>8} {'seconds':>10} {'chunks':>8} {'failed':>7} {'speedup':>8}")
+    
+    baseline = None
+    for workers in worker_counts:
+        start = time.perf_counter()
+        chunks = failed = 0
+        for _, docs, error in processor.process_files(paths, max_workers=workers):
+            chunks += len(docs)
+            failed += error is not None
+        elapsed = time.perf_counter() - start
+        
+        baseline = baseline or elapsed
+        print(f"{workers:>8} {elapsed:>10.2f} {chunks:>8} {failed:>7} {baseline / elapsed:>7.2f}x")
+    processor.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("corpus_dir")
+    parser.add_argument("--workers", type=int, nargs="+", default=[1, 2, 4, os.cpu_count() or 1])
+    args = parser.parse_args()
+    run(args.corpus_dir, args.workers)
@@ -0,0 +1,115 @@
+"""文本分割基准测试：比较 RecursiveCharacterTextSplitter 与 StructuredTokenSplitter
+
+用法:
+    python -m benchmarks.bench_splitters --output splitters.json
+    python -m benchmarks.bench_splitters --quick --output splitters_quick.json
+    python -m benchmarks.compare splitters_baseline.json splitters.json
+
+语料 (合成，同一 seed 内容相同)：
+- english: 英文段落的纯文本
+- cjk: 中文为主、夹杂英文术语的纯文本
+- markdown: 带两级标题、中英文各半的 Markdown
+- lines: 只有单个换行、没有空行的文本 (类似 HTML 提取出的正文)
+
+recursive 为当前的按字符分割 (1000/200 字符)，token 为 StructuredTokenSplitter (250/50 token)，
+recursive_tokens 为同样按 token 计长 (250/50) 的 RecursiveCharacterTextSplitter，作为按 token 分割的对照。
+每项输出分割吞吐 (MB/s) 与 chunk token 数的变异系数、p95 (token 数统一用 count_tokens 统计)，
+变异系数越小说明 chunk 的实际 token 成本越稳定。
+tiktoken 编码文件不可用时两边都退回按字符估算，结果中的 meta.tiktoken 会注明。
+"""
+import argparse
+import json
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+from langchain_core.documents import Document
+from langchain_text_splitters import RecursiveCharacterTextSplitter
+
+from benchmarks.corpus import make_cjk_paragraphs, make_markdown, make_paragraphs
+from benchmarks.suite import Results
+
+
+def make_corpora(docs: int, paragraphs: int, seed: int) -> Dict[str, List[Document]]:
+    rng = random.Random(seed)
+
+    def documents(texts: List[str], name: str) -> List[Document]:
+        return [Document(page_content=text, metadata={"source": f"{name}_{i}"}) for i, text in enumerate(texts)]
+
+    return {
+        "english": documents(["\n\n".join(make_paragraphs(rng, paragraphs)) for _ in range(docs)], "english"),
+        "cjk": documents(["\n\n".join(make_cjk_paragraphs(rng, paragraphs)) for _ in range(docs)], "cjk"),
+        "markdown": documents([make_markdown(rng, max(1, paragraphs // 6), 2) for _ in range(docs)], "markdown"),
+        "lines": documents([
+            "\n".join(sentence for paragraph in make_paragraphs(rng, paragraphs // 2) + make_cjk_paragraphs(rng, paragraphs // 2)
+                      for sentence in paragraph.replace("。", "。\n").split("\n") if sentence)
+            for _ in range(docs)
+        ], "lines")
+    }
+
+
+def run(args):
+    from app.services.context_packer import count_tokens, get_encoding
+    from app.services.text_splitter import StructuredTokenSplitter
+
+    splitters = {
+        "recursive": RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_chars, chunk_overlap=args.overlap_chars, separators=["\n\n", "\n", " ", ""]
+        ),
+        "recursive_tokens": RecursiveCharacterTextSplitter(
+            chunk_size=args.chunk_tokens, chunk_overlap=args.overlap_tokens, separators=["\n\n", "\n", " ", ""],
+            length_function=count_tokens
+        ),
+        "token": StructuredTokenSplitter(chunk_size=args.chunk_tokens, chunk_overlap=args.overlap_tokens)
+    }
+    results = Results()
+    for corpus, documents in make_corpora(args.docs, args.paragraphs, args.seed).items():
+        size_mb = sum(len(doc.page_content.encode("utf-8")) for doc in documents) / 1e6
+        print(f"{corpus}: {len(documents)} documents, {size_mb:.2f} MB")
+        throughput = {}
+        for name, splitter in splitters.items():
+            seconds = []
+            for _ in range(args.repeat):
+                start = time.perf_counter()
+                chunks = splitter.split_documents(documents)
+                seconds.append(time.perf_counter() - start)
+            throughput[name] = size_mb / min(seconds)
+            tokens = np.array([count_tokens(chunk.page_content) for chunk in chunks])
+            results.add(f"split.{corpus}.{name}.mb_per_s", throughput[name], "MB/s", "higher")
+            results.add(f"split.{corpus}.{name}.chunks", len(chunks), "chunks", "lower")
+            results.add(f"split.{corpus}.{name}.tokens_cv", tokens.std() / tokens.mean(), "ratio", "lower")
+            results.add(f"split.{corpus}.{name}.tokens_p95", float(np.percentile(tokens, 95)), "tokens", "lower")
+        results.add(f"split.{corpus}.speedup", throughput["token"] / throughput["recursive"], "x", "higher")
+        results.add(f"split.{corpus}.speedup_vs_recursive_tokens",
+                    throughput["token"] / throughput["recursive_tokens"], "x", "higher")
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "tiktoken": get_encoding() is not None,
+            "args": vars(args)
+        },
+        "metrics": results.metrics
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="splitter_results.json")
+    parser.add_argument("--quick", action="store_true", help="小规模运行，用于快速检查")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=300)
+    parser.add_argument("--chunk-chars", type=int, default=1000)
+    parser.add_argument("--overlap-chars", type=int, default=200)
+    parser.add_argument("--chunk-tokens", type=int, default=250)
+    parser.add_argument("--overlap-tokens", type=int, default=50)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.quick:
+        args.docs, args.paragraphs, args.repeat = 4, 60, 1
+    run(args)
@@ -0,0 +1,93 @@
+"""向量索引后端基准测试：Chroma vs NumPy (flat / int8 / IVF)
+
+用法:
+    python -m benchmarks.bench_vector_backends --rows 100000 --dim 768 --queries 200
+
+每个后端在独立子进程中运行：写入随机向量、重新打开 (冷启动)、执行查询，
+报告写入耗时、冷启动耗时、查询延迟 p50/p95、进程峰值内存和磁盘占用。
+"""
+import argparse
+import multiprocessing
+import os
+import resource
+import shutil
+import tempfile
+import time
+
+import numpy as np
+
+from app.services.vector_backends import create_backend
+
+CASES = {
+    "chroma": ("chroma", {}),
+    "numpy-flat": ("numpy", {"quantization": "float32"}),
+    "numpy-int8": ("numpy", {"quantization": "int8"}),
+    "numpy-ivf": ("numpy", {"quantization": "float32", "ivf_lists": 256, "ivf_nprobe": 8}),
+}
+
+
+def _dir_size(path: str) -> int:
+    return sum(os.path.getsize(os.path.join(root, name)) for root, _, files in os.walk(path) for name in files)
+
+
+def _run_case(name: str, rows: int, dim: int, queries: int, batch: int, result_queue):
+    backend_type, options = CASES[name]
+    workdir = tempfile.mkdtemp(prefix=f"bench-{name}-")
+    rng = np.random.default_rng(0)
+    try:
+        backend = create_backend(backend_type, workdir, "bench", **options)
+        start = time.perf_counter()
+        for offset in range(0, rows, batch):
+            n = min(batch, rows - offset)
+            vectors = rng.standard_normal((n, dim), dtype=np.float32)
+            ids = [f"chunk-{offset + i}" for i in range(n)]
+            backend.upsert(ids, vectors.tolist(), [f"text {offset + i}" for i in range(n)], [{"row": offset + i} for i in range(n)])
+        backend.persist()
+        build_seconds = time.perf_counter() - start
+        del backend
+        
+        # 冷启动：重新打开索引并完成第一次查询
+        query_vectors = rng.standard_normal((queries, dim), dtype=np.float32)
+        start = time.perf_counter()
+        backend = create_backend(backend_type, workdir, "bench", **options)
+        backend.search(query_vectors[0].tolist(), k=10)
+        cold_start_seconds = time.perf_counter() - start
+        
+        latencies = []
+        for vector in query_vectors:
+            t = time.perf_counter()
+            backend.search(vector.tolist(), k=10)
+            latencies.append((time.perf_counter() - t) * 1000)
+        
+        result_queue.put({
+            "backend": name,
+            "build_s": round(build_seconds, 2),
+            "cold_start_s": round(cold_start_seconds, 3),
+            "p50_ms": round(float(np.percentile(latencies, 50)), 2),
+            "p95_ms": round(float(np.percentile(latencies, 95)), 2),
+            "peak_rss_mb": round(resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024, 1),
+            "disk_mb": round(_dir_size(workdir) / 1024 / 1024, 1),
+        })
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", type=int, default=100000)
+    parser.add_argument("--dim", type=int, default=768)
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--batch", type=int, default=5000)
+    parser.add_argument("--backends", nargs="+", default=list(CASES), choices=list(CASES))
+    args = parser.parse_args()
+    
+    ctx = multiprocessing.get_context("spawn")
+    columns = ["backend", "build_s", "cold_start_s", "p50_ms", "p95_ms", "peak_rss_mb", "disk_mb"]
+    print(" ".join(f"{c:>12}" for c in columns))
+    for name in args.backends:
+        queue = ctx.Queue()
+        process = ctx.Process(target=_run_case, args=(name, args.rows, args.dim, args.queries, args.batch, queue))
+        process.start()
+        result = queue.get()
+        process.join()
+        print(" ".join(f"{str(result[c]):>12}" for c in columns))
@@ -0,0 +1,56 @@
+"""比较两次 benchmarks.suite 的结果，发现性能回退
+
+用法:
+    python -m benchmarks.compare baseline.json results.json --threshold 0.1
+
+逐项比较两个结果中都存在的指标；按 better 方向变差超过 threshold (相对值) 的
+记为回退。存在回退时以退出码 1 结束，便于在 CI 中使用。
+"""
+import argparse
+import json
+import sys
+
+
+def compare(baseline: dict, current: dict, threshold: float) -> list:
+    """返回 [(指标名, 基线值, 当前值, 相对变化, 是否回退)]"""
+    rows = []
+    for name, base in sorted(baseline["metrics"].items()):
+        metric = current["metrics"].get(name)
+        if metric is None:
+            continue
+        old, new = base["value"], metric["value"]
+        change = (new - old) / old if old else 0.0
+        # 统一成 "正数表示变差"
+        worse = change if base["better"] == "lower" else -change
+        rows.append((name, old, new, change, worse > threshold))
+    return rows
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1, help="允许的相对变差幅度 (默认 10%%)")
+    args = parser.parse_args()
+
+    with open(args.baseline, encoding="utf-8") as f:
+        baseline = json.load(f)
+    with open(args.current, encoding="utf-8") as f:
+        current = json.load(f)
+
+    print(f"baseline: {baseline['meta'].get('commit')} {baseline['meta'].get('timestamp')}")
+    print(f"current:  {current['meta'].get('commit')} {current['meta'].get('timestamp')}")
+    print(f"{'metric':<48} {'baseline':>12} {'current':>12} {'change':>9}")
+
+    regressions = 0
+    for name, old, new, change, regressed in compare(baseline, current, args.threshold):
+        flag = "  REGRESSION" if regressed else ""
+        print(f"{name:<48} {old:>12.2f} {new:>12.2f} {change:>+8.1%}{flag}")
+        regressions += regressed
+
+    missing = sorted(set(baseline["metrics"]) ^ set(current["metrics"]))
+    if missing:
+        print(f"Metrics present in only one run: {', '.join(missing)}")
+
+    print(f"{regressions} regression(s) beyond {args.threshold:.0%}")
+    sys.exit(1 if regressions else 0)
@@ -0,0 +1,192 @@
+"""合成语料生成器：生成 PDF / TXT / DOCX / MD / HTML 格式的确定性测试文档
+
+用法:
+    python -m benchmarks.corpus <out_dir> --docs 20 --paragraphs 50 --formats .pdf .txt .docx .md .html
+
+同一 seed 生成的内容完全相同。PDF 由内置的最小 PDF 写入器生成 (标准 Helvetica 字体，
+可被 pypdf 提取文本)，DOCX 需要 python-docx。
+"""
+import argparse
+import os
+import random
+from typing import List
+
+FORMATS = (".pdf", ".txt", ".docx", ".md", ".html")
+
+_TOPICS = [
+    "vector search", "embedding models", "document parsing", "query rewriting", "context windows",
+    "answer caching", "hybrid retrieval", "token budgets", "chunk overlap", "index compaction",
+    "streaming responses", "rate limiting", "session memory", "notebook isolation", "latency metrics",
+]
+_WORDS = (
+    "system index query document chunk vector score rank token model answer context page section "
+    "latency throughput memory cache batch request response store retrieve parse split embed "
+    "persist compact summary history session notebook metric stage worker queue budget overlap"
+).split()
+
+
+def make_paragraphs(rng: random.Random, count: int, sentences: int = 6) -> List[str]:
+    """生成带主题词的段落，主题词保证关键词检索和向量检索都有可区分的目标"""
+    paragraphs = []
+    for _ in range(count):
+        topic = rng.choice(_TOPICS)
+        parts = []
+        for _ in range(sentences):
+            words = [rng.choice(_WORDS) for _ in range(rng.randint(8, 16))]
+            words.insert(rng.randint(0, len(words)), topic)
+            parts.append(" ".join(words).capitalize() + ".")
+        paragraphs.append(" ".join(parts))
+    return paragraphs
+
+
+_CJK_WORDS = (
+    "系统 索引 查询 文档 分块 向量 得分 排序 模型 回答 上下文 页面 章节 延迟 吞吐 内存 缓存 批量 "
+    "请求 响应 存储 检索 解析 切分 嵌入 持久化 压缩 摘要 历史 会话 笔记本 指标 阶段 队列 预算 重叠"
+).split()
+
+
+def make_cjk_paragraphs(rng: random.Random, count: int, sentences: int = 6) -> List[str]:
+    """生成中文为主、夹杂英文术语的段落 (句末使用中文标点)"""
+    paragraphs = []
+    for _ in range(count):
+        parts = []
+        for _ in range(sentences):
+            words = [rng.choice(_CJK_WORDS) for _ in range(rng.randint(6, 14))]
+            words.insert(rng.randint(0, len(words)), rng.choice(_TOPICS))
+            clause = rng.randint(2, len(words) - 1)
+            parts.append("".join(words[:clause]) + "，" + "".join(words[clause:]) + rng.choice("。。。！？"))
+        paragraphs.append("".join(parts))
+    return paragraphs
+
+
+def make_markdown(rng: random.Random, sections: int, paragraphs: int, cjk_ratio: float = 0.5) -> str:
+    """生成带两级标题的 Markdown 文本，段落按 cjk_ratio 混合中英文"""
+    blocks = []
+    for i in range(sections):
+        blocks.append(f"# {i + 1}. {rng.choice(_TOPICS).title()}")
+        for j in range(rng.randint(1, 3)):
+            blocks.append(f"## {i + 1}.{j + 1} {rng.choice(_CJK_WORDS)}{rng.choice(_CJK_WORDS)}")
+            for _ in range(paragraphs):
+                maker = make_cjk_paragraphs if rng.random() < cjk_ratio else make_paragraphs
+                blocks.append(maker(rng, 1, rng.randint(2, 8))[0])
+    return "\n\n".join(blocks) + "\n"
+
+
+def make_queries(seed: int, count: int) -> List[str]:
+    rng = random.Random(seed + 1)
+    return [
+        f"What does the document say about {rng.choice(_TOPICS)} and {rng.choice(_WORDS)}?"
+        for _ in range(count)
+    ]
+
+
+def _pdf_escape(text: str) -> str:
+    return text.replace("\\", "\\\\").replace("(", "\\(").replace(")", "\\)")
+
+
+def _wrap(text: str, width: int = 90) -> List[str]:
+    lines, line = [], ""
+    for word in text.split():
+        if line and len(line) + len(word) + 1 > width:
+            lines.append(line)
+            line = word
+        else:
+            line = f"{line} {word}" if line else word
+    if line:
+        lines.append(line)
+    return lines
+
+
+def write_pdf(path: str, paragraphs: List[str], lines_per_page: int = 50):
+    """写入只含文本的多页 PDF"""
+    lines = []
+    for paragraph in paragraphs:
+        lines.extend(_wrap(paragraph))
+        lines.append("")
+    pages = [lines[i:i + lines_per_page] for i in range(0, len(lines), lines_per_page)] or [[]]
+
+    # 对象编号：1 Catalog, 2 Pages, 3 Font, 之后每页占用 (Page, Contents) 两个对象
+    objects = {}
+    page_ids = []
+    for index, page_lines in enumerate(pages):
+        page_id, content_id = 4 + index * 2, 5 + index * 2
+        page_ids.append(page_id)
+        text = "".join(f"({_pdf_escape(line)}) '\n" for line in page_lines)
+        stream = f"BT\n/F1 10 Tf\n14 TL\n50 800 Td\n{text}ET\n".encode("latin-1", "replace")
+        objects[content_id] = b"<< /Length %d >>\nstream\n" % len(stream) + stream + b"endstream"
+        objects[page_id] = (
+            f"<< /Type /Page /Parent 2 0 R /MediaBox [0 0 595 842] "
+            f"/Resources << /Font << /F1 3 0 R >> >> /Contents {content_id} 0 R >>"
+        ).encode()
+    objects[1] = b"<< /Type /Catalog /Pages 2 0 R >>"
+    kids = " ".join(f"{page_id} 0 R" for page_id in page_ids)
+    objects[2] = f"<< /Type /Pages /Kids [{kids}] /Count {len(page_ids)} >>".encode()
+    objects[3] = b"<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica >>"
+
+    out = bytearray(b"%PDF-1.4\n")
+    offsets = {}
+    for object_id in sorted(objects):
+        offsets[object_id] = len(out)
+        out += b"%d 0 obj\n" % object_id + objects[object_id] + b"\nendobj\n"
+    xref_offset = len(out)
+    out += b"xref\n0 %d\n0000000000 65535 f \n" % (len(objects) + 1)
+    for object_id in sorted(objects):
+        out += b"%010d 00000 n \n" % offsets[object_id]
+    out += b"trailer\n<< /Size %d /Root 1 0 R >>\nstartxref\n%d\n%%%%EOF\n" % (len(objects) + 1, xref_offset)
+    with open(path, "wb") as f:
+        f.write(out)
+
+
+def write_docx(path: str, paragraphs: List[str]):
+    import docx
+
+    document = docx.Document()
+    for paragraph in paragraphs:
+        document.add_paragraph(paragraph)
+    document.save(path)
+
+
+def write_document(path: str, title: str, paragraphs: List[str]):
+    ext = os.path.splitext(path)[1].lower()
+    if ext == ".pdf":
+        write_pdf(path, [title] + paragraphs)
+    elif ext == ".docx":
+        write_docx(path, [title] + paragraphs)
+    elif ext == ".md":
+        body = "\n\n".join(f"## Section {i + 1}\n\n{p}" for i, p in enumerate(paragraphs))
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"# {title}\n\n{body}\n")
+    elif ext == ".html":
+        body = "\n".join(f"<p>{p}</p>" for p in paragraphs)
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(f"<html><head><title>{title}</title></head><body><h1>{title}</h1>\n{body}\n</body></html>\n")
+    elif ext == ".txt":
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(title + "\n\n" + "\n\n".join(paragraphs) + "\n")
+    else:
+        raise ValueError(f"Unsupported format: {ext}")
+
+
+def generate_corpus(out_dir: str, docs: int, paragraphs: int, formats=FORMATS, seed: int = 0) -> List[str]:
+    """按格式轮流生成 docs 个文档，返回文件路径列表"""
+    os.makedirs(out_dir, exist_ok=True)
+    rng = random.Random(seed)
+    paths = []
+    for i in range(docs):
+        ext = formats[i % len(formats)]
+        path = os.path.join(out_dir, f"doc_{i:04d}{ext}")
+        write_document(path, f"Synthetic document {i}", make_paragraphs(rng, paragraphs))
+        paths.append(path)
+    return paths
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("out_dir")
+    parser.add_argument("--docs", type=int, default=20)
+    parser.add_argument("--paragraphs", type=int, default=50)
+    parser.add_argument("--formats", nargs="+", default=list(FORMATS))
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    paths = generate_corpus(args.out_dir, args.docs, args.paragraphs, tuple(args.formats), args.seed)
+    print(f"Wrote {len(paths)} files to {args.out_dir}")
@@ -0,0 +1,238 @@
+"""本地模拟 LLM 服务：可注入延迟、延迟尖刺和错误，用于测试 LLM 网关的重试、对冲与合并
+
+用法:
+    python -m benchmarks.fake_llm_server --port 8081 --latency 0.05 --spike-probability 0.05 --error-rate 0.05
+
+接口:
+    POST /v1/generate  {"prompt": "...", "stream": false}
+    - 非流式返回 {"text", "input_tokens", "output_tokens"}
+    - 流式返回 NDJSON，每行一个 {"token": "..."}
+    - 注入的错误返回 503 或 429 (只在输出之前发生)
+    GET /v1/stats      请求数、错误数、尖刺数
+
+RemoteFakeChatModel 是对应的 LangChain 对话模型，HTTP 错误抛出带 code 属性的
+FakeLLMServerError，与 google.api_core 异常一样可被网关识别为可重试错误。
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import random
+import threading
+import time
+import urllib.error
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+from benchmarks.fakes import _VOCABULARY
+
+
+class FakeLLMServer:
+    """在后台线程中运行的模拟 LLM HTTP 服务
+
+    latency ± jitter: 正常请求的延迟 (秒)
+    spike_probability / spike_latency: 以一定概率出现的长尾延迟
+    error_rate: 返回 503/429 的概率
+    同一 seed 下注入的延迟和错误序列相同。
+    """
+
+    def __init__(self, host: str = "127.0.0.1", port: int = 0, latency: float = 0.05, jitter: float = 0.02,
+                 spike_probability: float = 0.05, spike_latency: float = 1.0, error_rate: float = 0.05,
+                 tokens: int = 20, seed: int = 0):
+        self.latency = latency
+        self.jitter = jitter
+        self.spike_probability = spike_probability
+        self.spike_latency = spike_latency
+        self.error_rate = error_rate
+        self.tokens = tokens
+        self._lock = threading.Lock()
+        self.reset(seed)
+
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                if self.path != "/v1/stats":
+                    self.send_error(404)
+                    return
+                self._send_json(200, server.stats())
+
+            def do_POST(self):
+                if self.path != "/v1/generate":
+                    self.send_error(404)
+                    return
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                delay, error = server._plan()
+                time.sleep(delay)
+                if error:
+                    self._send_json(error, {"error": "injected failure"})
+                    return
+
+                prompt = body.get("prompt", "")
+                tokens = server.answer_tokens(prompt)
+                if not body.get("stream"):
+                    self._send_json(200, {
+                        "text": "".join(tokens),
+                        "input_tokens": len(prompt.split()),
+                        "output_tokens": len(tokens)
+                    })
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", "application/x-ndjson")
+                self.end_headers()
+                for token in tokens:
+                    self.wfile.write((json.dumps({"token": token}) + "\n").encode("utf-8"))
+                    self.wfile.flush()
+
+            def _send_json(self, status: int, payload: dict):
+                data = json.dumps(payload).encode("utf-8")
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(data)))
+                self.end_headers()
+                self.wfile.write(data)
+
+        self.httpd = ThreadingHTTPServer((host, port), Handler)
+        self.httpd.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def url(self) -> str:
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def reset(self, seed: int = 0):
+        """重置计数与随机序列，便于不同场景使用相同的注入模式"""
+        with self._lock:
+            self._rng = random.Random(seed)
+            self.requests = 0
+            self.errors = 0
+            self.spikes = 0
+
+    def _plan(self):
+        """为一次请求决定 (延迟, 错误状态码或 0)"""
+        with self._lock:
+            self.requests += 1
+            delay = max(0.0, self.latency + self._rng.uniform(-self.jitter, self.jitter))
+            if self._rng.random() < self.spike_probability:
+                self.spikes += 1
+                delay += self.spike_latency
+            error = 0
+            if self._rng.random() < self.error_rate:
+                self.errors += 1
+                error = self._rng.choice((503, 429))
+                # 错误通常比正常响应返回得快
+                delay = delay / 4
+            return delay, error
+
+    def answer_tokens(self, prompt: str) -> List[str]:
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        rng = random.Random(seed)
+        return [rng.choice(_VOCABULARY) + " " for _ in range(self.tokens)]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"requests": self.requests, "errors": self.errors, "spikes": self.spikes}
+
+    def start(self):
+        self._thread = threading.Thread(target=self.httpd.serve_forever, name="fake-llm-server", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+
+class FakeLLMServerError(Exception):
+    """模拟服务返回的 HTTP 错误，code 为状态码"""
+
+    def __init__(self, code: int, message: str = ""):
+        self.code = code
+        super().__init__(f"HTTP {code} {message}".strip())
+
+
+# 异步调用在独立线程池中执行阻塞的 HTTP 请求，避免受默认线程池大小限制
+_client_pool = ThreadPoolExecutor(max_workers=256, thread_name_prefix="fake-llm-client")
+
+
+class RemoteFakeChatModel(BaseChatModel):
+    """调用 FakeLLMServer 的对话模型"""
+
+    url: str
+    timeout: float = 30.0
+
+    @property
+    def _llm_type(self) -> str:
+        return "remote-fake-chat"
+
+    def _request(self, messages: List[BaseMessage], stream: bool):
+        prompt = "\n".join(str(message.content) for message in messages)
+        request = urllib.request.Request(
+            f"{self.url}/v1/generate",
+            data=json.dumps({"prompt": prompt, "stream": stream}).encode("utf-8"),
+            headers={"Content-Type": "application/json"}
+        )
+        try:
+            return urllib.request.urlopen(request, timeout=self.timeout)
+        except urllib.error.HTTPError as e:
+            raise FakeLLMServerError(e.code, e.reason) from None
+        except urllib.error.URLError as e:
+            raise ConnectionError(str(e.reason)) from None
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        with self._request(messages, stream=False) as response:
+            payload = json.loads(response.read())
+        usage = {
+            "input_tokens": payload["input_tokens"],
+            "output_tokens": payload["output_tokens"],
+            "total_tokens": payload["input_tokens"] + payload["output_tokens"]
+        }
+        message = AIMessage(content=payload["text"], usage_metadata=usage)
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(_client_pool, self._generate, messages, stop)
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        with self._request(messages, stream=True) as response:
+            for line in response:
+                if line.strip():
+                    yield ChatGenerationChunk(message=AIMessageChunk(content=json.loads(line)["token"]))
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--latency", type=float, default=0.05)
+    parser.add_argument("--jitter", type=float, default=0.02)
+    parser.add_argument("--spike-probability", type=float, default=0.05)
+    parser.add_argument("--spike-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--tokens", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    server = FakeLLMServer(
+        args.host, args.port, args.latency, args.jitter, args.spike_probability,
+        args.spike_latency, args.error_rate, args.tokens, args.seed
+    )
+    print(f"Fake LLM server listening on {server.url}")
+    try:
+        server.httpd.serve_forever()
+    except KeyboardInterrupt:
+        pass
@@ -0,0 +1,164 @@
+"""离线基准测试用的确定性模拟模型
+
+- FakeChatModel: 替代 ChatGoogleGenerativeAI，可配置首 token 延迟和每秒 token 数，
+  支持同步/异步流式输出，回答内容由输入哈希决定 (同一输入每次输出相同)
+- HashingEmbeddings: 替代 GoogleGenerativeAIEmbeddings，对词做特征哈希后归一化，
+  共享词汇的文本向量相近，检索结果有意义且完全可复现
+
+install_fakes() 会替换 app 中的客户端类，之后创建的 LLMService / VectorStoreService
+都使用模拟实现，不需要 GEMINI_API_KEY，也不访问网络。
+"""
+import asyncio
+import hashlib
+import math
+import os
+import re
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.embeddings import Embeddings
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+
+_WORD_RE = re.compile(r"\w+", re.UNICODE)
+
+_VOCABULARY = (
+    "the document describes how the system stores indexes and retrieves relevant passages "
+    "for each question using embeddings ranking and a language model that writes the answer"
+).split()
+
+
+class FakeChatModel(BaseChatModel):
+    """确定性模拟对话模型
+
+    first_token_latency: 收到请求到第一个 token 的延迟 (秒)
+    tokens_per_second: 之后每个 token 的输出速率，0 表示不限速
+    answer_tokens: 每次回答的 token 数
+    """
+
+    first_token_latency: float = 0.2
+    tokens_per_second: float = 50.0
+    answer_tokens: int = 40
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat"
+
+    def _answer_tokens(self, messages: List[BaseMessage]) -> List[str]:
+        prompt = "\n".join(str(message.content) for message in messages)
+        seed = int.from_bytes(hashlib.sha256(prompt.encode("utf-8")).digest()[:8], "big")
+        tokens = []
+        for i in range(self.answer_tokens):
+            seed = (seed * 6364136223846793005 + 1442695040888963407) % (1 << 64)
+            tokens.append(_VOCABULARY[seed % len(_VOCABULARY)] + " ")
+        return tokens
+
+    def _token_delay(self) -> float:
+        return 1.0 / self.tokens_per_second if self.tokens_per_second > 0 else 0.0
+
+    def _usage(self, messages: List[BaseMessage], output_tokens: int) -> dict:
+        input_tokens = sum(len(str(message.content).split()) for message in messages)
+        return {"input_tokens": input_tokens, "output_tokens": output_tokens, "total_tokens": input_tokens + output_tokens}
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        time.sleep(self.first_token_latency + self._token_delay() * (len(tokens) - 1))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    async def _agenerate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                         run_manager: Optional[AsyncCallbackManagerForLLMRun] = None, **kwargs: Any) -> ChatResult:
+        tokens = self._answer_tokens(messages)
+        await asyncio.sleep(self.first_token_latency + self._token_delay() * (len(tokens) - 1))
+        message = AIMessage(content="".join(tokens), usage_metadata=self._usage(messages, len(tokens)))
+        return ChatResult(generations=[ChatGeneration(message=message)])
+
+    def _stream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                run_manager: Optional[CallbackManagerForLLMRun] = None, **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for i, token in enumerate(self._answer_tokens(messages)):
+            if i:
+                time.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+    async def _astream(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                       run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+                       **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for i, token in enumerate(self._answer_tokens(messages)):
+            if i:
+                await asyncio.sleep(self._token_delay())
+            chunk = ChatGenerationChunk(message=AIMessageChunk(content=token))
+            if run_manager:
+                await run_manager.on_llm_new_token(token, chunk=chunk)
+            yield chunk
+
+
+class HashingEmbeddings(Embeddings):
+    """特征哈希 Embedding：每个词哈希到一个维度并带符号累加，最后做 L2 归一化
+
+    latency 为每次调用的固定延迟 (秒)，per_text_latency 为每条文本的额外延迟，
+    用于模拟远程接口的耗时。
+    """
+
+    def __init__(self, dim: int = 256, latency: float = 0.0, per_text_latency: float = 0.0):
+        self.dim = dim
+        self.latency = latency
+        self.per_text_latency = per_text_latency
+        self.calls = 0
+
+    def _embed(self, text: str) -> List[float]:
+        vector = [0.0] * self.dim
+        for word in _WORD_RE.findall(text.lower()):
+            digest = hashlib.blake2b(word.encode("utf-8"), digest_size=8).digest()
+            index = int.from_bytes(digest[:4], "little") % self.dim
+            vector[index] += 1.0 if digest[4] & 1 else -1.0
+        norm = math.sqrt(sum(value * value for value in vector)) or 1.0
+        return [value / norm for value in vector]
+
+    def _sleep(self, count: int):
+        delay = self.latency + self.per_text_latency * count
+        if delay > 0:
+            time.sleep(delay)
+
+    def embed_documents(self, texts: List[str], task_type: Optional[str] = None) -> List[List[float]]:
+        # 与 Gemini 客户端一样接受 task_type，批量查询向量化走一次调用
+        self.calls += 1
+        self._sleep(len(texts))
+        return [self._embed(text) for text in texts]
+
+    def embed_query(self, text: str) -> List[float]:
+        self.calls += 1
+        self._sleep(1)
+        return self._embed(text)
+
+
+def install_fakes(first_token_latency: float = 0.2, tokens_per_second: float = 50.0,
+                  answer_tokens: int = 40, embedding_dim: int = 256, embedding_latency: float = 0.0):
+    """用模拟实现替换 Gemini 客户端，必须在创建任何服务实例之前调用"""
+    import langchain_google_genai
+    from app.core.config import settings
+
+    settings.GEMINI_API_KEY = settings.GEMINI_API_KEY or "offline-benchmark"
+    os.environ.setdefault("GEMINI_API_KEY", settings.GEMINI_API_KEY)
+
+    def chat_model_factory(**kwargs):
+        return FakeChatModel(
+            first_token_latency=first_token_latency,
+            tokens_per_second=tokens_per_second,
+            answer_tokens=answer_tokens,
+            callbacks=kwargs.get("callbacks")
+        )
+
+    def embeddings_factory(**kwargs):
+        return HashingEmbeddings(dim=embedding_dim, latency=embedding_latency)
+
+    # app 中在创建客户端时才从 langchain_google_genai 导入，替换模块属性即可生效
+    langchain_google_genai.ChatGoogleGenerativeAI = chat_model_factory
+    langchain_google_genai.GoogleGenerativeAIEmbeddings = embeddings_factory
@@ -0,0 +1,126 @@
+"""LLM 网关基准测试：在注入延迟尖刺和错误的本地模拟 LLM 服务上比较不同调用方式
+
+用法:
+    python -m benchmarks.llm_gateway --output gateway.json
+    python -m benchmarks.llm_gateway --quick --output gateway_quick.json
+    python -m benchmarks.compare gateway_baseline.json gateway.json
+
+场景 (同一注入序列)：
+- direct: 直接调用模型，无重试、无并发限制
+- gateway: 经过 LLMGateway，相同请求合并、带抖动的重试
+- gateway_hedged: 在 gateway 基础上启用对冲请求
+
+请求中有一部分来自少量热点问题，并发发出，用于观察请求合并的效果。
+每个场景输出成功率、延迟分位数以及实际到达模拟服务的请求数。
+"""
+import argparse
+import asyncio
+import json
+import random
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.fake_llm_server import FakeLLMServer, RemoteFakeChatModel
+from benchmarks.suite import Results
+
+
+def make_prompts(count: int, duplicate_rate: float, hot_prompts: int, seed: int) -> List[str]:
+    rng = random.Random(seed)
+    return [
+        f"hot question {rng.randrange(hot_prompts)}" if rng.random() < duplicate_rate else f"question {i}"
+        for i in range(count)
+    ]
+
+
+async def run_workload(model, prompts: List[str], concurrency: int) -> Dict[str, List]:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies, failures = [], []
+
+    async def one(prompt: str):
+        async with semaphore:
+            start = time.perf_counter()
+            try:
+                await model.ainvoke(prompt)
+                latencies.append((time.perf_counter() - start) * 1000)
+            except Exception as e:
+                failures.append(type(e).__name__)
+
+    await asyncio.gather(*[one(prompt) for prompt in prompts])
+    return {"latencies": latencies, "failures": failures}
+
+
+def run_scenario(results: Results, name: str, model, server: FakeLLMServer, prompts: List[str], args):
+    server.reset(args.seed)
+    start = time.perf_counter()
+    outcome = asyncio.run(run_workload(model, prompts, args.concurrency))
+    elapsed = time.perf_counter() - start
+
+    latencies = outcome["latencies"]
+    print(f"{name}: {len(latencies)}/{len(prompts)} succeeded in {elapsed:.2f}s, server {server.stats()}")
+    results.add(f"llm_gateway.{name}.success_rate", len(latencies) / len(prompts), "ratio", "higher")
+    if latencies:
+        for percentile in (50, 95, 99):
+            results.add(f"llm_gateway.{name}.p{percentile}_ms", float(np.percentile(latencies, percentile)), "ms", "lower")
+    results.add(f"llm_gateway.{name}.upstream_requests", server.stats()["requests"], "requests", "lower")
+
+
+def run(args):
+    from app.services.llm_gateway import LLMGateway, GatewayChatModel
+
+    server = FakeLLMServer(
+        latency=args.latency, spike_probability=args.spike_probability, spike_latency=args.spike_latency,
+        error_rate=args.error_rate, seed=args.seed
+    ).start()
+    prompts = make_prompts(args.requests, args.duplicate_rate, args.hot_prompts, args.seed)
+    remote = RemoteFakeChatModel(url=server.url)
+
+    def gateway_model(hedge_delay: float):
+        gateway = LLMGateway(
+            max_concurrency=args.concurrency,
+            queue_timeout=60,
+            coalesce=True,
+            max_retries=args.max_retries,
+            backoff_base=args.backoff_base,
+            hedge_delay=hedge_delay
+        )
+        return GatewayChatModel(llm=remote, gateway=gateway)
+
+    results = Results()
+    try:
+        run_scenario(results, "direct", remote, server, prompts, args)
+        run_scenario(results, "gateway", gateway_model(0), server, prompts, args)
+        run_scenario(results, "gateway_hedged", gateway_model(args.hedge_delay), server, prompts, args)
+    finally:
+        server.stop()
+
+    output = {
+        "meta": {"timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"), "args": vars(args)},
+        "metrics": results.metrics
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="llm_gateway_results.json")
+    parser.add_argument("--quick", action="store_true", help="小规模运行，用于快速检查")
+    parser.add_argument("--requests", type=int, default=400)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--duplicate-rate", type=float, default=0.3, help="来自热点问题的请求比例")
+    parser.add_argument("--hot-prompts", type=int, default=5)
+    parser.add_argument("--latency", type=float, default=0.05, help="模拟服务的正常延迟 (秒)")
+    parser.add_argument("--spike-probability", type=float, default=0.05)
+    parser.add_argument("--spike-latency", type=float, default=1.0)
+    parser.add_argument("--error-rate", type=float, default=0.05)
+    parser.add_argument("--max-retries", type=int, default=3)
+    parser.add_argument("--backoff-base", type=float, default=0.05)
+    parser.add_argument("--hedge-delay", type=float, default=0.15, help="对冲请求的触发延迟 (秒)")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args()
+    if args.quick:
+        args.requests = 120
+    run(args)
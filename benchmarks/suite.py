@@ -0,0 +1,367 @@
+"""离线基准测试套件 (无需 GEMINI_API_KEY，不访问网络)
+
+用法:
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --quick --output quick.json
+    python -m benchmarks.compare baseline.json results.json
+
+使用 benchmarks.fakes 中的模拟 LLM 与哈希 Embedding，在临时目录中：
+0. 在全新子进程中测量 import main 的耗时与后台预热 (创建客户端、加载默认笔记本) 耗时
+1. 生成 PDF/TXT/DOCX/MD/HTML 合成语料，分别测量解析、分割、向量化、写入索引的吞吐
+2. 在不同语料规模和 search_top_k 下测量检索延迟
+3. 通过 ChatService.achat_stream 测量端到端的首 token 延迟与总耗时
+4. 比较逐个调用 achat 与 achat_batch 批量问答的吞吐
+5. 索引快照的导出、导入 (副本冷启动) 耗时，以及多次小批量写入时逐次落盘与分组落盘的吞吐
+
+结果写入 JSON：metrics 中每项带有 unit 与 better (higher/lower)，
+供 benchmarks.compare 在两次运行之间比较、发现性能回退。
+"""
+import argparse
+import asyncio
+import json
+import os
+import platform
+import random
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from benchmarks.fakes import install_fakes
+from benchmarks.corpus import FORMATS, generate_corpus, make_paragraphs, make_queries
+
+
+class Results:
+    def __init__(self):
+        self.metrics: Dict[str, Dict] = {}
+
+    def add(self, name: str, value: float, unit: str, better: str):
+        self.metrics[name] = {"value": round(float(value), 4), "unit": unit, "better": better}
+        print(f"  {name:<48} {value:>12.2f} {unit}")
+
+
+def _percentiles(samples: List[float]) -> Dict[str, float]:
+    return {"p50": float(np.percentile(samples, 50)), "p95": float(np.percentile(samples, 95))}
+
+
+def _git_commit() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except Exception:
+        return "unknown"
+
+
+# 在子进程中执行，避免当前进程已导入的模块影响测量
+_STARTUP_SCRIPT = """
+import time
+start = time.perf_counter()
+import main
+import_seconds = time.perf_counter() - start
+from benchmarks.fakes import install_fakes
+install_fakes()
+from app.services.notebook_service import NotebookManager
+start = time.perf_counter()
+NotebookManager().warm_up()
+print(import_seconds, time.perf_counter() - start)
+"""
+
+
+def bench_startup(results: Results, workdir: str, runs: int):
+    print("Startup")
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=repo_root)
+    import_times, warm_up_times = [], []
+    for i in range(runs):
+        # 每次使用空目录，预热不会读到上一次的数据，也不会写入仓库的 data/
+        cwd = os.path.join(workdir, f"startup_{i}")
+        os.makedirs(cwd)
+        output = subprocess.run(
+            [sys.executable, "-c", _STARTUP_SCRIPT], cwd=cwd, env=env,
+            capture_output=True, text=True, check=True
+        ).stdout.strip().splitlines()[-1]
+        import_seconds, warm_up_seconds = map(float, output.split())
+        import_times.append(import_seconds * 1000)
+        warm_up_times.append(warm_up_seconds * 1000)
+    results.add("startup.import_main_ms", float(np.median(import_times)), "ms", "lower")
+    results.add("startup.warm_up_ms", float(np.median(warm_up_times)), "ms", "lower")
+
+
+def bench_ingestion(results: Results, workdir: str, docs_per_format: int, paragraphs: int):
+    from app.core.config import settings
+    from app.services.document_processor import DocumentProcessor
+    from app.services.ingest_manifest import hash_file
+    from app.services.vector_store import VectorStoreService
+
+    print("Ingestion")
+    corpus_dir = os.path.join(workdir, "corpus")
+    paths = generate_corpus(corpus_dir, docs_per_format * len(FORMATS), paragraphs)
+    processor = DocumentProcessor()
+
+    all_chunks = []
+    for ext in FORMATS:
+        format_paths = [path for path in paths if path.endswith(ext)]
+        parse_seconds = split_seconds = 0.0
+        chunks = []
+        try:
+            for path in format_paths:
+                start = time.perf_counter()
+                pages = processor.load_document(path)
+                parse_seconds += time.perf_counter() - start
+                start = time.perf_counter()
+                chunks.extend(processor.split_documents(pages))
+                split_seconds += time.perf_counter() - start
+        except Exception as e:
+            # 缺少可选解析依赖 (如 unstructured) 时跳过该格式
+            print(f"  {ext}: skipped ({type(e).__name__}: {e})")
+            continue
+
+        size_mb = sum(os.path.getsize(path) for path in format_paths) / 1e6
+        fmt = ext.lstrip(".")
+        results.add(f"ingest.parse.{fmt}.mb_per_s", size_mb / max(parse_seconds, 1e-9), "MB/s", "higher")
+        results.add(f"ingest.split.{fmt}.chunks_per_s", len(chunks) / max(split_seconds, 1e-9), "chunks/s", "higher")
+        all_chunks.extend(chunks)
+
+    if not all_chunks:
+        return None, 0.0
+
+    vector_store = VectorStoreService(persist_directory=os.path.join(workdir, "ingest_index"))
+    texts = [chunk.page_content for chunk in all_chunks]
+    vectors = [None] * len(texts)
+
+    def collect(start, end, batch_vectors):
+        vectors[start:end] = batch_vectors
+
+    start = time.perf_counter()
+    vector_store.embedding_pipeline.run(texts, collect)
+    embed_seconds = time.perf_counter() - start
+    results.add("ingest.embed.chunks_per_s", len(texts) / embed_seconds, "chunks/s", "higher")
+
+    ids = [f"chunk-{i}" for i in range(len(texts))]
+    metadatas = [chunk.metadata for chunk in all_chunks]
+    start = time.perf_counter()
+    vector_store.backend.upsert(ids, vectors, texts, metadatas)
+    vector_store.lexical_index.add(ids, texts)
+    vector_store.backend.persist()
+    vector_store.lexical_index.save()
+    index_seconds = time.perf_counter() - start
+    results.add("ingest.index.chunks_per_s", len(texts) / index_seconds, "chunks/s", "higher")
+
+    start = time.perf_counter()
+    indexed = VectorStoreService(persist_directory=os.path.join(workdir, "e2e_index"))
+    chunks = 0
+    for path, docs, error in processor.process_files(paths, max_workers=settings.PARSE_WORKERS):
+        if error is None:
+            indexed.sync_file(path, hash_file(path), docs)
+            chunks += len(docs)
+    indexed.flush()
+    total_seconds = time.perf_counter() - start
+    results.add("ingest.end_to_end.chunks_per_s", chunks / total_seconds, "chunks/s", "higher")
+    return indexed, total_seconds
+
+
+def bench_retrieval(results: Results, workdir: str, sizes: List[int], top_ks: List[int], queries: int):
+    from langchain_core.documents import Document
+    from app.services.vector_store import VectorStoreService
+
+    print("Retrieval")
+    questions = make_queries(0, queries)
+    for size in sizes:
+        vector_store = VectorStoreService(persist_directory=os.path.join(workdir, f"retrieval_{size}"))
+        rng = random.Random(size)
+        docs = [
+            Document(page_content=text, metadata={"source": f"synthetic_{i // 50}.txt"})
+            for i, text in enumerate(make_paragraphs(rng, size, sentences=3))
+        ]
+        vector_store.add_documents(docs)
+
+        for k in top_ks:
+            retriever = vector_store.get_retriever({"k": k})
+            retriever.invoke(questions[0])
+            latencies = []
+            for question in questions:
+                start = time.perf_counter()
+                retriever.invoke(question)
+                latencies.append((time.perf_counter() - start) * 1000)
+            stats = _percentiles(latencies)
+            results.add(f"retrieval.n{size}.k{k}.p50_ms", stats["p50"], "ms", "lower")
+            results.add(f"retrieval.n{size}.k{k}.p95_ms", stats["p95"], "ms", "lower")
+
+
+def bench_streaming(results: Results, vector_store, queries: int):
+    from app.services.chat_service import ChatService
+
+    print("Streaming")
+    chat_service = ChatService(vector_store=vector_store)
+    questions = make_queries(1, queries)
+
+    async def run_one(question: str):
+        start = time.perf_counter()
+        first_token = None
+        async for chunk in chat_service.achat_stream(question):
+            if chunk["type"] == "answer" and first_token is None:
+                first_token = time.perf_counter() - start
+        return first_token * 1000, (time.perf_counter() - start) * 1000
+
+    async def run_all():
+        return [await run_one(question) for question in questions]
+
+    timings = asyncio.run(run_all())
+    chat_service.close()
+    ttft = _percentiles([t[0] for t in timings])
+    total = _percentiles([t[1] for t in timings])
+    results.add("stream.ttft.p50_ms", ttft["p50"], "ms", "lower")
+    results.add("stream.ttft.p95_ms", ttft["p95"], "ms", "lower")
+    results.add("stream.total.p50_ms", total["p50"], "ms", "lower")
+    results.add("stream.total.p95_ms", total["p95"], "ms", "lower")
+
+
+def bench_batch(results: Results, vector_store, queries: int, sequential_queries: int, concurrency: int):
+    from app.services.chat_service import ChatService
+
+    print("Batch")
+    chat_service = ChatService(vector_store=vector_store)
+    questions = make_queries(2, queries)
+
+    async def run_sequential():
+        for question in questions[:sequential_queries]:
+            await chat_service.achat(question)
+
+    async def run_batch():
+        return [item async for item in chat_service.achat_batch(questions, max_concurrency=concurrency)]
+
+    # 逐个调用太慢，只跑前 sequential_queries 个问题估算吞吐
+    start = time.perf_counter()
+    asyncio.run(run_sequential())
+    sequential_qps = sequential_queries / (time.perf_counter() - start)
+
+    start = time.perf_counter()
+    items = asyncio.run(run_batch())
+    batch_qps = len(items) / (time.perf_counter() - start)
+    chat_service.close()
+    results.add("batch.sequential.questions_per_s", sequential_qps, "q/s", "higher")
+    results.add("batch.questions_per_s", batch_qps, "q/s", "higher")
+    results.add("batch.speedup", batch_qps / sequential_qps, "x", "higher")
+
+
+def bench_snapshot(results: Results, workdir: str, vector_store, reindex_seconds: float):
+    from app.services.vector_store import VectorStoreService
+
+    print("Snapshot")
+    path = os.path.join(workdir, "snapshot.tar.gz")
+    start = time.perf_counter()
+    header = vector_store.export_snapshot(path)
+    results.add("snapshot.export_s", time.perf_counter() - start, "s", "lower")
+    results.add("snapshot.size_mb", os.path.getsize(path) / 1e6, "MB", "lower")
+
+    # 新副本冷启动：打开空索引并导入快照，与重新解析、向量化全部语料对比
+    start = time.perf_counter()
+    replica = VectorStoreService(persist_directory=os.path.join(workdir, "replica_index"))
+    replica.import_snapshot(path)
+    cold_start = time.perf_counter() - start
+    replica.close()
+    results.add("snapshot.cold_start_s", cold_start, "s", "lower")
+    results.add("snapshot.import.chunks_per_s", header["count"] / cold_start, "chunks/s", "higher")
+    results.add("snapshot.cold_start_speedup", reindex_seconds / cold_start, "x", "higher")
+
+
+def bench_persist(results: Results, workdir: str, base_chunks: int, writes: int):
+    from langchain_core.documents import Document
+    from app.core.config import settings
+    from app.services.vector_store import VectorStoreService
+
+    print("Persist")
+    rng = random.Random(3)
+    base = [Document(page_content=text) for text in make_paragraphs(rng, base_chunks, sentences=3)]
+    small = [[Document(page_content=text)] for text in make_paragraphs(rng, writes, sentences=3)]
+    default_interval = settings.PERSIST_INTERVAL_SECONDS
+    # persist_interval 为 0 即原来的每次写入后落盘
+    for name, interval in (("per_write", 0), ("group_commit", default_interval or 5)):
+        settings.PERSIST_INTERVAL_SECONDS = interval
+        vector_store = VectorStoreService(persist_directory=os.path.join(workdir, f"persist_{name}"))
+        vector_store.add_documents(base)
+        start = time.perf_counter()
+        for docs in small:
+            vector_store.add_documents(docs)
+        vector_store.close()
+        results.add(f"persist.{name}.writes_per_s", writes / (time.perf_counter() - start), "writes/s", "higher")
+    settings.PERSIST_INTERVAL_SECONDS = default_interval
+
+
+def run(args):
+    install_fakes(
+        first_token_latency=args.llm_latency,
+        tokens_per_second=args.tokens_per_second,
+        embedding_latency=args.embedding_latency
+    )
+    from app.core.config import settings
+
+    # 缓存会让重复运行的结果不可比，基准测试中全部关闭
+    settings.EMBEDDING_CACHE_ENABLED = False
+    settings.ANSWER_CACHE_ENABLED = False
+
+    results = Results()
+    workdir = tempfile.mkdtemp(prefix="rag-bench-")
+    try:
+        bench_startup(results, workdir, args.startup_runs)
+        vector_store, reindex_seconds = bench_ingestion(results, workdir, args.docs_per_format, args.paragraphs)
+        bench_retrieval(results, workdir, args.sizes, args.top_k, args.queries)
+        if vector_store is not None:
+            bench_snapshot(results, workdir, vector_store, reindex_seconds)
+            bench_streaming(results, vector_store, args.stream_queries)
+            bench_batch(results, vector_store, args.batch_queries, args.sequential_queries, args.batch_concurrency)
+        bench_persist(results, workdir, args.persist_base_chunks, args.persist_writes)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    output = {
+        "meta": {
+            "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "vector_store_type": settings.VECTOR_STORE_TYPE,
+            "retrieval_mode": settings.RETRIEVAL_MODE,
+            "chunk_size": settings.CHUNK_SIZE,
+            "args": vars(args)
+        },
+        "metrics": results.metrics
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"Results written to {args.output}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--output", default="benchmark_results.json")
+    parser.add_argument("--quick", action="store_true", help="小规模运行，用于快速检查")
+    parser.add_argument("--docs-per-format", type=int, default=10)
+    parser.add_argument("--paragraphs", type=int, default=100)
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--top-k", type=int, nargs="+", default=[5, 15, 30])
+    parser.add_argument("--queries", type=int, default=100)
+    parser.add_argument("--stream-queries", type=int, default=20)
+    parser.add_argument("--startup-runs", type=int, default=3)
+    parser.add_argument("--batch-queries", type=int, default=200)
+    parser.add_argument("--sequential-queries", type=int, default=20, help="逐个调用的对照组问题数")
+    parser.add_argument("--batch-concurrency", type=int, default=16)
+    parser.add_argument("--persist-base-chunks", type=int, default=20000, help="测量落盘方式前索引中已有的 chunk 数")
+    parser.add_argument("--persist-writes", type=int, default=200, help="小批量写入次数")
+    parser.add_argument("--llm-latency", type=float, default=0.2, help="模拟 LLM 首 token 延迟 (秒)")
+    parser.add_argument("--tokens-per-second", type=float, default=50.0)
+    parser.add_argument("--embedding-latency", type=float, default=0.0, help="模拟 Embedding 每次调用的延迟 (秒)")
+    args = parser.parse_args()
+    if args.quick:
+        args.docs_per_format, args.paragraphs = 2, 20
+        args.sizes, args.queries, args.stream_queries = [500], 20, 5
+        args.startup_runs = 1
+        args.batch_queries, args.sequential_queries = 40, 5
+        args.persist_base_chunks, args.persist_writes = 2000, 50
+    run(args)
@@ -1,15 +1,70 @@
+import time
 import uvicorn
-from fastapi import FastAPI
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, Request
+from fastapi.responses import JSONResponse, PlainTextResponse
 from app.core.config import settings
 from app.api.api import api_router
+from app.services.notebook_service import NotebookManager, NotebookNotFoundError
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.directory_watcher import DirectoryWatcher
+from app.services.metrics import registry, HTTP_LATENCY
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 进程内唯一的服务实例：Embedding / LLM 客户端只初始化一次，各笔记本按需加载
+    app.state.notebooks = NotebookManager()
+    app.state.job_manager = IngestionJobManager(app.state.notebooks)
+    # 依赖导入与客户端创建放到后台线程，启动后即可响应 /health，预热进度见 /ready
+    if settings.config.get("server", {}).get("warm_up", True):
+        app.state.notebooks.start_warm_up()
+    # 目录监听：文件变化时自动增量更新索引
+    app.state.watcher = None
+    if settings.WATCH_ENABLED and settings.WATCH_DIRECTORIES:
+        app.state.watcher = DirectoryWatcher(
+            app.state.notebooks, settings.WATCH_DIRECTORIES, notebook_id=settings.WATCH_NOTEBOOK_ID
+        )
+        app.state.watcher.start()
+    yield
+    if app.state.watcher is not None:
+        app.state.watcher.stop()
+    app.state.job_manager.shutdown()
+    app.state.notebooks.close()
 
 app = FastAPI(
     title="GeminiDocAgent API",
     description="A NotebookLM-like document analysis agent using Gemini and LangChain",
     version="0.1.0",
-    debug=settings.config.get("server", {}).get("debug", False)
+    debug=settings.config.get("server", {}).get("debug", False),
+    lifespan=lifespan
 )
 
+@app.exception_handler(NotebookNotFoundError)
+async def notebook_not_found_handler(request: Request, exc: NotebookNotFoundError):
+    return JSONResponse(status_code=404, content={"detail": "Notebook not found"})
+
+def _route_template(request: Request) -> str:
+    """把路径参数还原为模板 (如 /jobs/{job_id})，避免指标标签随 ID 无限增长"""
+    if request.scope.get("route") is None:
+        return "unmatched"
+    path = request.url.path
+    for name, value in request.path_params.items():
+        path = path.replace(f"/{value}", f"/{{{name}}}", 1)
+    return path
+
+@app.middleware("http")
+async def record_request_latency(request: Request, call_next):
+    start = time.perf_counter()
+    response = await call_next(request)
+    if settings.METRICS_ENABLED:
+        HTTP_LATENCY.observe(time.perf_counter() - start, method=request.method, path=_route_template(request), status=response.status_code)
+    return response
+
+@app.get("/metrics", include_in_schema=False)
+def metrics():
+    """Prometheus 格式的监控指标"""
+    return PlainTextResponse(registry.render(), media_type="text/plain; version=0.0.4")
+
 @app.get("/")
 def read_root():
     return {"message": "Welcome to GeminiDocAgent API"}
@@ -18,6 +73,18 @@ def read_root():
 def health_check():
     return {"status": "healthy"}
 
+@app.get("/ready")
+def readiness_check(request: Request):
+    """预热完成前返回 503，供负载均衡判断是否可以转发流量"""
+    notebooks = request.app.state.notebooks
+    content = {
+        "status": notebooks.warm_up_status,
+        "warm_up_seconds": notebooks.warm_up_seconds,
+        "error": notebooks.warm_up_error
+    }
+    ready = notebooks.warm_up_status in ("ready", "lazy")
+    return JSONResponse(status_code=200 if ready else 503, content=content)
+
 app.include_router(api_router, prefix="/api/v1")
 
 if __name__ == "__main__":
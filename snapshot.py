@@ -0,0 +1,35 @@
+"""索引快照命令行入口
+
+用法:
+    python snapshot.py export index_snapshot.tar.gz --notebook default
+    python snapshot.py import index_snapshot.tar.gz --notebook default
+
+export 导出笔记本的向量、chunk 正文与元数据、父段落与入库清单；
+import 用快照替换笔记本的索引，不调用 Embedding 接口。
+新副本也可以在 config.yaml 中设置 vector_store.bootstrap_snapshot，启动时自动导入。
+注意不要在 API 服务运行时对同一个笔记本执行 import。
+"""
+import argparse
+import time
+
+from app.services.notebook_service import NotebookManager, DEFAULT_NOTEBOOK_ID
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("action", choices=["export", "import"])
+    parser.add_argument("path")
+    parser.add_argument("--notebook", default=DEFAULT_NOTEBOOK_ID)
+    args = parser.parse_args()
+
+    notebooks = NotebookManager()
+    try:
+        with notebooks.use(args.notebook) as chat_service:
+            vector_store = chat_service.vector_store
+            start = time.perf_counter()
+            if args.action == "export":
+                header = vector_store.export_snapshot(args.path)
+            else:
+                header = vector_store.import_snapshot(args.path)
+        print(f"{args.action} finished in {time.perf_counter() - start:.2f}s: {header['count']} chunks")
+    finally:
+        notebooks.close()
@@ -10,6 +10,7 @@ st.set_page_config(page_title="GeminiDocAgent", layout="wide")
 # 初始化 ChatService (单例模式)
 @st.cache_resource
 def get_chat_service():
+    settings.ensure_directories()
     return ChatService()
 
 chat_service = get_chat_service()
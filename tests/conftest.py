@@ -0,0 +1,49 @@
+import pytest
+
+from benchmarks.fakes import install_fakes
+from app.core.config import settings
+
+
+@pytest.fixture(autouse=True)
+def isolated_settings(tmp_path, monkeypatch):
+    """每个测试使用独立的数据目录与模拟模型 (benchmarks.fakes)，不访问网络
+
+    默认使用 numpy 后端 (启动快)，立即落盘、单进程解析；需要其他配置的测试自行 monkeypatch，
+    索引相关的测试通过 vector_backend 在 numpy 与 chroma 上各运行一次。
+    """
+    install_fakes(first_token_latency=0, tokens_per_second=0)
+    overrides = {
+        "VECTOR_DB_DIR": str(tmp_path / "vector_db"),
+        "UPLOAD_DIR": str(tmp_path / "uploads"),
+        "EMBEDDING_CACHE_PATH": str(tmp_path / "embedding_cache.sqlite"),
+        "SESSION_SQLITE_PATH": str(tmp_path / "sessions.sqlite"),
+        "VECTOR_STORE_TYPE": "numpy",
+        "PERSIST_INTERVAL_SECONDS": 0,
+        "PARSE_WORKERS": 1,
+        "BOOTSTRAP_SNAPSHOT": "",
+        "WATCH_ENABLED": False
+    }
+    for name, value in overrides.items():
+        monkeypatch.setattr(settings, name, value)
+    settings.ensure_directories()
+    return settings
+
+
+@pytest.fixture(params=["numpy", "chroma"])
+def vector_backend(request, isolated_settings, monkeypatch):
+    """在两种向量后端上各运行一次 (chroma 为生产默认)"""
+    monkeypatch.setattr(isolated_settings, "VECTOR_STORE_TYPE", request.param)
+    return request.param
+
+
+@pytest.fixture
+def write_file(tmp_path):
+    """在临时目录下写入文本文件，返回绝对路径"""
+
+    def write(name: str, content: str) -> str:
+        path = tmp_path / "files" / name
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(content, encoding="utf-8")
+        return str(path)
+
+    return write
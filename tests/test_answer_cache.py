@@ -0,0 +1,54 @@
+import asyncio
+
+from app.services.answer_cache import SemanticAnswerCache
+from app.services.chat_service import ChatService
+
+
+def test_lookup_matches_similar_questions():
+    cache = SemanticAnswerCache(threshold=0.9)
+    cache.store([1.0, 0.0], 1, "q", "answer", [])
+
+    assert cache.lookup([0.99, 0.05], 1)["answer"] == "answer"
+    assert cache.lookup([0.0, 1.0], 1) is None
+
+
+def test_new_version_invalidates_entries():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], 1, "q", "old", [])
+
+    assert cache.lookup([1.0, 0.0], 2) is None
+    assert cache.stats()["entries"] == 0
+
+
+def test_stale_store_is_dropped():
+    cache = SemanticAnswerCache()
+    cache.store([1.0, 0.0], 2, "fresh", "fresh answer", [])
+    # 生成期间索引已更新到版本 2，版本 1 的答案不应写入，也不能清掉新答案
+    cache.store([0.0, 1.0], 1, "stale", "stale answer", [])
+
+    assert cache.lookup([1.0, 0.0], 2)["answer"] == "fresh answer"
+    assert cache.lookup([0.0, 1.0], 2) is None
+    assert cache.lookup([1.0, 0.0], 1) is None
+    assert cache.stats()["entries"] == 1
+
+
+def test_history_free_query_embeds_once(isolated_settings, write_file):
+    service = ChatService()
+    service.index_files([write_file("notes.txt", "The numpy backend stores vectors in a memory mapped file.")])
+    cache = service.vector_store.embedding_cache
+
+    def query_embeddings():
+        return cache.hits + cache.misses
+
+    before = query_embeddings()
+    service.chat("How are vectors stored?")
+    assert query_embeddings() - before == 1
+
+    before = query_embeddings()
+    asyncio.run(service.achat("Where does the backend keep vectors?"))
+    assert query_embeddings() - before == 1
+
+    # 第二次提问命中答案缓存
+    assert service.chat("How are vectors stored?")["answer"]
+    assert service.answer_cache.stats()["hits"] == 1
+    service.close()
@@ -0,0 +1,59 @@
+import asyncio
+import random
+import time
+
+import httpx
+import numpy as np
+
+from benchmarks.corpus import make_paragraphs, make_queries
+from benchmarks.fakes import install_fakes
+from app.core.config import settings
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.notebook_service import NotebookManager
+
+
+async def _query_latencies(client: httpx.AsyncClient, questions, concurrency: int):
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one(question):
+        async with semaphore:
+            start = time.perf_counter()
+            response = await client.post("/api/v1/chat/query", json={"question": question})
+            assert response.status_code == 200, response.text
+            latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*[one(question) for question in questions])
+    return latencies
+
+
+def test_concurrent_queries_overlap(monkeypatch, write_file):
+    """负载测试：LLM 固定 0.2s 延迟，并发 16 时的 p99 应与串行时接近，而不是随并发线性增长"""
+    import main
+
+    install_fakes(first_token_latency=0.2, tokens_per_second=0)
+    monkeypatch.setattr(settings, "ANSWER_CACHE_ENABLED", False)
+    notebooks = NotebookManager()
+    path = write_file("corpus.txt", "\n\n".join(make_paragraphs(random.Random(0), 60, 3)))
+    with notebooks.use() as chat_service:
+        chat_service.index_files([path])
+    main.app.state.notebooks = notebooks
+    main.app.state.job_manager = IngestionJobManager(notebooks)
+    questions = [f"{query} #{i}" for i, query in enumerate(make_queries(0, 40))]
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            serial = await _query_latencies(client, questions[:8], concurrency=1)
+            concurrent = await _query_latencies(client, questions[8:40], concurrency=16)
+        return serial, concurrent
+
+    try:
+        serial, concurrent = asyncio.run(run())
+    finally:
+        main.app.state.job_manager.shutdown()
+        notebooks.close()
+
+    serial_p99 = float(np.percentile(serial, 99))
+    concurrent_p99 = float(np.percentile(concurrent, 99))
+    assert concurrent_p99 < serial_p99 * 3, (serial_p99, concurrent_p99)
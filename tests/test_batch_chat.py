@@ -0,0 +1,60 @@
+import asyncio
+
+import httpx
+
+from app.services.chat_service import ChatService
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.notebook_service import NotebookManager
+
+
+def _post_batch(payload):
+    import main
+
+    notebooks = NotebookManager()
+    main.app.state.notebooks = notebooks
+    main.app.state.job_manager = IngestionJobManager(notebooks)
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            return await client.post("/api/v1/chat/batch", json=payload)
+
+    try:
+        return asyncio.run(run())
+    finally:
+        main.app.state.job_manager.shutdown()
+        notebooks.close()
+
+
+def test_invalid_max_concurrency_is_rejected():
+    assert _post_batch({"questions": ["a"], "max_concurrency": 0}).status_code == 422
+    assert _post_batch({"questions": ["a"], "max_concurrency": 10 ** 6}).status_code == 422
+    assert _post_batch({"questions": ["a"], "max_concurrency": 1}).status_code == 200
+
+
+def test_scheduling_failure_becomes_per_item_errors(monkeypatch):
+    """检索阶段的意外错误逐个返回给对应问题，批量请求不会一直等待"""
+    original = ChatService._prepare_batch
+
+    def short_prepare(self, questions):
+        # 少返回一项，模拟准备阶段的意外错误
+        return original(self, questions)[:-1]
+
+    monkeypatch.setattr(ChatService, "_prepare_batch", short_prepare)
+    notebooks = NotebookManager()
+    questions = ["first question", "second question", "third question"]
+
+    async def run(service):
+        return [item async for item in service.achat_batch(questions)]
+
+    try:
+        with notebooks.use() as service:
+            items = asyncio.run(asyncio.wait_for(run(service), timeout=10))
+    finally:
+        notebooks.close()
+
+    by_index = {item["index"]: item for item in items}
+    assert sorted(by_index) == [0, 1, 2]
+    assert by_index[0]["type"] == "result"
+    assert by_index[1]["type"] == "result"
+    assert by_index[2]["type"] == "error"
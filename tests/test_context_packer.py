@@ -0,0 +1,55 @@
+from langchain_core.documents import Document
+
+from app.services.context_packer import ContextPacker, count_tokens
+from app.services.metrics import CONTEXT_TOKENS_SAVED
+
+
+def _saved_tokens_sum() -> float:
+    line = next(line for line in CONTEXT_TOKENS_SAVED.render() if line.startswith("rag_context_tokens_saved_sum"))
+    return float(line.split()[-1])
+
+
+def _doc(text, start=None):
+    metadata = {"source": "a.txt"}
+    if start is not None:
+        metadata.update(start_index=start, end_index=start + len(text))
+    return Document(page_content=text, metadata=metadata)
+
+
+def test_overlapping_chunks_are_merged():
+    text = "The index stores normalized vectors. Queries are embedded once and scored against every row."
+    first, second = _doc(text[:60], 0), _doc(text[40:], 40)
+
+    merged = ContextPacker(max_tokens=1000).merge_overlaps([first, second])
+
+    assert len(merged) == 1
+    assert merged[0].page_content == text
+    assert (merged[0].metadata["start_index"], merged[0].metadata["end_index"]) == (0, len(text))
+
+
+def test_pack_keeps_retrieval_order_within_budget(capsys):
+    docs = [_doc(f"passage {i} " + "filler words " * 20) for i in range(5)]
+    budget = count_tokens(docs[0].page_content) * 2
+
+    saved_before = _saved_tokens_sum() if CONTEXT_TOKENS_SAVED._values else 0.0
+    # 首次加载编码时可能输出一次回退提示，与 pack 无关
+    capsys.readouterr()
+    packed = ContextPacker(max_tokens=budget).pack("passage", docs)
+
+    assert packed == docs[:2]
+    assert capsys.readouterr().out == ""
+    # 5 段中只装入 2 段，节省的 token 数记入直方图
+    saved = sum(count_tokens(doc.page_content) for doc in docs[2:])
+    assert _saved_tokens_sum() - saved_before == saved
+
+
+def test_rerank_blends_coverage_with_retrieval_rank():
+    query = "how are vectors normalized"
+    docs = [_doc("the index stores vectors"), _doc("unrelated text"), _doc("unrelated again"),
+            _doc("how vectors are normalized before indexing")]
+
+    reranked = ContextPacker(max_tokens=1000, rerank=True).rerank_documents(query, docs)
+
+    # 覆盖率最高的段落前移，但检索排名第一的段落仍在前面，无关段落不会被提前
+    assert reranked[:2] == [docs[0], docs[3]]
+    assert reranked[2:] == [docs[1], docs[2]]
@@ -0,0 +1,93 @@
+import threading
+import time
+
+from app.services.directory_watcher import DirectoryWatcher
+from app.services.notebook_service import NotebookManager
+from app.services.vector_store import VectorStoreService
+
+
+def _wait_for(condition, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        if condition():
+            return True
+        time.sleep(0.02)
+    return False
+
+
+def _start(watcher: DirectoryWatcher):
+    """只启动处理线程 (不依赖 watchdog)，事件由初始扫描或 enqueue 产生"""
+    watcher._worker = threading.Thread(target=watcher._run, daemon=True)
+    watcher._worker.start()
+
+
+def test_failed_files_are_retried(monkeypatch, tmp_path, write_file):
+    """Embedding 暂时不可用时文件重新排队，恢复后被索引，而不是等到下次启动扫描"""
+    path = write_file("watched/notes.txt", "alpha paragraph about retries\n\nbeta paragraph about backoff")
+    original = VectorStoreService.sync_file
+    calls = []
+
+    def flaky_sync_file(self, *args, **kwargs):
+        calls.append(args[0])
+        if len(calls) == 1:
+            raise ConnectionError("embedding service unavailable")
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(VectorStoreService, "sync_file", flaky_sync_file)
+    notebooks = NotebookManager()
+    watcher = DirectoryWatcher(notebooks, [str(tmp_path / "files" / "watched")], debounce_seconds=0,
+                               batch_interval=0, retry_backoff=0.05)
+    _start(watcher)
+    try:
+        assert _wait_for(lambda: watcher.indexed_files == 1)
+        assert calls == [path, path]
+        assert watcher.stats()["failed_files"] == 0
+        with notebooks.use() as chat_service:
+            assert chat_service.vector_store.manifest.get(path) is not None
+    finally:
+        watcher.stop()
+        notebooks.close()
+
+
+def test_watcher_gives_up_after_retry_attempts(tmp_path, write_file):
+    write_file("watched/broken.pdf", "not a pdf")
+    notebooks = NotebookManager()
+    watcher = DirectoryWatcher(notebooks, [str(tmp_path / "files" / "watched")], debounce_seconds=0,
+                               batch_interval=0, retry_attempts=2, retry_backoff=0.01)
+    _start(watcher)
+    try:
+        assert _wait_for(lambda: watcher.failed_files == 1)
+        assert watcher.stats()["pending"] == 0
+        assert watcher.indexed_files == 0
+    finally:
+        watcher.stop()
+        notebooks.close()
+
+
+def test_initial_scan_failure_is_retried_and_reported(monkeypatch, tmp_path, write_file):
+    """初始扫描失败时处理线程不退出：按退避重试，错误出现在 stats() 中"""
+    path = write_file("watched/notes.txt", "alpha paragraph about scanning")
+    notebooks = NotebookManager()
+    original = NotebookManager.use
+    calls = []
+
+    def flaky_use(self, *args, **kwargs):
+        calls.append(args)
+        if len(calls) == 1:
+            raise ConnectionError("notebook unavailable")
+        return original(self, *args, **kwargs)
+
+    monkeypatch.setattr(NotebookManager, "use", flaky_use)
+    watcher = DirectoryWatcher(notebooks, [str(tmp_path / "files" / "watched")], debounce_seconds=0,
+                               batch_interval=0, retry_backoff=0.05)
+    _start(watcher)
+    try:
+        assert _wait_for(lambda: watcher.indexed_files == 1)
+        stats = watcher.stats()
+        assert stats["initial_scan"] == "done"
+        assert "notebook unavailable" in stats["last_error"]
+        with notebooks.use() as chat_service:
+            assert chat_service.vector_store.manifest.get(path) is not None
+    finally:
+        watcher.stop()
+        notebooks.close()
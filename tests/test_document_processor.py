@@ -0,0 +1,96 @@
+import os
+import random
+import re
+
+from benchmarks.corpus import make_markdown
+from app.services import document_processor
+from app.services.document_processor import DocumentProcessor
+from app.services.notebook_service import NotebookManager
+
+
+def _crash_on_marker(path):
+    """进程池入口的替身：解析到文件名含 crash 的文件时让工作进程直接退出"""
+    if "crash" in os.path.basename(path):
+        os._exit(1)
+    return document_processor._process_file_in_worker(path)
+
+
+def test_small_batch_parses_serially(isolated_settings, monkeypatch, write_file):
+    monkeypatch.setattr(isolated_settings, "PARSE_WORKERS", 4)
+    paths = [write_file(f"doc{i}.txt", f"第 {i} 个文件的内容。" * 20) for i in range(4)]
+    processor = DocumentProcessor()
+
+    results = {path: (docs, error) for path, docs, error in processor.process_files(paths)}
+
+    assert set(results) == set(paths)
+    assert all(error is None and docs for docs, error in results.values())
+    # 总大小低于 parallel_parse_min_mb，不应启动进程池
+    assert processor._pool is None
+    processor.close()
+
+
+def test_pool_is_reused_across_batches(isolated_settings, monkeypatch, write_file):
+    monkeypatch.setattr(isolated_settings, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(isolated_settings, "PARALLEL_PARSE_MIN_MB", 0)
+    paths = [write_file(f"doc{i}.txt", f"content of file {i}. " * 50) for i in range(3)]
+    paths.append(write_file("broken.xyz", "unsupported"))
+    processor = DocumentProcessor()
+    try:
+        first = {path: error for path, _, error in processor.process_files(paths)}
+        pool = processor._pool
+        second = {path: error for path, _, error in processor.process_files(paths[:2])}
+
+        assert pool is not None and processor._pool is pool
+        assert first[paths[-1]] is not None
+        assert all(first[path] is None for path in paths[:3])
+        assert all(error is None for error in second.values())
+    finally:
+        processor.close()
+    assert processor._pool is None
+
+
+def test_crashing_file_does_not_fail_the_rest(isolated_settings, monkeypatch, write_file):
+    """一个文件让工作进程崩溃时，换新的进程池重试其他文件，只有该文件失败"""
+    monkeypatch.setattr(isolated_settings, "PARSE_WORKERS", 2)
+    monkeypatch.setattr(isolated_settings, "PARALLEL_PARSE_MIN_MB", 0)
+    monkeypatch.setattr(document_processor, "_process_file_in_worker", _crash_on_marker)
+    paths = [write_file(f"doc{i}.txt", f"content of file {i}. " * 50) for i in range(4)]
+    paths.insert(1, write_file("crash.txt", "this file kills the worker"))
+    processor = DocumentProcessor()
+    try:
+        results = {path: (docs, error) for path, docs, error in processor.process_files(paths)}
+    finally:
+        processor.close()
+
+    assert set(results) == set(paths)
+    assert results[paths[1]][1] is not None
+    assert all(error is None and docs for path, (docs, error) in results.items() if path != paths[1])
+
+
+def test_streamed_text_keeps_file_offsets_and_sections(isolated_settings, monkeypatch, write_file):
+    """超过流式阈值的文本按块读取：chunk 偏移相对整个文件，标题路径跨块延续"""
+    monkeypatch.setattr(isolated_settings, "SPLITTER", "token")
+    monkeypatch.setattr(isolated_settings, "TOKEN_CHUNK_SIZE", 60)
+    monkeypatch.setattr(isolated_settings, "TOKEN_CHUNK_OVERLAP", 10)
+    # 每块 CHUNK_SIZE * 32 = 512 个字符，文件远大于一块
+    monkeypatch.setattr(isolated_settings, "CHUNK_SIZE", 16)
+    monkeypatch.setattr(isolated_settings, "STREAM_THRESHOLD_MB", 0.001)
+    text = make_markdown(random.Random(4), sections=6, paragraphs=3)
+    path = write_file("manual.txt", text)
+    assert os.path.getsize(path) > isolated_settings.STREAM_THRESHOLD_MB * 1024 * 1024 * 4
+
+    notebooks = NotebookManager()
+    try:
+        with notebooks.use() as chat_service:
+            assert chat_service.index_files([path])[path] > 0
+            _, texts, metadatas = chat_service.vector_store.backend.get_all()
+    finally:
+        notebooks.close()
+
+    heading_starts = [match.start() for match in re.finditer(r"^#{1,6} ", text, re.MULTILINE)]
+    for chunk, metadata in zip(texts, metadatas):
+        assert text[metadata["start_index"]:metadata["end_index"]] == chunk
+        previous = [position for position in heading_starts if position <= metadata["start_index"]]
+        if previous:
+            title = text[previous[-1]:text.index("\n", previous[-1])].lstrip("#").strip()
+            assert metadata["section"].split(" > ")[-1] == title
@@ -0,0 +1,49 @@
+import pytest
+
+from app.services.embedding_pipeline import EmbeddingBatchError, EmbeddingPipeline
+
+
+class _StatusError(Exception):
+    def __init__(self, code):
+        super().__init__(f"status {code}")
+        self.code = code
+
+
+class _FlakyEmbeddings:
+    """按顺序抛出给定的异常，之后正常返回"""
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+
+    def embed_documents(self, texts):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return [[float(len(text))] for text in texts]
+
+
+def _run(embeddings):
+    pipeline = EmbeddingPipeline(embeddings, batch_size=10, max_in_flight=1, max_retries=3,
+                                 backoff_base=0.001, backoff_max=0.001)
+    written = []
+    pipeline.run(["a", "bb"], lambda start, end, vectors: written.extend(vectors))
+    return written
+
+
+def test_transient_errors_are_retried():
+    wrapped = RuntimeError("Error embedding content")
+    wrapped.__cause__ = _StatusError(429)
+    embeddings = _FlakyEmbeddings([_StatusError(503), TimeoutError(), wrapped])
+
+    assert _run(embeddings) == [[1.0], [2.0]]
+    assert embeddings.calls == 4
+
+
+def test_permanent_errors_fail_without_retry():
+    embeddings = _FlakyEmbeddings([_StatusError(400)])
+
+    with pytest.raises(EmbeddingBatchError) as info:
+        _run(embeddings)
+    assert embeddings.calls == 1
+    assert info.value.failed_ranges == [(0, 2)]
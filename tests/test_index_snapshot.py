@@ -0,0 +1,127 @@
+import io
+import tarfile
+
+import pytest
+
+from app.services import index_snapshot
+from app.services.index_snapshot import SnapshotError
+from app.services.vector_store import VectorStoreService
+from tests.test_vector_store import _chunks
+
+pytestmark = pytest.mark.usefixtures("vector_backend")
+
+
+def _indexed_store(directory):
+    vs = VectorStoreService(persist_directory=directory)
+    texts = ["alpha paragraph about snapshots", "beta paragraph about replicas", "gamma paragraph about models"]
+    vs.sync_file("notes.txt", "h1", _chunks("notes.txt", texts))
+    return vs
+
+
+def test_snapshot_round_trip(tmp_path):
+    source = _indexed_store(str(tmp_path / "source"))
+    path = str(tmp_path / "snapshot.tar.gz")
+    header = source.export_snapshot(path)
+    assert header["count"] == 3
+
+    target = VectorStoreService(persist_directory=str(tmp_path / "target"))
+    misses = target.embedding_cache.misses
+    target.import_snapshot(path)
+
+    # 导入不调用 Embedding 接口，检索结果与入库清单与源索引一致
+    assert target.embedding_cache.misses == misses
+    assert target.backend.count() == 3
+    assert target.manifest.files() == source.manifest.files()
+    query = "beta paragraph about replicas"
+    assert [doc.page_content for doc in target.similarity_search(query, k=3)] == \
+        [doc.page_content for doc in source.similarity_search(query, k=3)]
+    assert [doc.page_content for doc in target.lexical_search("replicas", k=1)] == ["beta paragraph about replicas"]
+    source.close()
+    target.close()
+
+
+def test_snapshot_from_other_embedding_model_is_rejected(tmp_path, isolated_settings, monkeypatch):
+    source = _indexed_store(str(tmp_path / "source"))
+    path = str(tmp_path / "snapshot.tar.gz")
+    source.export_snapshot(path)
+    source.close()
+
+    target = _indexed_store(str(tmp_path / "target"))
+    monkeypatch.setattr(isolated_settings, "EMBEDDING_MODEL", "models/other-embedding")
+    with pytest.raises(SnapshotError):
+        target.import_snapshot(path)
+    # 拒绝导入时保留原有索引
+    assert target.backend.count() == 3
+    target.close()
+
+
+def test_snapshot_with_newer_format_is_rejected(tmp_path, monkeypatch):
+    source = _indexed_store(str(tmp_path / "source"))
+    path = str(tmp_path / "snapshot.tar.gz")
+    with monkeypatch.context() as patch:
+        patch.setattr(index_snapshot, "SNAPSHOT_FORMAT_VERSION", index_snapshot.SNAPSHOT_FORMAT_VERSION + 1)
+        source.export_snapshot(path)
+    source.close()
+
+    target = _indexed_store(str(tmp_path / "target"))
+    with pytest.raises(SnapshotError, match="format version"):
+        target.import_snapshot(path)
+    assert target.backend.count() == 3
+    target.close()
+
+
+def _rewrite_member(path, name, transform):
+    """改写快照中的一个成员文件，模拟损坏或截断的快照"""
+    with tarfile.open(path, "r:gz") as tar:
+        members = {member.name: tar.extractfile(member).read() for member in tar.getmembers()}
+    members[name] = transform(members[name])
+    with tarfile.open(path, "w:gz") as tar:
+        for member_name, data in members.items():
+            info = tarfile.TarInfo(member_name)
+            info.size = len(data)
+            tar.addfile(info, io.BytesIO(data))
+
+
+@pytest.mark.parametrize("transform", [
+    lambda data: b"".join(data.splitlines(keepends=True)[:-1]),
+    lambda data: data[:-10],
+])
+def test_corrupt_snapshot_leaves_index_untouched(tmp_path, transform):
+    source = _indexed_store(str(tmp_path / "source"))
+    path = str(tmp_path / "snapshot.tar.gz")
+    source.export_snapshot(path)
+    source.close()
+    _rewrite_member(path, "chunks.jsonl", transform)
+
+    target = VectorStoreService(persist_directory=str(tmp_path / "target"))
+    target.sync_file("local.txt", "h0", _chunks("local.txt", ["local paragraph"]))
+    with pytest.raises(SnapshotError):
+        target.import_snapshot(path)
+    # 校验在清空索引之前完成
+    assert target.backend.count() == 1
+    assert target.manifest.get("local.txt")["file_hash"] == "h0"
+    target.close()
+
+
+def test_failed_import_clears_manifest(tmp_path):
+    source = _indexed_store(str(tmp_path / "source"))
+    path = str(tmp_path / "snapshot.tar.gz")
+    source.export_snapshot(path)
+    source.close()
+
+    target = VectorStoreService(persist_directory=str(tmp_path / "target"))
+    target.sync_file("local.txt", "h0", _chunks("local.txt", ["local paragraph"]))
+
+    def failing_upsert(*args, **kwargs):
+        raise OSError("disk full")
+
+    with pytest.MonkeyPatch.context() as patch:
+        patch.setattr(target.backend, "upsert", failing_upsert)
+        with pytest.raises(OSError):
+            target.import_snapshot(path)
+
+    # 旧索引已被清空：清单也清空，重新上传同一文件不会被当作未变化而跳过
+    assert target.manifest.files() == {}
+    assert target.backend.count() == 0
+    assert target.sync_file("local.txt", "h0", _chunks("local.txt", ["local paragraph"])) == (1, 0)
+    target.close()
@@ -0,0 +1,116 @@
+import os
+import threading
+import time
+from contextlib import contextmanager
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app.services.ingestion_jobs import IngestionJobManager, JobQueueFullError
+from app.services.notebook_service import NotebookManager
+
+
+class _BlockingNotebooks:
+    """use 阻塞到 release 被 set，用于让工作线程一直处于忙碌状态"""
+
+    def __init__(self):
+        self.release = threading.Event()
+        self.started = threading.Event()
+
+    @contextmanager
+    def use(self, notebook_id):
+        self.started.set()
+        self.release.wait(10)
+        raise RuntimeError("notebook unavailable")
+        yield
+
+
+def _wait_finished(manager, job, timeout=10.0):
+    deadline = time.monotonic() + timeout
+    while manager.get(job.id).finished_at is None:
+        assert time.monotonic() < deadline, "job did not finish"
+        time.sleep(0.02)
+    return manager.get(job.id)
+
+
+def test_submit_rejects_when_queue_is_full():
+    notebooks = _BlockingNotebooks()
+    manager = IngestionJobManager(notebooks, num_workers=1, max_pending=1)
+    try:
+        running = manager.submit(["a.txt"])
+        assert notebooks.started.wait(5)
+        manager.submit(["b.txt"])
+        with pytest.raises(JobQueueFullError):
+            manager.submit(["c.txt"])
+        notebooks.release.set()
+        assert _wait_finished(manager, running).status == "failed"
+    finally:
+        notebooks.release.set()
+        manager.shutdown()
+
+
+def test_reserve_counts_against_capacity():
+    notebooks = _BlockingNotebooks()
+    manager = IngestionJobManager(notebooks, num_workers=1, max_pending=1)
+    try:
+        manager.submit(["a.txt"])
+        assert notebooks.started.wait(5)
+        manager.reserve()
+        with pytest.raises(JobQueueFullError):
+            manager.submit(["b.txt"])
+        manager.release()
+        manager.submit(["b.txt"])
+    finally:
+        notebooks.release.set()
+        manager.shutdown()
+
+
+def test_job_reports_per_file_progress(write_file):
+    notebooks = NotebookManager()
+    manager = IngestionJobManager(notebooks, num_workers=1)
+    try:
+        good = write_file("good.txt", "alpha beta gamma\n\n" * 20)
+        bad = write_file("bad.xyz", "unsupported")
+        job = _wait_finished(manager, manager.submit([good, bad]))
+        assert job.status == "completed"
+        assert job.files[good]["status"] == "done" and job.files[good]["chunks"] > 0
+        assert job.files[bad]["status"] == "failed" and job.files[bad]["error"]
+    finally:
+        manager.shutdown()
+        notebooks.close()
+
+
+@pytest.fixture
+def client():
+    import main
+    with TestClient(main.app) as client:
+        yield client
+
+
+def test_upload_rejects_duplicate_filenames(client, isolated_settings):
+    response = client.post("/api/v1/documents/upload", files=[
+        ("files", ("a.txt", b"one")), ("files", ("a.txt", b"two"))
+    ])
+    assert response.status_code == 400
+    assert "a.txt" in response.json()["detail"]
+    assert os.listdir(isolated_settings.UPLOAD_DIR) == []
+
+
+def test_upload_rejected_by_full_queue_leaves_no_files(client, isolated_settings, monkeypatch):
+    job_manager = client.app.state.job_manager
+    monkeypatch.setattr(job_manager, "max_pending", 0)
+    response = client.post("/api/v1/documents/upload", files=[("files", ("a.txt", b"content"))])
+    assert response.status_code == 503
+    assert os.listdir(isolated_settings.UPLOAD_DIR) == []
+
+
+def test_upload_runs_background_job(client, isolated_settings):
+    response = client.post("/api/v1/documents/upload", files=[("files", ("notes.txt", b"apples and pears\n\n" * 10))])
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    deadline = time.monotonic() + 10
+    while (job := client.get(f"/api/v1/documents/jobs/{job_id}").json())["status"] in ("queued", "running"):
+        assert time.monotonic() < deadline
+        time.sleep(0.05)
+    assert job["status"] == "completed"
+    assert os.listdir(isolated_settings.UPLOAD_DIR) == ["notes.txt"]
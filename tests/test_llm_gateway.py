@@ -0,0 +1,107 @@
+import asyncio
+import time
+
+import pytest
+
+from benchmarks.fake_llm_server import FakeLLMServer, FakeLLMServerError, RemoteFakeChatModel
+from app.services.errors import LLMQueueTimeoutError
+from app.services.llm_gateway import GatewayChatModel, LLMGateway
+
+
+class _ScriptedServer(FakeLLMServer):
+    """按顺序使用给定的 (延迟, 错误状态码)，用完后以 latency 正常返回"""
+
+    def __init__(self, script, latency=0.02):
+        super().__init__(latency=latency, jitter=0, spike_probability=0, error_rate=0)
+        self.script = list(script)
+
+    def _plan(self):
+        with self._lock:
+            self.requests += 1
+            if self.script:
+                return self.script.pop(0)
+            return self.latency, 0
+
+
+@pytest.fixture
+def server_factory():
+    servers = []
+
+    def start(script=(), latency=0.02):
+        server = _ScriptedServer(script, latency).start()
+        servers.append(server)
+        return server
+
+    yield start
+    for server in servers:
+        server.stop()
+
+
+def _model(server, **gateway_options):
+    options = {"max_concurrency": 8, "queue_timeout": 5.0, "backoff_base": 0.01, "backoff_max": 0.02}
+    options.update(gateway_options)
+    return GatewayChatModel(llm=RemoteFakeChatModel(url=server.url), gateway=LLMGateway(**options))
+
+
+def test_identical_requests_are_coalesced(server_factory):
+    server = server_factory(latency=0.2)
+    model = _model(server)
+
+    async def run():
+        return await asyncio.gather(*[model.ainvoke("same question") for _ in range(8)])
+
+    answers = asyncio.run(run())
+    assert server.stats()["requests"] == 1
+    assert len({answer.content for answer in answers}) == 1
+
+
+def test_transient_errors_are_retried(server_factory):
+    server = server_factory(script=[(0, 503), (0, 429)])
+    model = _model(server, max_retries=3)
+
+    answer = model.invoke("question")
+    assert answer.content
+    assert server.stats()["requests"] == 3
+
+
+def test_stream_retries_before_first_token(server_factory):
+    server = server_factory(script=[(0, 503)])
+    model = _model(server, max_retries=1)
+
+    assert "".join(chunk.content for chunk in model.stream("question"))
+    assert server.stats()["requests"] == 2
+
+
+def test_retries_are_bounded(server_factory):
+    server = server_factory(script=[(0, 503)] * 5)
+    model = _model(server, max_retries=2)
+
+    with pytest.raises(FakeLLMServerError):
+        model.invoke("question")
+    assert server.stats()["requests"] == 3
+
+
+def test_hedged_request_avoids_latency_spike(server_factory):
+    # 第一个请求遇到 2 秒的延迟尖刺，对冲请求正常返回
+    server = server_factory(script=[(2.0, 0)])
+    model = _model(server, hedge_delay=0.1)
+
+    async def run():
+        start = time.perf_counter()
+        await model.ainvoke("question")
+        return time.perf_counter() - start
+
+    assert asyncio.run(run()) < 1.0
+    assert server.stats()["requests"] == 2
+    model.gateway.close()
+
+
+def test_queue_timeout(server_factory):
+    server = server_factory(latency=0.5)
+    model = _model(server, max_concurrency=1, queue_timeout=0.1)
+
+    async def run():
+        return await asyncio.gather(model.ainvoke("first"), model.ainvoke("second"), return_exceptions=True)
+
+    results = asyncio.run(run())
+    assert sum(isinstance(result, LLMQueueTimeoutError) for result in results) == 1
@@ -0,0 +1,187 @@
+import asyncio
+import json
+import time
+
+import httpx
+import pytest
+
+from app.services.ingestion_jobs import IngestionJobManager
+from app.services.notebook_service import (
+    NotebookManager, NotebookBusyError, NotebookNotFoundError, DEFAULT_NOTEBOOK_ID
+)
+
+
+def _track_close(service, closed):
+    original = service.close
+
+    def close():
+        closed.append(service)
+        original()
+
+    service.close = close
+
+
+def test_pinned_notebook_is_not_evicted():
+    """max_loaded=1：正在使用的笔记本不会因为访问其他笔记本而被关闭，释放后才按 LRU 淘汰"""
+    notebooks = NotebookManager(max_loaded=1)
+    other = notebooks.create("other")["id"]
+    closed = []
+    try:
+        with notebooks.use(DEFAULT_NOTEBOOK_ID) as default_service:
+            _track_close(default_service, closed)
+            with notebooks.use(other) as other_service:
+                _track_close(other_service, closed)
+                # 两个都被固定，暂时超出 max_loaded 也不关闭
+                assert closed == []
+            # other 释放后超出上限，先淘汰未被固定的 other
+            assert closed == [other_service]
+            assert default_service.vector_store.backend.count() == 0
+        assert closed == [other_service]
+
+        with notebooks.use(other) as reloaded:
+            assert reloaded is not other_service
+        # default 已不再固定，加载 other 时被淘汰
+        assert default_service in closed
+    finally:
+        notebooks.close()
+
+
+def test_sessions_survive_eviction():
+    """会话由管理器持有，笔记本被淘汰并重新加载后会话仍然存在"""
+    notebooks = NotebookManager(max_loaded=1)
+    other = notebooks.create("other")["id"]
+    try:
+        with notebooks.use(DEFAULT_NOTEBOOK_ID) as service:
+            session_id = service.sessions.create()["id"]
+        with notebooks.use(other):
+            pass
+        with notebooks.use(DEFAULT_NOTEBOOK_ID) as reloaded:
+            assert reloaded is not service
+            assert reloaded.sessions.get(session_id)["id"] == session_id
+    finally:
+        notebooks.close()
+
+
+def _slow_loading(monkeypatch, notebook_id, seconds):
+    """让指定笔记本的 ChatService 创建变慢，模拟冷启动时导入依赖与加载索引"""
+    original = NotebookManager._create_service
+
+    def create_service(self, requested_id):
+        if requested_id == notebook_id:
+            time.sleep(seconds)
+        return original(self, requested_id)
+
+    monkeypatch.setattr(NotebookManager, "_create_service", create_service)
+
+
+def test_slow_load_does_not_block_other_notebooks(monkeypatch):
+    notebooks = NotebookManager()
+    other = notebooks.create("other")["id"]
+    _slow_loading(monkeypatch, DEFAULT_NOTEBOOK_ID, 1.0)
+    try:
+        warm_up = notebooks.start_warm_up()
+        time.sleep(0.1)
+        start = time.perf_counter()
+        with notebooks.use(other):
+            pass
+        assert time.perf_counter() - start < 0.5
+        assert notebooks.warm_up_status == "warming_up"
+
+        # 同一笔记本的并发请求等待同一次加载，不会重复创建
+        with notebooks.use(DEFAULT_NOTEBOOK_ID) as service:
+            warm_up.join()
+            assert notebooks.warm_up_status == "ready"
+            with notebooks.use(DEFAULT_NOTEBOOK_ID) as again:
+                assert again is service
+    finally:
+        notebooks.close()
+
+
+def test_health_responds_while_notebook_loads(monkeypatch):
+    """预热与查询都在等待笔记本加载时，/health 仍然立即返回"""
+    import main
+
+    _slow_loading(monkeypatch, DEFAULT_NOTEBOOK_ID, 1.5)
+    notebooks = NotebookManager()
+    main.app.state.notebooks = notebooks
+    main.app.state.job_manager = IngestionJobManager(notebooks)
+    notebooks.start_warm_up()
+
+    async def run():
+        transport = httpx.ASGITransport(app=main.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            # 从发出查询开始计时：事件循环被阻塞时 sleep 本身也会被推迟
+            start = time.perf_counter()
+            query = asyncio.create_task(client.post("/api/v1/chat/query", json={"question": "hello"}))
+            await asyncio.sleep(0.1)
+            health = await client.get("/health")
+            health_seconds = time.perf_counter() - start
+            response = await query
+        return health, health_seconds, response
+
+    try:
+        health, health_seconds, response = asyncio.run(run())
+        assert health.status_code == 200
+        assert health_seconds < 0.6
+        assert response.status_code == 200, response.text
+    finally:
+        main.app.state.job_manager.shutdown()
+        notebooks.close()
+
+
+def test_notebook_in_use_is_not_deleted():
+    """被固定的笔记本删除时返回忙碌，释放后才能删除，删除后不能再获取"""
+    notebooks = NotebookManager()
+    notebook_id = notebooks.create("temporary")["id"]
+    try:
+        with notebooks.use(notebook_id) as service:
+            with pytest.raises(NotebookBusyError):
+                notebooks.delete(notebook_id)
+            # 删除失败时笔记本仍可正常使用
+            assert service.vector_store.backend.count() == 0
+        notebooks.delete(notebook_id)
+        assert notebook_id not in [notebook["id"] for notebook in notebooks.list()]
+        with pytest.raises(NotebookNotFoundError):
+            notebooks.acquire(notebook_id)
+    finally:
+        notebooks.close()
+
+
+def test_streaming_endpoints_release_notebook_when_client_disconnects():
+    """客户端在响应开始前断开时，流式接口也要释放固定的笔记本"""
+    import main
+
+    notebooks = NotebookManager()
+    main.app.state.notebooks = notebooks
+    main.app.state.job_manager = IngestionJobManager(notebooks)
+
+    async def disconnected_request(path, payload):
+        body = json.dumps(payload).encode()
+        messages = [{"type": "http.request", "body": body, "more_body": False}]
+        scope = {
+            "type": "http", "asgi": {"version": "3.0", "spec_version": "2.4"}, "http_version": "1.1",
+            "method": "POST", "scheme": "http", "path": path, "raw_path": path.encode(), "root_path": "",
+            "query_string": b"", "headers": [(b"content-type", b"application/json")],
+            "client": ("test", 1), "server": ("test", 80)
+        }
+
+        async def receive():
+            if messages:
+                return messages.pop(0)
+            await asyncio.sleep(3600)
+
+        async def send(message):
+            raise OSError("client disconnected")
+
+        try:
+            await main.app(scope, receive, send)
+        except Exception:
+            pass
+
+    try:
+        asyncio.run(disconnected_request("/api/v1/chat/stream", {"question": "hello"}))
+        asyncio.run(disconnected_request("/api/v1/chat/batch", {"questions": ["hello"]}))
+        assert notebooks._pins == {}
+    finally:
+        main.app.state.job_manager.shutdown()
+        notebooks.close()
@@ -0,0 +1,174 @@
+import threading
+
+import numpy as np
+
+from app.services.vector_backends.numpy_backend import NumpyBackend
+
+
+def _vectors(n, dim=16, seed=0):
+    return np.random.default_rng(seed).normal(size=(n, dim)).astype(np.float32)
+
+
+def _upsert(backend, vectors, offset=0):
+    ids = [f"c{offset + i}" for i in range(len(vectors))]
+    backend.upsert(ids, vectors.tolist(), [f"text {offset + i}" for i in range(len(vectors))],
+                   [{"n": offset + i} for i in range(len(vectors))])
+    return ids
+
+
+def test_search_get_delete_and_reopen(tmp_path):
+    backend = NumpyBackend(str(tmp_path))
+    vectors = _vectors(50)
+    _upsert(backend, vectors)
+
+    top, _ = backend.search(vectors[7].tolist(), 3)[0]
+    assert top.page_content == "text 7"
+    assert [doc.page_content for doc in backend.get(["c3", "missing", "c1"])] == ["text 3", "text 1"]
+
+    backend.delete(["c7"])
+    assert backend.search(vectors[7].tolist(), 1)[0][0].page_content != "text 7"
+    backend.persist()
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened.count() == 49
+    assert reopened.search(vectors[8].tolist(), 1)[0][0].metadata == {"n": 8}
+
+
+def test_unpersisted_writes_are_discarded_after_crash(tmp_path):
+    backend = NumpyBackend(str(tmp_path))
+    vectors = _vectors(30)
+    _upsert(backend, vectors[:20])
+    backend.persist()
+    _upsert(backend, vectors[20:], offset=20)
+    # 模拟崩溃：未提交的 SQLite 事务回滚，向量文件中留下多余的行
+    backend._conn.close()
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened.count() == 20
+    fresh = _vectors(5, seed=1)
+    _upsert(reopened, fresh, offset=100)
+    reopened.persist()
+
+    assert reopened.count() == 25
+    assert reopened.search(fresh[2].tolist(), 1)[0][0].page_content == "text 102"
+    assert reopened.search(vectors[5].tolist(), 1)[0][0].page_content == "text 5"
+
+
+def test_ivf_search_uses_partitions(tmp_path):
+    backend = NumpyBackend(str(tmp_path), ivf_lists=4, ivf_nprobe=4)
+    vectors = _vectors(400)
+    _upsert(backend, vectors)
+    backend.persist()
+    assert backend._centroids is not None
+    assert sum(len(rows) for rows in backend._lists) == 400
+
+    # 训练之后写入的行也要能检索到
+    extra = _vectors(10, seed=2)
+    _upsert(backend, extra, offset=400)
+    assert backend.search(extra[3].tolist(), 1)[0][0].page_content == "text 403"
+    assert backend.search(vectors[42].tolist(), 1)[0][0].page_content == "text 42"
+
+    backend.delete(["c42"])
+    assert backend.search(vectors[42].tolist(), 1)[0][0].page_content != "text 42"
+
+
+def test_search_runs_while_writing(tmp_path):
+    backend = NumpyBackend(str(tmp_path))
+    vectors = _vectors(200)
+    _upsert(backend, vectors[:100])
+    errors = []
+
+    def search():
+        try:
+            for i in range(200):
+                results = backend.search(vectors[i % 100].tolist(), 5)
+                assert results and results[0][0].page_content == f"text {i % 100}"
+        except Exception as e:
+            errors.append(e)
+
+    thread = threading.Thread(target=search)
+    thread.start()
+    for start in range(100, 200, 10):
+        _upsert(backend, vectors[start:start + 10], offset=start)
+        backend.delete([f"c{start}"])
+    thread.join()
+
+    assert errors == []
+    assert backend.count() == 190
+
+
+def test_compaction_keeps_results(tmp_path):
+    backend = NumpyBackend(str(tmp_path), quantization="int8")
+    vectors = _vectors(60)
+    ids = _upsert(backend, vectors)
+    backend.delete(ids[:40])
+    backend.persist()
+
+    assert backend._header["rows"] == 20
+    assert backend.search(vectors[50].tolist(), 1)[0][0].page_content == "text 50"
+    assert NumpyBackend(str(tmp_path)).count() == 20
+
+
+def test_compaction_survives_crash_before_header_update(tmp_path, monkeypatch):
+    backend = NumpyBackend(str(tmp_path), quantization="int8")
+    vectors = _vectors(60)
+    ids = _upsert(backend, vectors)
+    backend.persist()
+    backend.delete(ids[:40])
+    backend._conn.commit()
+
+    def crash():
+        raise SystemExit("crash")
+
+    # 模拟 SQLite 已提交、header 尚未更新时退出
+    monkeypatch.setattr(backend, "_write_header", crash)
+    try:
+        backend._compact()
+    except SystemExit:
+        pass
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened._header["rows"] == 20
+    assert reopened.count() == 20
+    assert reopened.search(vectors[50].tolist(), 1)[0][0].page_content == "text 50"
+    assert not (tmp_path / "vectors.bin").exists()
+
+
+class _CrashingConnection:
+    """在执行压缩的 SQLite 更新时退出，其余调用转给真实连接"""
+
+    def __init__(self, conn):
+        self.conn = conn
+
+    def execute(self, sql, *args):
+        if sql.startswith("DELETE FROM chunks WHERE deleted"):
+            raise SystemExit("crash")
+        return self.conn.execute(sql, *args)
+
+    def __getattr__(self, name):
+        return getattr(self.conn, name)
+
+
+def test_compaction_survives_crash_before_commit(tmp_path):
+    backend = NumpyBackend(str(tmp_path))
+    vectors = _vectors(60)
+    ids = _upsert(backend, vectors)
+    backend.delete(ids[:40])
+    backend.persist()
+    # 第二次压缩从代号 1 的文件开始，新文件已写出但提交前退出
+    backend.delete(ids[40:52])
+    backend._conn.commit()
+    connection = backend._conn
+    backend._conn = _CrashingConnection(connection)
+    try:
+        backend._compact()
+    except SystemExit:
+        pass
+    connection.close()
+    assert (tmp_path / "vectors.2.bin").exists()
+
+    reopened = NumpyBackend(str(tmp_path))
+    assert reopened._header["file_generation"] == 1
+    assert reopened.count() == 8
+    assert reopened.search(vectors[59].tolist(), 1)[0][0].page_content == "text 59"
+    assert not (tmp_path / "vectors.2.bin").exists()
@@ -0,0 +1,74 @@
+import asyncio
+
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from app.services.query_rewriter import QueryRewriter
+
+
+class _RecordingLLM:
+    """记录每次改写请求收到的消息，返回固定的改写结果"""
+
+    def __init__(self, answer):
+        self.answer = answer
+        self.prompts = []
+
+    def __call__(self, prompt_value):
+        self.prompts.append(prompt_value.to_messages())
+        return AIMessage(content=self.answer)
+
+
+def _retriever(queries):
+    async def retrieve(query):
+        queries.append(query)
+        return [query]
+    return RunnableLambda(lambda query: [query], afunc=retrieve)
+
+
+def _history(turns):
+    history = []
+    for i in range(turns):
+        history.append(HumanMessage(content=f"question {i}"))
+        history.append(AIMessage(content=f"answer {i}"))
+    return history
+
+
+def test_rewrite_sends_only_recent_history_and_caches():
+    llm = _RecordingLLM("what is the index format")
+    rewriter = QueryRewriter(RunnableLambda(llm), history_turns=4)
+
+    assert rewriter.rewrite("and that?", _history(5)) == "what is the index format"
+    # 更早的历史不同，但发送给 LLM 的最近几条相同，应命中缓存
+    history = [HumanMessage(content="something else")] + _history(5)[1:]
+    assert rewriter.rewrite("and that?", history) == "what is the index format"
+
+    assert len(llm.prompts) == 1
+    # system + 4 条历史 + 问题
+    assert len(llm.prompts[0]) == 6
+    assert rewriter.stats()["cache_hits"] == 1
+
+
+def test_self_contained_question_skips_llm():
+    llm = _RecordingLLM("unused")
+    rewriter = QueryRewriter(RunnableLambda(llm))
+
+    assert rewriter.rewrite("How does the numpy backend store vectors on disk?", _history(1)) \
+        == "How does the numpy backend store vectors on disk?"
+    assert llm.prompts == []
+
+
+def test_cache_hit_skips_speculative_retrieval():
+    llm = _RecordingLLM("what is the index format")
+    rewriter = QueryRewriter(RunnableLambda(llm))
+    queries = []
+    retrieve = rewriter.as_retriever(_retriever(queries))
+    inputs = {"input": "and that?", "chat_history": _history(2)}
+
+    asyncio.run(retrieve.ainvoke(inputs))
+    # 未命中缓存：原问题投机检索 + 改写后的检索
+    assert "what is the index format" in queries
+
+    queries.clear()
+    assert asyncio.run(retrieve.ainvoke(inputs)) == ["what is the index format"]
+    assert queries == ["what is the index format"]
+    assert len(llm.prompts) == 1
@@ -0,0 +1,52 @@
+import pytest
+from langchain_core.documents import Document
+
+from app.services.bm25_index import BM25Index
+from app.services.retrievers import HybridRetriever, reciprocal_rank_fusion
+from app.services.vector_store import VectorStoreService
+
+
+def _doc(text, source="a.txt"):
+    return Document(page_content=text, metadata={"source": source})
+
+
+def test_rrf_rewards_documents_found_by_both_lists():
+    a, b, c = _doc("a"), _doc("b"), _doc("c")
+
+    fused = reciprocal_rank_fusion([[a, b], [c, b]], k=3)
+
+    assert [doc.page_content for doc in fused] == ["b", "a", "c"]
+
+
+def test_bm25_persists_postings_without_text(tmp_path):
+    path = str(tmp_path / "bm25.json")
+    index = BM25Index(path)
+    index.add(["1", "2"], ["error E1234 in the parser", "the indexer stores vectors"])
+    index.remove(["2"])
+    index.add(["3"], ["retry E1234 after timeout"])
+    index.save()
+
+    with open(path, encoding="utf-8") as f:
+        assert "error E1234 in the parser" not in f.read()
+    reloaded = BM25Index(path)
+    assert len(reloaded) == 2
+    assert [chunk_id for chunk_id, _ in reloaded.search("e1234 parser", 5)] == ["1", "3"]
+    assert reloaded.search("vectors", 5) == []
+
+
+@pytest.mark.usefixtures("vector_backend")
+def test_hybrid_retriever_fuses_keyword_hits(isolated_settings, monkeypatch):
+    monkeypatch.setattr(isolated_settings, "PARENT_RETRIEVAL_ENABLED", False)
+    vs = VectorStoreService()
+    texts = [f"paragraph {i} about ranking answers and documents" for i in range(20)]
+    texts.append("error code XJ-4471 means the license expired")
+    docs = [_doc(text, f"doc{i}.txt") for i, text in enumerate(texts)]
+    vs.add_documents(docs, ids=[f"c{i}" for i in range(len(docs))])
+
+    retriever = HybridRetriever(vector_store=vs, k=5, fetch_k=10)
+    results = retriever.invoke("what does XJ-4471 mean")
+
+    assert results[0].page_content == texts[-1]
+    assert results[0].metadata["source"] == "doc20.txt"
+    assert retriever.retrieve_batch(["what does XJ-4471 mean"])[0][0].page_content == texts[-1]
+    vs.close()
@@ -0,0 +1,74 @@
+import threading
+
+from app.services.chat_service import ChatService
+from app.services.session_store import MemorySessionBackend, SessionStore
+
+
+def test_memory_backend_hands_out_copies():
+    store = SessionStore(MemorySessionBackend())
+    session = store.create()
+
+    session["turns"].append({"role": "user", "content": "not saved"})
+    assert store.get(session["id"])["turns"] == []
+
+    store.append_turn(session["id"], "q", "a")
+    assert len(store.get(session["id"])["turns"]) == 2
+
+
+def test_concurrent_appends_are_not_lost():
+    store = SessionStore(MemorySessionBackend())
+    session_id = store.create()["id"]
+
+    threads = [threading.Thread(target=store.append_turn, args=(session_id, f"q{i}", f"a{i}")) for i in range(20)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert len(store.get(session_id)["turns"]) == 40
+
+
+def test_stale_summary_is_discarded():
+    store = SessionStore(MemorySessionBackend())
+    session_id = store.create()["id"]
+    for i in range(3):
+        store.append_turn(session_id, f"q{i}", f"a{i}")
+
+    assert store.apply_summary(session_id, "", 2, "first summary")
+    # 依据旧摘要生成的结果不能覆盖新摘要
+    assert not store.apply_summary(session_id, "", 4, "stale summary")
+    session = store.get(session_id)
+    assert session["summary"] == "first summary"
+    assert [turn["content"] for turn in session["turns"]] == ["q1", "a1", "q2", "a2"]
+
+
+def test_summary_runs_in_background_and_trims_turns(isolated_settings, monkeypatch, write_file):
+    monkeypatch.setattr(isolated_settings, "SESSION_HISTORY_TOKENS", 40)
+    monkeypatch.setattr(isolated_settings, "ANSWER_CACHE_ENABLED", False)
+    service = ChatService()
+    service.index_files([write_file("notes.txt", "Vectors are stored in a memory mapped matrix.")])
+    session_id = service.sessions.create()["id"]
+
+    release = threading.Event()
+    calls = []
+
+    def slow_summarize(summary, new_lines):
+        calls.append(new_lines)
+        release.wait(5)
+        return f"summary #{len(calls)}"
+
+    monkeypatch.setattr(service.memory, "summarize", slow_summarize)
+    for i in range(4):
+        # 摘要被阻塞时对话仍然正常返回
+        assert service.chat(f"question {i} about how vectors are stored", session_id=session_id)["answer"]
+    assert not release.is_set()
+
+    release.set()
+    service._summary_executor.shutdown(wait=True)
+    session = service.sessions.get(session_id)
+    assert session["summary"].startswith("summary #")
+    assert session["summarized_turns"] == 0
+    # 已摘要的轮次从会话中删除，只保留窗口内的原文
+    assert 0 < len(session["turns"]) < 8
+    assert session["turns"][-1]["role"] == "assistant"
+    service.close()
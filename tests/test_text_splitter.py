@@ -0,0 +1,74 @@
+import random
+import re
+
+import pytest
+from langchain_core.documents import Document
+
+from benchmarks.corpus import make_markdown, make_paragraphs
+from app.services.text_splitter import StructuredTokenSplitter
+
+
+def _texts():
+    rng = random.Random(0)
+    long_line = " ".join(make_paragraphs(rng, 8, 8))
+    return [
+        make_markdown(random.Random(1), sections=4, paragraphs=3),
+        make_markdown(random.Random(2), sections=2, paragraphs=6, cjk_ratio=1.0),
+        # 没有换行的超长段落，只能按句末、分句和空白细分
+        f"Intro line\n\n{long_line}\n\n  trailing paragraph  \n",
+        # 没有任何分割点的超长 token 串，只能按字符等分
+        "x" * 5000,
+    ]
+
+
+@pytest.mark.parametrize("text", _texts())
+def test_spans_are_exact_ordered_and_bounded(text):
+    splitter = StructuredTokenSplitter(chunk_size=120, chunk_overlap=20)
+    spans = splitter.split_spans(text)
+    assert spans
+
+    covered = set()
+    for (start, end, _), next_span in zip(spans, spans[1:] + [None]):
+        chunk = text[start:end]
+        # 偏移与正文一致，且已去掉首尾空白
+        assert chunk and chunk == chunk.strip()
+        assert splitter.length_function(chunk) <= splitter.chunk_size
+        if next_span is not None:
+            assert next_span[0] > start
+            assert next_span[1] > end
+        covered.update(range(start, end))
+
+    # 所有非空白字符都至少出现在一个 chunk 中
+    assert all(i in covered for i, char in enumerate(text) if not char.isspace())
+
+
+def test_chunks_do_not_cross_headings():
+    text = make_markdown(random.Random(3), sections=3, paragraphs=4)
+    splitter = StructuredTokenSplitter(chunk_size=200, chunk_overlap=30)
+    heading_starts = [match.start() for match in re.finditer(r"^#{1,6} ", text, re.MULTILINE)]
+
+    for start, end, section in splitter.split_spans(text):
+        inside = [position for position in heading_starts if start < position < end]
+        assert inside == []
+        # 章节为 chunk 之前最近的标题路径中的最后一级
+        previous = max(position for position in heading_starts if position <= start)
+        title = text[previous:text.index("\n", previous)].lstrip("#").strip()
+        assert section.split(" > ")[-1] == title
+
+
+def test_document_offsets_are_per_page_and_sections_carry_over():
+    pages = [
+        Document(page_content="# Setup\n\nInstall the package first.\n\nThen configure it.", metadata={"source": "a.pdf", "page": 0}),
+        Document(page_content="Continued instructions on the next page.", metadata={"source": "a.pdf", "page": 1}),
+        Document(page_content="Another file without headings.", metadata={"source": "b.pdf", "page": 0}),
+    ]
+    chunks = StructuredTokenSplitter(chunk_size=8, chunk_overlap=2).split_documents(pages)
+
+    for chunk in chunks:
+        page = next(doc for doc in pages if doc.metadata == {key: chunk.metadata[key] for key in ("source", "page")})
+        assert page.page_content[chunk.metadata["start_index"]:chunk.metadata["end_index"]] == chunk.page_content
+
+    second_page = [chunk for chunk in chunks if chunk.metadata["source"] == "a.pdf" and chunk.metadata["page"] == 1]
+    assert second_page and all(chunk.metadata["section"] == "Setup" for chunk in second_page)
+    other_file = [chunk for chunk in chunks if chunk.metadata["source"] == "b.pdf"]
+    assert other_file and all("section" not in chunk.metadata for chunk in other_file)
@@ -0,0 +1,157 @@
+import threading
+
+import pytest
+from langchain_core.documents import Document
+
+from app.services.vector_store import VectorStoreService
+
+pytestmark = pytest.mark.usefixtures("vector_backend")
+
+
+def _chunks(source, texts):
+    docs, start = [], 0
+    for text in texts:
+        docs.append(Document(page_content=text, metadata={
+            "source": source, "start_index": start, "end_index": start + len(text)
+        }))
+        start += len(text) + 2
+    return docs
+
+
+def _stored_metadata(vector_store):
+    """索引中每段正文对应的元数据 (子 chunk 换成所属父段落)"""
+    _, texts, metadatas = vector_store.backend.get_all()
+    docs = vector_store.resolve_parents([Document(page_content=t, metadata=m) for t, m in zip(texts, metadatas)])
+    return {doc.page_content: doc.metadata for doc in docs}
+
+
+def test_sync_file_is_incremental(isolated_settings):
+    vs = VectorStoreService()
+    source = "notes.txt"
+    texts = ["alpha paragraph about indexes", "beta paragraph about ranking", "gamma paragraph about answers"]
+
+    assert vs.sync_file(source, "h1", _chunks(source, texts)) == (3, 0)
+    assert vs.sync_file(source, "h1", _chunks(source, texts)) == (0, 0)
+
+    # 追加内容时前面的 chunk 位置不变，只写入新增部分
+    assert vs.sync_file(source, "h2", _chunks(source, texts + ["delta paragraph"])) == (1, 0)
+    assert vs.backend.count() == 4
+    vs.close()
+
+
+def test_shifted_chunks_get_fresh_metadata(isolated_settings):
+    vs = VectorStoreService()
+    source = "notes.txt"
+    texts = ["alpha paragraph about indexes", "beta paragraph about ranking"]
+    vs.sync_file(source, "h1", _chunks(source, texts))
+    misses = vs.embedding_cache.misses
+
+    # 在开头插入一段，后面 chunk 的偏移全部变化
+    new_docs = _chunks(source, ["inserted heading"] + texts)
+    added, removed = vs.sync_file(source, "h2", new_docs)
+
+    assert (added, removed) == (3, 2)
+    assert vs.backend.count() == 3
+    stored = _stored_metadata(vs)
+    for doc in new_docs:
+        assert stored[doc.page_content]["start_index"] == doc.metadata["start_index"]
+        assert stored[doc.page_content]["end_index"] == doc.metadata["end_index"]
+    # 只有新插入的段落需要调用 Embedding 接口
+    assert vs.embedding_cache.misses - misses == 1
+    vs.close()
+
+
+def test_remove_file_deletes_all_chunks(isolated_settings):
+    vs = VectorStoreService()
+    vs.sync_file("a.txt", "h", _chunks("a.txt", ["one", "two"]))
+    vs.sync_file("b.txt", "h", _chunks("b.txt", ["three"]))
+
+    assert vs.remove_file("a.txt") == 2
+    assert vs.backend.count() == 1
+    assert vs.manifest.sources() == ["b.txt"]
+    vs.close()
+
+
+def test_concurrent_sync_of_same_file_is_serialized(isolated_settings):
+    """上传任务与目录监听同时同步同一文件：按文件串行，后一方发现内容已写入直接返回"""
+    vs = VectorStoreService()
+    source = "notes.txt"
+    docs = _chunks(source, [f"paragraph {i} about concurrent ingestion" for i in range(20)])
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(vs.sync_file(source, "h1", docs))) for _ in range(2)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert sorted(results) == [(0, 0), (20, 0)]
+    assert vs.backend.count() == 20
+    assert len(vs.manifest.get(source)["chunk_ids"]) == 20
+    vs.close()
+
+
+def test_parent_retrieval_returns_deduplicated_parents(isolated_settings, monkeypatch):
+    monkeypatch.setattr(isolated_settings, "PARENT_RETRIEVAL_ENABLED", True)
+    monkeypatch.setattr(isolated_settings, "CHILD_CHUNK_SIZE", 60)
+    monkeypatch.setattr(isolated_settings, "CHILD_CHUNK_OVERLAP", 10)
+    vs = VectorStoreService()
+    source = "notes.txt"
+    parents = [
+        " ".join(f"alpha sentence {i} about vector indexes." for i in range(6)),
+        " ".join(f"beta sentence {i} about answer caching." for i in range(6))
+    ]
+    vs.sync_file(source, "h1", _chunks(source, parents))
+
+    # 向量库只保存子 chunk 的向量与定位信息，正文在父段落库中
+    _, texts, metadatas = vs.backend.get_all()
+    assert len(texts) > len(parents)
+    assert set(texts) == {""}
+    assert all(metadata["parent_id"] for metadata in metadatas)
+    assert vs.chunk_store.count() == 2
+
+    results = vs.similarity_search("alpha sentence about vector indexes", k=len(texts))
+    assert sorted(doc.page_content for doc in results) == sorted(parents)
+    assert results[0].metadata["source"] == source
+
+    vs.remove_file(source)
+    assert vs.backend.count() == 0
+    assert vs.chunk_store.count() == 0
+    vs.close()
+
+
+def test_embedding_runs_outside_write_lock(isolated_settings):
+    """向量化较慢时，落盘、快照导出与删除其他文件不必等待整个文件入库"""
+    vs = VectorStoreService()
+    vs.sync_file("other.txt", "h0", _chunks("other.txt", ["other paragraph"]))
+    embeddings = vs.embedding_pipeline.embeddings
+    started, release = threading.Event(), threading.Event()
+
+    class _SlowEmbeddings:
+        def embed_documents(self, texts):
+            started.set()
+            release.wait(10)
+            return embeddings.embed_documents(texts)
+
+    vs.embedding_pipeline.embeddings = _SlowEmbeddings()
+    # 两个文件不能落在同一个来源锁分段上
+    assert vs._source_lock("notes.txt") is not vs._source_lock("other.txt")
+    writer = threading.Thread(target=vs.sync_file, args=("notes.txt", "h1", _chunks("notes.txt", ["slow paragraph"])))
+    writer.start()
+    try:
+        assert started.wait(10)
+        finished = threading.Event()
+
+        def other_writes():
+            vs.flush()
+            vs.remove_file("other.txt")
+            vs.export_snapshot(str(isolated_settings.VECTOR_DB_DIR) + "/snapshot.tar.gz")
+            finished.set()
+
+        threading.Thread(target=other_writes, daemon=True).start()
+        assert finished.wait(5)
+    finally:
+        release.set()
+        writer.join()
+    assert vs.manifest.get("notes.txt")["file_hash"] == "h1"
+    assert vs.manifest.get("other.txt") is None
+    vs.close()
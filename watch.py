@@ -0,0 +1,36 @@
+"""目录监听命令行入口
+
+用法:
+    python watch.py ./docs ./shared --notebook default
+
+监听目录中文件的新增、修改与删除，增量更新对应笔记本的索引。
+不传目录时使用 config.yaml 中 watch.directories 的配置。
+注意不要与同样启用了 watch 的 API 服务同时写入同一个笔记本。
+"""
+import argparse
+import time
+
+from app.core.config import settings
+from app.services.directory_watcher import DirectoryWatcher
+from app.services.notebook_service import NotebookManager
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("directories", nargs="*", default=settings.WATCH_DIRECTORIES)
+    parser.add_argument("--notebook", default=settings.WATCH_NOTEBOOK_ID)
+    parser.add_argument("--debounce", type=float, default=settings.WATCH_DEBOUNCE_SECONDS)
+    args = parser.parse_args()
+    if not args.directories:
+        parser.error("no directories given and watch.directories is empty")
+
+    notebooks = NotebookManager()
+    watcher = DirectoryWatcher(notebooks, args.directories, notebook_id=args.notebook, debounce_seconds=args.debounce)
+    watcher.start()
+    try:
+        while True:
+            time.sleep(1)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        watcher.stop()
+        notebooks.close()